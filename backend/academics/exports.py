@@ -0,0 +1,53 @@
+"""
+Row-by-row exports of performance reports (see campus_ecosystem.exports)
+"""
+from campus_ecosystem.exports import chunk_size, csv_response, write_export
+from .models import SubjectGrade
+
+
+HEADER = [
+    'Roll number', 'Student', 'Subject code', 'Subject', 'Total marks', 'Percentage', 'Grade',
+    'Grade points', 'Result',
+]
+
+
+def performance_report_rows(report):
+    """
+    Subject grades of the report's term, narrowed to whichever of its
+    student, group and subject are set, read in chunks
+    """
+    grades = SubjectGrade.objects.filter(academic_year=report.academic_year, semester=report.semester)
+    if report.student_id:
+        grades = grades.filter(student_id=report.student_id)
+    if report.student_group_id:
+        grades = grades.filter(student__groups=report.student_group_id)
+    if report.subject_id:
+        grades = grades.filter(subject_id=report.subject_id)
+    grades = grades.order_by('student__roll_number', 'subject__code').values_list(
+        'student__roll_number', 'student__user__first_name', 'student__user__last_name',
+        'subject__code', 'subject__name', 'total_marks', 'percentage', 'grade__grade', 'grade_points', 'is_pass',
+    )
+    for (roll_number, first_name, last_name, code, subject, total_marks, percentage, grade, grade_points,
+         is_pass) in grades.iterator(chunk_size=chunk_size()):
+        yield (
+            roll_number, f'{first_name} {last_name}'.strip(), code, subject,
+            total_marks, percentage, grade, grade_points, 'Pass' if is_pass else 'Fail',
+        )
+
+
+def export_performance_report(report, export_format='csv'):
+    """
+    Write the report to a file under MEDIA_ROOT and record its path
+    """
+    report.file_path = write_export(
+        'performance', f'performance-report-{report.pk}', export_format, HEADER, performance_report_rows(report)
+    )
+    report.save(update_fields=['file_path'])
+    return report.file_path
+
+
+def performance_report_response(report):
+    """
+    The report as a CSV streamed straight to the client
+    """
+    return csv_response(f'performance-report-{report.pk}.csv', HEADER, performance_report_rows(report))
@@ -0,0 +1,85 @@
+"""
+Batch grading of exam results.
+
+The Grade bands are loaded once into a GradeScale: their lower bounds sorted
+in one list and the bands in the same order in another, so the band of a
+percentage is a bisect away. grade_exams() reads the results of any number
+of exams in one query, works out percentage and grade for each in Python and
+writes back the rows that changed with a single bulk_update, instead of a
+save() per result.
+"""
+from bisect import bisect_right
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ExamResult, Grade
+from .statistics import results_changed
+
+
+Band = namedtuple('Band', ['grade', 'min_percentage', 'max_percentage', 'grade_points', 'is_pass'])
+
+HUNDREDTH = Decimal('0.01')
+
+
+class GradeScale:
+    """
+    The Grade bands sorted by min_percentage
+    """
+
+    def __init__(self, bands):
+        self.bands = sorted(bands, key=lambda band: band.min_percentage)
+        self.bounds = [band.min_percentage for band in self.bands]
+
+    @classmethod
+    def load(cls):
+        return cls(Band(*values) for values in Grade.objects.values_list(
+            'grade', 'min_percentage', 'max_percentage', 'grade_points', 'is_pass'
+        ))
+
+    def band(self, percentage):
+        """
+        The band holding a percentage, None if it falls outside every band
+        """
+        index = bisect_right(self.bounds, percentage) - 1
+        if index < 0 or percentage > self.bands[index].max_percentage:
+            return None
+        return self.bands[index]
+
+    def grade(self, percentage):
+        band = self.band(percentage)
+        return band.grade if band else ''
+
+
+def percentage(marks_obtained, total_marks):
+    if not total_marks:
+        return Decimal('0.00')
+    return (Decimal(marks_obtained) * 100 / total_marks).quantize(HUNDREDTH, rounding=ROUND_HALF_UP)
+
+
+@transaction.atomic
+def grade_exams(exam_ids, scale=None):
+    """
+    Recompute percentage and grade of every result of the given exams.
+    Returns the number of results updated.
+    """
+    scale = scale or GradeScale.load()
+    now = timezone.now()
+    changed = []
+    for result in ExamResult.objects.filter(exam_id__in=exam_ids).select_related('exam').only(
+        'id', 'marks_obtained', 'percentage', 'grade', 'exam__total_marks'
+    ):
+        result_percentage = percentage(result.marks_obtained, result.exam.total_marks)
+        grade = scale.grade(result_percentage)
+        if result.percentage != result_percentage or result.grade != grade:
+            result.percentage, result.grade, result.updated_at = result_percentage, grade, now
+            changed.append(result)
+    ExamResult.objects.bulk_update(
+        changed, ['percentage', 'grade', 'updated_at'],
+        batch_size=getattr(settings, 'GRADING_BATCH_SIZE', 1000),
+    )
+    results_changed({result.exam_id for result in changed})
+    return len(changed)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import Department
+from academics.performance import compute_semester
+
+
+class Command(BaseCommand):
+    help = 'Compute SGPA, CGPA and class ranks for a semester'
+
+    def add_arguments(self, parser):
+        parser.add_argument('academic_year', help='Academic year, e.g. 2024-25')
+        parser.add_argument('semester', type=int, help='Semester number')
+        parser.add_argument('--department', help='Department code; defaults to every department')
+
+    def handle(self, *args, **options):
+        department = None
+        if options['department']:
+            department = Department.objects.filter(code=options['department']).first()
+            if department is None:
+                raise CommandError(f"Department {options['department']} does not exist")
+        result = compute_semester(options['academic_year'], options['semester'], department)
+        self.stdout.write(self.style.SUCCESS(
+            f'Computed performance of {result.students} students in {result.classes} classes'
+        ))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from academics.grading import grade_exams
+from academics.models import Exam
+
+
+class Command(BaseCommand):
+    help = 'Recompute percentage and grade of the results of one or more exams'
+
+    def add_arguments(self, parser):
+        parser.add_argument('exam_ids', nargs='*', type=int, help='Exam ids')
+        parser.add_argument('--all', action='store_true', help='Grade every active exam')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            exam_ids = list(Exam.objects.filter(is_active=True).values_list('id', flat=True))
+        elif options['exam_ids']:
+            exam_ids = options['exam_ids']
+            missing = set(exam_ids) - set(Exam.objects.filter(id__in=exam_ids).values_list('id', flat=True))
+            if missing:
+                raise CommandError(f"Exams {', '.join(map(str, sorted(missing)))} do not exist")
+        else:
+            raise CommandError('Give exam ids or --all')
+        updated = grade_exams(exam_ids)
+        self.stdout.write(self.style.SUCCESS(f'{updated} results graded across {len(exam_ids)} exams'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from academics.publishing import send_queued
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued result publication notifications'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exam', type=int, help='Only the notifications of this exam id')
+
+    def handle(self, *args, **options):
+        sent, failed = send_queued(options['exam'])
+        self.stdout.write(self.style.SUCCESS(f'{sent} notifications sent, {failed} failed'))
@@ -0,0 +1,125 @@
+"""
+Bulk marks upload for an exam from a CSV sheet.
+
+The sheet is read row by row as it is decoded - it needs roll_number and
+marks_obtained columns and may have remarks - and every roll number is
+resolved against one dictionary of the exam group's roster loaded up front.
+Each row is checked against the exam's total_marks and graded with the
+GradeScale of academics.grading; valid rows are upserted into ExamResult
+in MARKS_UPLOAD_CHUNK_SIZE bulk_create chunks, and invalid ones are reported
+by row number without holding back the rest. The number of queries does not
+depend on the length of the sheet beyond one insert per chunk.
+"""
+import codecs
+import csv
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .grading import GradeScale, percentage
+from .models import ExamResult
+from .statistics import results_changed
+
+
+REQUIRED_COLUMNS = ('roll_number', 'marks_obtained')
+
+MarksImportResult = namedtuple('MarksImportResult', ['imported', 'errors'])
+
+
+class MarksImportError(Exception):
+    """
+    A sheet that cannot be read at all
+    """
+
+
+def chunk_size():
+    return getattr(settings, 'MARKS_UPLOAD_CHUNK_SIZE', 500)
+
+
+def _rows(upload):
+    """
+    Dict rows of an uploaded CSV file, decoded as they are read
+    """
+    lines = codecs.iterdecode(upload, 'utf-8-sig')
+    reader = csv.DictReader(lines)
+    try:
+        columns = [name.strip().lower() for name in reader.fieldnames or []]
+    except UnicodeDecodeError:
+        raise MarksImportError('The file is not UTF-8 encoded CSV.')
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise MarksImportError(f"Missing columns: {', '.join(missing)}.")
+    reader.fieldnames = columns
+    yield from reader
+
+
+def _write(results):
+    ExamResult.objects.bulk_create(
+        results,
+        update_conflicts=True,
+        unique_fields=['student', 'exam'],
+        update_fields=['marks_obtained', 'percentage', 'grade', 'remarks', 'updated_at'],
+    )
+
+
+@transaction.atomic
+def import_marks(exam, upload):
+    """
+    Upsert the ExamResults of an exam from an uploaded CSV file. Returns the
+    number of rows imported and a list of {'row', 'roll_number', 'errors'}
+    for the rows that were not. Raises MarksImportError.
+    """
+    roster = dict(exam.student_group.students.values_list('roll_number', 'id'))
+    published = set(ExamResult.objects.filter(exam=exam, is_published=True).values_list('student_id', flat=True))
+    scale = GradeScale.load()
+    now = timezone.now()
+    seen, pending, errors, imported = set(), [], [], 0
+    try:
+        for number, row in enumerate(_rows(upload), start=2):
+            roll_number = (row.get('roll_number') or '').strip()
+            row_errors = []
+            student_id = roster.get(roll_number)
+            if student_id is None:
+                row_errors.append('Unknown roll number for this exam group.')
+            elif student_id in seen:
+                row_errors.append('Roll number appears more than once in the sheet.')
+            elif student_id in published:
+                row_errors.append('The result is already published.')
+            try:
+                marks = Decimal((row.get('marks_obtained') or '').strip())
+                if not marks.is_finite() or marks != marks.quantize(Decimal('0.01')):
+                    raise InvalidOperation
+            except InvalidOperation:
+                row_errors.append('marks_obtained must be a number with at most two decimal places.')
+            else:
+                if not 0 <= marks <= exam.total_marks:
+                    row_errors.append(f'marks_obtained must be between 0 and {exam.total_marks}.')
+            if row_errors:
+                errors.append({'row': number, 'roll_number': roll_number, 'errors': row_errors})
+                continue
+            seen.add(student_id)
+            result_percentage = percentage(marks, exam.total_marks)
+            pending.append(ExamResult(
+                student_id=student_id,
+                exam=exam,
+                marks_obtained=marks,
+                percentage=result_percentage,
+                grade=scale.grade(result_percentage),
+                remarks=(row.get('remarks') or '').strip(),
+                updated_at=now,
+            ))
+            if len(pending) >= chunk_size():
+                _write(pending)
+                imported += len(pending)
+                pending = []
+    except (UnicodeDecodeError, csv.Error) as exc:
+        raise MarksImportError(f'The file could not be read: {exc}')
+    if pending:
+        _write(pending)
+        imported += len(pending)
+    if imported:
+        results_changed([exam.pk])
+    return MarksImportResult(imported, errors)
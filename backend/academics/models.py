@@ -1,7 +1,7 @@
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 from scheduling.models import Subject, StudentGroup
-from accounts.models import StudentProfile, FacultyProfile
+from accounts.models import User, StudentProfile, FacultyProfile
 
 
 class Exam(models.Model):
@@ -123,8 +123,10 @@ class AcademicPerformance(models.Model):
     total_credits = models.PositiveIntegerField(default=0)
     earned_credits = models.PositiveIntegerField(default=0)
     total_grade_points = models.DecimalField(max_digits=6, decimal_places=2, default=0.00)
-    cgpa = models.DecimalField(max_digits=3, decimal_places=2, default=0.00)
-    sgpa = models.DecimalField(max_digits=3, decimal_places=2, default=0.00)
+    cumulative_credits = models.PositiveIntegerField(default=0)
+    cumulative_grade_points = models.DecimalField(max_digits=7, decimal_places=2, default=0.00)
+    cgpa = models.DecimalField(max_digits=4, decimal_places=2, default=0.00)
+    sgpa = models.DecimalField(max_digits=4, decimal_places=2, default=0.00)
     rank_in_class = models.PositiveIntegerField(null=True, blank=True)
     total_students = models.PositiveIntegerField(default=0)
     calculated_at = models.DateTimeField(auto_now_add=True)
@@ -268,3 +270,42 @@ class AcademicGoal(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+
+
+class ResultNotification(models.Model):
+    """
+    Outbox of result publication notices to students and their parents,
+    delivered by a background worker (see academics.publishing)
+    """
+    RECIPIENT_TYPE_CHOICES = [
+        ('student', 'Student'),
+        ('parent', 'Parent'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    exam = models.ForeignKey(Exam, on_delete=models.CASCADE, related_name='notifications')
+    student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE, related_name='result_notifications')
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='result_notifications')
+    recipient_type = models.CharField(max_length=10, choices=RECIPIENT_TYPE_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    claim_token = models.CharField(max_length=32, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.exam.name} - {self.recipient} ({self.status})"
+    
+    class Meta:
+        unique_together = ['exam', 'student', 'recipient']
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
@@ -0,0 +1,131 @@
+"""
+End-of-semester SGPA, CGPA and class ranks.
+
+compute_semester() fills AcademicPerformance for an (academic_year,
+semester) from SubjectGrade in one aggregated query: per student the credits
+attempted and earned and the credit-weighted grade points (Subject.credits x
+SubjectGrade.grade_points), with the cumulative credits and grade points of
+the student's previous AcademicPerformance row joined in as subqueries. CGPA
+is rolled forward from that row instead of re-summing the whole history, so
+semesters have to be computed in order; recomputing an earlier semester
+means recomputing the ones after it.
+
+Students are ranked by SGPA within their class (department and year of
+admission), tied students sharing a rank, and every row is written with one
+bulk upsert.
+"""
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import AcademicPerformance, SubjectGrade
+
+
+HUNDREDTH = Decimal('0.01')
+
+PerformanceResult = namedtuple('PerformanceResult', ['students', 'classes'])
+
+
+def _average(points, credits):
+    if not credits:
+        return Decimal('0.00')
+    return (Decimal(points) / credits).quantize(HUNDREDTH, rounding=ROUND_HALF_UP)
+
+
+def previous_rows(academic_year, semester):
+    """
+    AcademicPerformance rows before (academic_year, semester), latest first
+    """
+    return AcademicPerformance.objects.filter(
+        Q(academic_year__lt=academic_year) | Q(academic_year=academic_year, semester__lt=semester)
+    ).order_by('-academic_year', '-semester')
+
+
+def semester_totals(academic_year, semester, department=None):
+    """
+    One row per student graded in the semester: (student_id, department_id,
+    year_of_admission, credits, earned_credits, grade_points,
+    previous_credits, previous_grade_points)
+    """
+    grades = SubjectGrade.objects.filter(academic_year=academic_year, semester=semester)
+    if department is not None:
+        grades = grades.filter(student__department=department)
+    previous = previous_rows(academic_year, semester).filter(student_id=OuterRef('student_id'))
+    decimal = DecimalField(max_digits=9, decimal_places=2)
+    return grades.values('student_id').annotate(
+        credits=Sum('subject__credits'),
+        earned_credits=Coalesce(Sum('subject__credits', filter=Q(is_pass=True)), 0),
+        grade_points=Sum(F('subject__credits') * F('grade_points'), output_field=decimal),
+        previous_credits=Coalesce(Subquery(previous.values('cumulative_credits')[:1]), 0),
+        previous_grade_points=Coalesce(
+            Subquery(previous.values('cumulative_grade_points')[:1]), Value(Decimal('0')), output_field=decimal
+        ),
+    ).values_list(
+        'student_id', 'student__department_id', 'student__year_of_admission', 'credits', 'earned_credits',
+        'grade_points', 'previous_credits', 'previous_grade_points',
+    ).order_by()
+
+
+def rank(keys, scores):
+    """
+    Competition ranks (1, 2, 2, 4) by descending score among the entries
+    sharing a key; returns a list of (rank, entries with that key)
+    """
+    ranks = [None] * len(keys)
+    order = sorted(range(len(keys)), key=lambda index: (keys[index], -scores[index]))
+    for _, members in groupby(order, key=lambda index: keys[index]):
+        members = list(members)
+        position, previous = 0, None
+        for place, index in enumerate(members, start=1):
+            if scores[index] != previous:
+                position, previous = place, scores[index]
+            ranks[index] = (position, len(members))
+    return ranks
+
+
+@transaction.atomic
+def compute_semester(academic_year, semester, department=None):
+    """
+    Compute and upsert AcademicPerformance for every student graded in a
+    semester, optionally of one department. Returns the number of students
+    and classes ranked.
+    """
+    rows, cohorts = [], []
+    for (student_id, department_id, year_of_admission, credits, earned_credits, grade_points,
+         previous_credits, previous_grade_points) in semester_totals(academic_year, semester, department):
+        grade_points = Decimal(grade_points).quantize(HUNDREDTH)
+        cumulative_credits = previous_credits + credits
+        cumulative_grade_points = Decimal(previous_grade_points).quantize(HUNDREDTH) + grade_points
+        rows.append(AcademicPerformance(
+            student_id=student_id,
+            academic_year=academic_year,
+            semester=semester,
+            total_credits=credits,
+            earned_credits=earned_credits,
+            total_grade_points=grade_points,
+            cumulative_credits=cumulative_credits,
+            cumulative_grade_points=cumulative_grade_points,
+            sgpa=_average(grade_points, credits),
+            cgpa=_average(cumulative_grade_points, cumulative_credits),
+        ))
+        cohorts.append((department_id, year_of_admission))
+
+    for row, (position, size) in zip(rows, rank(cohorts, [row.sgpa for row in rows])):
+        row.rank_in_class, row.total_students = position, size
+
+    AcademicPerformance.objects.bulk_create(
+        rows,
+        batch_size=getattr(settings, 'ACADEMIC_PERFORMANCE_BATCH_SIZE', 1000),
+        update_conflicts=True,
+        unique_fields=['student', 'academic_year', 'semester'],
+        update_fields=[
+            'total_credits', 'earned_credits', 'total_grade_points', 'cumulative_credits',
+            'cumulative_grade_points', 'sgpa', 'cgpa', 'rank_in_class', 'total_students', 'calculated_at',
+        ],
+    )
+    return PerformanceResult(len(rows), len(set(cohorts)))
@@ -0,0 +1,184 @@
+"""
+Exam result publication.
+
+publish_results() marks every unpublished result of an exam as published
+with one UPDATE, stamping them all with the same published_at, and queues
+the notifications in the same transaction with two INSERT ... SELECT
+statements (result -> student user, and ParentStudentRelationship -> parent
+user), so a result is never published without its notifications. Delivery
+is left to a worker thread started on commit, which sends the queue batch
+by batch over one mail connection per batch.
+
+Each batch of RESULT_NOTIFICATION_BATCH_SIZE rows is claimed before it is
+sent by moving it from queued to sending under a random token, and only the
+rows carrying the sender's own token are mailed, so concurrent senders never
+pick the same rows even where the database ignores row locks. The queue outlives the thread: send_queued() (and the
+send_result_notifications command) picks up whatever is still queued, for
+instance after a restart, and requeues claims older than
+RESULT_NOTIFICATION_CLAIM_TIMEOUT seconds left behind by a sender that died;
+the timeout must stay well above the time one batch takes to send.
+"""
+import logging
+import secrets
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts.models import ParentProfile, ParentStudentRelationship, StudentProfile
+from .models import ExamResult, ResultNotification
+from .statistics import results_changed
+
+
+logger = logging.getLogger(__name__)
+
+
+def batch_size():
+    return getattr(settings, 'RESULT_NOTIFICATION_BATCH_SIZE', 1000)
+
+
+def publish_results(exam, published_by):
+    """
+    Publish every unpublished result of an exam, queue the notifications and
+    send them in the background. Returns the number of results published.
+    """
+    published_at = timezone.now()
+    with transaction.atomic():
+        published = ExamResult.objects.filter(exam=exam, is_published=False).update(
+            is_published=True, published_at=published_at, published_by=published_by, updated_at=published_at
+        )
+        if published:
+            queue_notifications(exam.pk, published_at)
+            results_changed([exam.pk])
+            transaction.on_commit(lambda: threading.Thread(
+                target=_run_in_thread, args=(exam.pk,), daemon=True, name='result-notifications'
+            ).start())
+    return published
+
+
+QUEUE_STUDENTS = """
+    INSERT INTO {notification} (exam_id, student_id, recipient_id, recipient_type, status, error, claim_token, created_at)
+    SELECT result.exam_id, result.student_id, student.user_id, 'student', 'queued', '', '', %s
+    FROM {result} result
+    JOIN {student} student ON student.id = result.student_id
+    WHERE result.exam_id = %s AND result.published_at = %s AND NOT EXISTS (
+        SELECT 1 FROM {notification} queued
+        WHERE queued.exam_id = result.exam_id AND queued.student_id = result.student_id
+        AND queued.recipient_id = student.user_id
+    )
+"""
+
+QUEUE_PARENTS = """
+    INSERT INTO {notification} (exam_id, student_id, recipient_id, recipient_type, status, error, claim_token, created_at)
+    SELECT result.exam_id, result.student_id, parent.user_id, 'parent', 'queued', '', '', %s
+    FROM {result} result
+    JOIN {relationship} relationship ON relationship.student_id = result.student_id
+    JOIN {parent} parent ON parent.id = relationship.parent_id
+    WHERE result.exam_id = %s AND result.published_at = %s AND NOT EXISTS (
+        SELECT 1 FROM {notification} queued
+        WHERE queued.exam_id = result.exam_id AND queued.student_id = result.student_id
+        AND queued.recipient_id = parent.user_id
+    )
+"""
+
+
+def queue_notifications(exam_id, published_at):
+    """
+    Queue a notification for each student whose result was published at
+    published_at and for each of their parents. Returns the number queued.
+    """
+    tables = {
+        'notification': ResultNotification._meta.db_table,
+        'result': ExamResult._meta.db_table,
+        'student': StudentProfile._meta.db_table,
+        'relationship': ParentStudentRelationship._meta.db_table,
+        'parent': ParentProfile._meta.db_table,
+    }
+    params = [
+        connection.ops.adapt_datetimefield_value(timezone.now()),
+        exam_id,
+        connection.ops.adapt_datetimefield_value(published_at),
+    ]
+    queued = 0
+    with connection.cursor() as cursor:
+        for sql in (QUEUE_STUDENTS, QUEUE_PARENTS):
+            cursor.execute(sql.format(**tables), params)
+            queued += cursor.rowcount
+    return queued
+
+
+def _message(exam_name, subject_name, student_name, recipient_type, email):
+    if recipient_type == 'student':
+        body = f'Your result for {exam_name} ({subject_name}) has been published.'
+    else:
+        body = f'The result of {student_name} for {exam_name} ({subject_name}) has been published.'
+    return EmailMessage(f'Result published: {exam_name}', body, to=[email])
+
+
+def _claim(queue):
+    """
+    Move the oldest batch of queued notifications to sending under a new
+    token with one UPDATE. Returns the token, or None once the queue is
+    empty.
+    """
+    while True:
+        token = secrets.token_hex(16)
+        if ResultNotification.objects.filter(
+            id__in=queue.order_by('created_at', 'id').values('id')[:batch_size()], status='queued'
+        ).update(status='sending', claim_token=token, claimed_at=timezone.now()):
+            return token
+        # Another sender may have claimed the same rows first
+        if not queue.exists():
+            return None
+
+
+def send_queued(exam_id=None):
+    """
+    Deliver queued notifications, oldest first, one claimed batch per mail
+    connection. Returns the numbers of notifications sent and failed.
+    """
+    claimed = ResultNotification.objects.filter(status='sending')
+    queue = ResultNotification.objects.filter(status='queued')
+    if exam_id is not None:
+        claimed = claimed.filter(exam_id=exam_id)
+        queue = queue.filter(exam_id=exam_id)
+    timeout = timedelta(seconds=getattr(settings, 'RESULT_NOTIFICATION_CLAIM_TIMEOUT', 3600))
+    claimed.filter(claimed_at__lt=timezone.now() - timeout).update(status='queued', claim_token='', claimed_at=None)
+    sent = failed = 0
+    while True:
+        token = _claim(queue)
+        if token is None:
+            return sent, failed
+        mine = ResultNotification.objects.filter(status='sending', claim_token=token)
+        batch = list(mine.values_list(
+            'id', 'exam__name', 'exam__subject__name', 'student__user__first_name', 'student__user__last_name',
+            'student__user__username', 'recipient_type', 'recipient__email',
+        ))
+        without_email = [row[0] for row in batch if not row[7]]
+        deliverable = [row for row in batch if row[7]]
+        mine.filter(id__in=without_email).update(status='failed', error='Recipient has no email address.')
+        failed += len(without_email)
+        try:
+            get_connection(fail_silently=False).send_messages([
+                _message(exam_name, subject_name, f'{first_name} {last_name}'.strip() or username, recipient_type, email)
+                for _, exam_name, subject_name, first_name, last_name, username, recipient_type, email in deliverable
+            ])
+        except Exception as exc:
+            logger.exception('Sending %s result notifications failed', len(deliverable))
+            mine.filter(id__in=[row[0] for row in deliverable]).update(status='failed', error=str(exc))
+            failed += len(deliverable)
+            continue
+        mine.filter(id__in=[row[0] for row in deliverable]).update(status='sent', sent_at=timezone.now())
+        sent += len(deliverable)
+
+
+def _run_in_thread(exam_id):
+    try:
+        send_queued(exam_id)
+    except Exception:
+        logger.exception('Notifying the results of exam %s failed', exam_id)
+    finally:
+        connection.close()
@@ -0,0 +1,26 @@
+from django.conf import settings
+from rest_framework import serializers
+
+from scheduling.models import StudentGroup, Subject
+from .models import Exam
+
+
+class MarksUploadSerializer(serializers.Serializer):
+    file = serializers.FileField()
+
+    def validate_file(self, value):
+        limit = getattr(settings, 'MARKS_UPLOAD_MAX_BYTES', 5 * 1024 * 1024)
+        if value.size > limit:
+            raise serializers.ValidationError(f'The file is larger than {limit} bytes.')
+        return value
+
+
+class ExamComparisonQuerySerializer(serializers.Serializer):
+    subject = serializers.PrimaryKeyRelatedField(queryset=Subject.objects.all(), required=False)
+    student_group = serializers.PrimaryKeyRelatedField(queryset=StudentGroup.objects.all(), required=False)
+    exam_type = serializers.ChoiceField(choices=Exam.EXAM_TYPE_CHOICES, required=False)
+
+    def validate(self, attrs):
+        if 'subject' not in attrs and 'student_group' not in attrs:
+            raise serializers.ValidationError('Give a subject, a student_group or both.')
+        return attrs
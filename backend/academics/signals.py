@@ -0,0 +1,36 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from scheduling import occurrences
+from . import statistics
+from .models import AcademicCalendar, Exam, ExamResult
+
+
+@receiver(pre_save, sender=AcademicCalendar)
+def calendar_event_saving(sender, instance, **kwargs):
+    instance._previous_range = None
+    if instance.pk is not None:
+        instance._previous_range = AcademicCalendar.objects.filter(pk=instance.pk).values_list(
+            'start_date', 'end_date'
+        ).first()
+
+
+@receiver(post_save, sender=AcademicCalendar)
+def calendar_event_saved(sender, instance, **kwargs):
+    start, end = instance.start_date, instance.end_date
+    previous = getattr(instance, '_previous_range', None)
+    if previous is not None:
+        start, end = min(start, previous[0]), max(end, previous[1])
+    occurrences.calendar_changed(start, end)
+
+
+@receiver(post_delete, sender=AcademicCalendar)
+def calendar_event_deleted(sender, instance, **kwargs):
+    occurrences.calendar_changed(instance.start_date, instance.end_date)
+
+
+@receiver(post_save, sender=Exam)
+@receiver(post_save, sender=ExamResult)
+@receiver(post_delete, sender=ExamResult)
+def exam_results_changed(sender, instance, **kwargs):
+    statistics.results_changed([instance.pk if sender is Exam else instance.exam_id])
@@ -0,0 +1,109 @@
+"""
+Exam statistics computed with NumPy.
+
+The marks of an exam are read in one values_list query into an array and
+reduced in vectorized form: count, mean, median, standard deviation,
+minimum and maximum, pass rate against passing_marks, the
+EXAM_STATISTICS_PERCENTILES and a histogram of EXAM_STATISTICS_BINS equal
+bins over [0, total_marks]. Students and parents get the published_only
+variant, built from the published results alone. Both are cached under the
+exam's results version, which every write to its results bumps through
+results_changed() once the transaction commits, so result pages read the
+cache instead of re-aggregating on every request.
+"""
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from campus_ecosystem.cache_versions import bump_version, get_versions
+from .models import ExamResult
+
+
+VERSION_NAMESPACE = 'exam_results'
+
+
+def _round(value):
+    return round(float(value), 2)
+
+
+def describe(marks, total_marks, passing_marks, published=0):
+    """
+    Statistics of an array of marks
+    """
+    percentiles = list(getattr(settings, 'EXAM_STATISTICS_PERCENTILES', (10, 25, 50, 75, 90)))
+    bins = getattr(settings, 'EXAM_STATISTICS_BINS', 10)
+    counts, edges = np.histogram(marks, bins=bins, range=(0, total_marks or 1))
+    statistics = {
+        'count': int(marks.size),
+        'published': published,
+        'total_marks': total_marks,
+        'passing_marks': passing_marks,
+        'histogram': {'edges': [_round(edge) for edge in edges], 'counts': counts.tolist()},
+    }
+    if not marks.size:
+        statistics.update(dict.fromkeys(('mean', 'median', 'std', 'min', 'max', 'pass_rate'), None))
+        statistics['percentiles'] = {str(percentile): None for percentile in percentiles}
+        return statistics
+    statistics.update({
+        'mean': _round(marks.mean()),
+        'median': _round(np.median(marks)),
+        'std': _round(marks.std()),
+        'min': _round(marks.min()),
+        'max': _round(marks.max()),
+        'pass_rate': _round(np.count_nonzero(marks >= passing_marks) * 100.0 / marks.size),
+        'percentiles': {
+            str(percentile): _round(value) for percentile, value in zip(percentiles, np.percentile(marks, percentiles))
+        },
+    })
+    return statistics
+
+
+def build_statistics(exam, published_only=False):
+    results = ExamResult.objects.filter(exam=exam)
+    if published_only:
+        results = results.filter(is_published=True)
+    rows = list(results.values_list('marks_obtained', 'is_published'))
+    marks = np.fromiter((float(marks) for marks, _ in rows), dtype=np.float64, count=len(rows))
+    statistics = describe(marks, exam.total_marks, exam.passing_marks, sum(published for _, published in rows))
+    statistics['exam'] = exam.pk
+    return statistics
+
+
+def _key(exam_id, version, published_only):
+    return f"{VERSION_NAMESPACE}:statistics:{exam_id}:{version}{':published' if published_only else ''}"
+
+
+def get_statistics(exams, published_only=False):
+    """
+    Cached statistics of several exams, in order, with one cache round trip
+    for the versions and one for the values
+    """
+    versions = get_versions(VERSION_NAMESPACE, [exam.pk for exam in exams])
+    keys = {exam.pk: _key(exam.pk, versions[exam.pk], published_only) for exam in exams}
+    found = cache.get_many(list(keys.values()))
+    missing = {}
+    for exam in exams:
+        if keys[exam.pk] not in found:
+            missing[keys[exam.pk]] = found[keys[exam.pk]] = build_statistics(exam, published_only)
+    if missing:
+        cache.set_many(missing, getattr(settings, 'EXAM_STATISTICS_CACHE_TTL', 3600))
+    return [found[keys[exam.pk]] for exam in exams]
+
+
+def exam_statistics(exam, published_only=False):
+    return get_statistics([exam], published_only)[0]
+
+
+def results_changed(exam_ids):
+    """
+    Drop the cached statistics of the given exams once the current
+    transaction commits
+    """
+    exam_ids = set(exam_ids)
+
+    def bump():
+        for exam_id in exam_ids:
+            bump_version(VERSION_NAMESPACE, exam_id)
+
+    transaction.on_commit(bump)
@@ -0,0 +1,16 @@
+from django.urls import path
+from . import views
+
+app_name = 'academics'
+
+urlpatterns = [
+    # Exams
+    path('exams/statistics/', views.ExamComparisonView.as_view(), name='exam_comparison'),
+    path('exams/<int:pk>/statistics/', views.ExamStatisticsView.as_view(), name='exam_statistics'),
+    path('exams/<int:pk>/grade/', views.ExamGradeView.as_view(), name='exam_grade'),
+    path('exams/<int:pk>/marks/', views.ExamMarksUploadView.as_view(), name='exam_marks_upload'),
+    path('exams/<int:pk>/publish/', views.ExamPublishView.as_view(), name='exam_publish'),
+
+    # Reports
+    path('reports/<int:pk>/export/', views.PerformanceReportExportView.as_view(), name='performance_report_export'),
+]
@@ -0,0 +1,125 @@
+from django.shortcuts import get_object_or_404
+from rest_framework import permissions, status
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from accounts.views import IsFacultyUser
+from campus_ecosystem.exports import FORMATS, file_response
+from .exports import export_performance_report, performance_report_response
+from .grading import grade_exams
+from .marks import MarksImportError, import_marks
+from .models import Exam, PerformanceReport
+from .publishing import publish_results
+from .serializers import ExamComparisonQuerySerializer, MarksUploadSerializer
+from .statistics import exam_statistics, get_statistics
+
+
+class PerformanceReportExportView(APIView):
+    """
+    Download a performance report: ?export_format=csv is streamed as it is
+    read, xlsx is written to a file first and its path recorded on the report
+    """
+    permission_classes = [IsFacultyUser]
+
+    def get(self, request, pk):
+        report = get_object_or_404(PerformanceReport, pk=pk)
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in FORMATS:
+            return Response(
+                {'error': f"export_format must be one of {', '.join(FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if export_format == 'csv':
+            return performance_report_response(report)
+        return file_response(export_performance_report(report, export_format))
+
+
+class ExamGradeView(APIView):
+    """
+    Recompute percentage and grade of every result of an exam
+    """
+    permission_classes = [IsFacultyUser]
+
+    def post(self, request, pk):
+        exam = get_object_or_404(Exam, pk=pk)
+        return Response({'exam': exam.pk, 'updated': grade_exams([exam.pk])})
+
+
+class ExamMarksUploadView(APIView):
+    """
+    Upload the marks of an exam as a CSV sheet with roll_number,
+    marks_obtained and optional remarks columns; rows with errors are
+    reported and skipped
+    """
+    permission_classes = [IsFacultyUser]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, pk):
+        exam = get_object_or_404(Exam, pk=pk)
+        serializer = MarksUploadSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            result = import_marks(exam, serializer.validated_data['file'])
+        except MarksImportError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'imported': result.imported, 'errors': result.errors})
+
+
+class ExamPublishView(APIView):
+    """
+    Publish every unpublished result of an exam; students and parents are
+    notified in the background
+    """
+    permission_classes = [IsFacultyUser]
+
+    def post(self, request, pk):
+        exam = get_object_or_404(Exam, pk=pk)
+        published = publish_results(exam, request.user.faculty_profile)
+        return Response({'exam': exam.pk, 'published': published}, status=status.HTTP_202_ACCEPTED)
+
+
+class ExamStatisticsView(APIView):
+    """
+    Mean, median, spread, pass rate, percentiles and marks histogram of an
+    exam. Students and parents only see the exams of their own (or their
+    children's) groups, computed over the published results alone.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        exam = get_object_or_404(Exam.objects.select_related('student_group'), pk=pk)
+        if request.user.role in ('admin', 'faculty'):
+            return Response(exam_statistics(exam))
+        if request.user.role == 'student':
+            members = exam.student_group.students.filter(user=request.user)
+        elif request.user.role == 'parent':
+            members = exam.student_group.students.filter(parents__parent__user=request.user)
+        else:
+            return Response({'error': 'Not allowed.'}, status=status.HTTP_403_FORBIDDEN)
+        if not members.exists():
+            return Response({'error': 'Exam not found.'}, status=status.HTTP_404_NOT_FOUND)
+        statistics = exam_statistics(exam, published_only=True)
+        if not statistics['published']:
+            return Response({'error': 'Results have not been published yet.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(statistics)
+
+
+class ExamComparisonView(APIView):
+    """
+    Statistics of the exams of a subject and/or student group, by date
+    """
+    permission_classes = [IsFacultyUser]
+
+    def get(self, request):
+        serializer = ExamComparisonQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        exams = Exam.objects.filter(**serializer.validated_data).select_related('subject', 'student_group')
+        exams = list(exams.order_by('exam_date', 'start_time'))
+        return Response([
+            dict(statistics, name=exam.name, exam_type=exam.exam_type, exam_date=exam.exam_date,
+                 subject=exam.subject.code, student_group=exam.student_group.name)
+            for exam, statistics in zip(exams, get_statistics(exams))
+        ])
@@ -0,0 +1,95 @@
+"""
+Set-based low-attendance alert sweep.
+
+Each AttendanceStatistics row is compared against the strictest active
+AttendancePolicy of its student's department in a single query. Rows below
+the policy minimum fall in the warning band, and rows more than
+ATTENDANCE_CRITICAL_MARGIN points below it in the critical band. A student
+who already has an unresolved alert for the subject at the same band (or a
+critical one) is skipped, so a warning can still be escalated to critical.
+The new alerts are written with one bulk_create.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    Case, CharField, DecimalField, Exists, ExpressionWrapper, F, Max, OuterRef, Q, Subquery, Value, When
+)
+
+from .models import AttendanceAlert, AttendancePolicy, AttendanceStatistics
+
+
+SweepResult = namedtuple('SweepResult', ['warning', 'critical'])
+
+
+def critical_margin():
+    return Decimal(str(getattr(settings, 'ATTENDANCE_CRITICAL_MARGIN', 10)))
+
+
+def _unresolved(alert_types):
+    return Exists(AttendanceAlert.objects.filter(
+        student_id=OuterRef('student_id'),
+        subject_id=OuterRef('subject_id'),
+        alert_type__in=alert_types,
+        is_resolved=False,
+    ))
+
+
+def pending_alerts(department=None):
+    """
+    values_list of (student_id, subject_id, subject name, current percentage,
+    required percentage, band) for every statistics row that needs a new
+    alert
+    """
+    required = AttendancePolicy.objects.filter(
+        department_id=OuterRef('student__department_id'), is_active=True
+    ).values('department_id').annotate(minimum=Max('minimum_attendance_percentage')).values('minimum')
+    decimal = DecimalField(max_digits=5, decimal_places=2)
+    rows = AttendanceStatistics.objects.filter(total_classes__gt=F('classes_excused'))
+    if department is not None:
+        rows = rows.filter(student__department=department)
+    return rows.annotate(
+        required=Subquery(required, output_field=decimal),
+    ).filter(
+        attendance_percentage__lt=F('required'),
+    ).annotate(
+        band=Case(
+            When(
+                attendance_percentage__lt=ExpressionWrapper(F('required') - critical_margin(), output_field=decimal),
+                then=Value('critical'),
+            ),
+            default=Value('warning'),
+            output_field=CharField(),
+        ),
+    ).exclude(
+        _unresolved(['critical'])
+    ).exclude(
+        Q(band='warning') & _unresolved(['warning'])
+    ).values_list(
+        'student_id', 'subject_id', 'subject__name', 'attendance_percentage', 'required', 'band'
+    ).order_by()
+
+
+@transaction.atomic
+def sweep(department=None, dry_run=False):
+    """
+    Raise alerts for every student below their department's attendance
+    minimum, optionally for one department. Returns the SweepResult counts.
+    """
+    alerts = [
+        AttendanceAlert(
+            student_id=student_id,
+            subject_id=subject_id,
+            alert_type=band,
+            current_percentage=current,
+            required_percentage=required,
+            message=f'Attendance in {subject} is {current}%, below the required {required:.0f}%.',
+        )
+        for student_id, subject_id, subject, current, required, band in pending_alerts(department)
+    ]
+    if not dry_run:
+        AttendanceAlert.objects.bulk_create(alerts, batch_size=getattr(settings, 'ATTENDANCE_BULK_BATCH_SIZE', 500))
+    critical = sum(1 for alert in alerts if alert.alert_type == 'critical')
+    return SweepResult(len(alerts) - critical, critical)
@@ -0,0 +1,301 @@
+"""
+Packed archive tier for past attendance.
+
+archive() moves the Attendance rows of a date range into ArchivedAttendance:
+one row per (class_schedule, date) whose statuses hold one byte per roster
+student - its STATUS_CODES value, or 0 if it has no record that day. The
+roster (the class's students and anyone else with a record, by id) is packed
+into an AttendanceArchiveRoster shared by every day the class had the same
+students. Notes go to the sparse ArchivedAttendanceNote table; timestamps,
+sync versions and per-record markers are dropped, each day keeping the
+faculty who marked most of it. A record that took a row and several index
+entries in Attendance takes about one byte in the archive.
+
+AttendanceStatistics and the rollups are left as they are, since they
+already count the archived records; rebuilding them and report exports read
+the archive through archived_records() next to Attendance. restore() moves a
+range back into Attendance. A record marked again in Attendance after its day
+was archived was counted as new, so restore() keeps the live record and
+takes the archived one back out of the derived tables.
+"""
+import hashlib
+import struct
+from collections import Counter, namedtuple
+from itertools import groupby, islice
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from scheduling.models import GroupSchedule, StudentGroup
+from .changes import lock_classes, record_changes
+from .models import Attendance, AttendanceArchiveRoster, ArchivedAttendance, ArchivedAttendanceNote
+
+
+STATUS_CODES = {status: code for code, (status, _) in enumerate(Attendance.STATUS_CHOICES, start=1)}
+CODE_STATUSES = {code: status for status, code in STATUS_CODES.items()}
+
+ArchiveResult = namedtuple('ArchiveResult', ['days', 'records'])
+
+
+def batch_days():
+    return getattr(settings, 'ATTENDANCE_ARCHIVE_BATCH_DAYS', 500)
+
+
+def pack_roster(student_ids):
+    return struct.pack(f'<{len(student_ids)}Q', *student_ids)
+
+
+def unpack_roster(data):
+    data = bytes(data)
+    return struct.unpack(f'<{len(data) // 8}Q', data)
+
+
+def _class_students(class_ids):
+    """
+    {class_schedule_id: student ids} of the groups currently taking each class
+    """
+    groups = {}
+    for class_schedule_id, group_id in GroupSchedule.objects.filter(
+        class_schedule_id__in=class_ids
+    ).values_list('class_schedule_id', 'group_id'):
+        groups.setdefault(group_id, set()).add(class_schedule_id)
+    students = {class_schedule_id: set() for class_schedule_id in class_ids}
+    for group_id, student_id in StudentGroup.students.through.objects.filter(
+        studentgroup_id__in=groups
+    ).values_list('studentgroup_id', 'studentprofile_id'):
+        for class_schedule_id in groups[group_id]:
+            students[class_schedule_id].add(student_id)
+    return students
+
+
+def _rosters(packed):
+    """
+    {(class_schedule_id, packed roster): roster id}, creating missing rosters
+    """
+    digests = {key: hashlib.sha1(key[1]).hexdigest() for key in packed}
+    AttendanceArchiveRoster.objects.bulk_create(
+        [
+            AttendanceArchiveRoster(class_schedule_id=class_schedule_id, digest=digest, student_ids=roster)
+            for (class_schedule_id, roster), digest in digests.items()
+        ],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    ids = {
+        (class_schedule_id, digest): pk
+        for pk, class_schedule_id, digest in AttendanceArchiveRoster.objects.filter(
+            class_schedule_id__in={key[0] for key in digests}, digest__in=set(digests.values())
+        ).values_list('id', 'class_schedule_id', 'digest')
+    }
+    return {key: ids[(key[0], digest)] for key, digest in digests.items()}
+
+
+def _merge_archived(days):
+    """
+    Fold days that are already archived into days, the new records winning,
+    and drop their notes so they can be written again
+    """
+    archived = {
+        (class_schedule_id, date): (pk, roster, statuses, marked_by_id)
+        for pk, class_schedule_id, date, roster, statuses, marked_by_id in ArchivedAttendance.objects.filter(
+            class_schedule_id__in={key[0] for key in days}, date__in={key[1] for key in days}
+        ).values_list('id', 'class_schedule_id', 'date', 'roster__student_ids', 'statuses', 'marked_by_id')
+        if (class_schedule_id, date) in days
+    }
+    if not archived:
+        return
+    archive_ids = [pk for pk, _, _, _ in archived.values()]
+    notes = {
+        (archive_id, student_id): text
+        for archive_id, student_id, text in ArchivedAttendanceNote.objects.filter(
+            archive_id__in=archive_ids
+        ).values_list('archive_id', 'student_id', 'notes')
+    }
+    for key, (pk, roster, statuses, marked_by_id) in archived.items():
+        records = days[key]
+        for student_id, code in zip(unpack_roster(roster), bytes(statuses)):
+            if code and student_id not in records:
+                records[student_id] = (CODE_STATUSES[code], notes.get((pk, student_id), ''), marked_by_id)
+    ArchivedAttendanceNote.objects.filter(archive_id__in=archive_ids).delete()
+
+
+def _main_marker(records):
+    markers = Counter(marked_by_id for _, _, marked_by_id in records.values() if marked_by_id)
+    return markers.most_common(1)[0][0] if markers else None
+
+
+def _write_days(days):
+    """
+    Archive {(class_schedule_id, date): {student_id: (status, notes,
+    marked_by_id)}}
+    """
+    _merge_archived(days)
+    class_students = _class_students({key[0] for key in days})
+    packed = {}
+    for key, records in days.items():
+        students = sorted(class_students[key[0]] | records.keys())
+        packed[key] = (
+            pack_roster(students),
+            bytes(STATUS_CODES[records[student_id][0]] if student_id in records else 0 for student_id in students),
+        )
+    rosters = _rosters({(key[0], roster) for key, (roster, _) in packed.items()})
+    ArchivedAttendance.objects.bulk_create(
+        [
+            ArchivedAttendance(
+                class_schedule_id=class_schedule_id,
+                date=date,
+                roster_id=rosters[(class_schedule_id, packed[(class_schedule_id, date)][0])],
+                statuses=packed[(class_schedule_id, date)][1],
+                marked_by_id=_main_marker(records),
+            )
+            for (class_schedule_id, date), records in days.items()
+        ],
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['class_schedule', 'date'],
+        update_fields=['roster', 'statuses', 'marked_by'],
+    )
+    archive_ids = {
+        (class_schedule_id, date): pk
+        for pk, class_schedule_id, date in ArchivedAttendance.objects.filter(
+            class_schedule_id__in={key[0] for key in days}, date__in={key[1] for key in days}
+        ).values_list('id', 'class_schedule_id', 'date')
+    }
+    ArchivedAttendanceNote.objects.bulk_create(
+        [
+            ArchivedAttendanceNote(archive_id=archive_ids[key], student_id=student_id, notes=notes)
+            for key, records in days.items()
+            for student_id, (_, notes, _) in records.items()
+            if notes
+        ],
+        batch_size=500,
+    )
+
+
+@transaction.atomic
+def archive(start, end):
+    """
+    Move the Attendance rows dated [start, end] into the archive. Returns
+    the number of class days and records archived.
+    """
+    rows = Attendance.objects.filter(date__range=(start, end)).order_by('class_schedule_id', 'date').values_list(
+        'class_schedule_id', 'date', 'student_id', 'status', 'notes', 'marked_by_id'
+    )
+    days, archived_days, records = {}, 0, 0
+    for key, day in groupby(rows.iterator(chunk_size=2000), key=lambda row: row[:2]):
+        days[key] = {student_id: (status, notes, marked_by_id) for _, _, student_id, status, notes, marked_by_id in day}
+        records += len(days[key])
+        if len(days) >= batch_days():
+            _write_days(days)
+            archived_days += len(days)
+            days = {}
+    if days:
+        _write_days(days)
+        archived_days += len(days)
+
+    # The derived tables keep counting archived records, so the rows are
+    # removed without the delete signals
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {quote(Attendance._meta.db_table)} WHERE {quote(Attendance._meta.get_field('date').column)} "
+            f"BETWEEN %s AND %s",
+            [start, end],
+        )
+    return ArchiveResult(archived_days, records)
+
+
+def archived_record_chunks(start=None, end=None, class_schedule_ids=None, student_ids=None, notes=False):
+    """
+    Archived records as lists of (student_id, class_schedule_id, date,
+    status) tuples, with notes appended if asked for, one list per batch of
+    days in date order
+    """
+    days = ArchivedAttendance.objects.all()
+    if start is not None:
+        days = days.filter(date__gte=start)
+    if end is not None:
+        days = days.filter(date__lte=end)
+    if class_schedule_ids is not None:
+        days = days.filter(class_schedule_id__in=class_schedule_ids)
+    if student_ids is not None:
+        student_ids = set(student_ids)
+    rows = days.order_by('date', 'class_schedule_id').values_list(
+        'id', 'class_schedule_id', 'date', 'roster_id', 'statuses'
+    ).iterator(chunk_size=batch_days())
+    rosters = {}
+    while True:
+        batch = list(islice(rows, batch_days()))
+        if not batch:
+            return
+        missing = {row[3] for row in batch} - rosters.keys()
+        rosters.update(
+            (pk, unpack_roster(packed))
+            for pk, packed in AttendanceArchiveRoster.objects.filter(id__in=missing).values_list('id', 'student_ids')
+        )
+        day_notes = {}
+        if notes:
+            day_notes = {
+                (archive_id, student_id): text
+                for archive_id, student_id, text in ArchivedAttendanceNote.objects.filter(
+                    archive_id__in=[row[0] for row in batch]
+                ).values_list('archive_id', 'student_id', 'notes')
+            }
+        chunk = []
+        for pk, class_schedule_id, date, roster_id, statuses in batch:
+            for student_id, code in zip(rosters[roster_id], bytes(statuses)):
+                if code and (student_ids is None or student_id in student_ids):
+                    record = (student_id, class_schedule_id, date, CODE_STATUSES[code])
+                    chunk.append(record + (day_notes.get((pk, student_id), ''),) if notes else record)
+        yield chunk
+
+
+def archived_records(start=None, end=None, class_schedule_ids=None, student_ids=None, notes=False):
+    for chunk in archived_record_chunks(start, end, class_schedule_ids, student_ids, notes):
+        yield from chunk
+
+
+@transaction.atomic
+def restore(start, end):
+    """
+    Move the archived days dated [start, end] back into Attendance; records
+    written to Attendance since they were archived are kept. Returns the
+    number of class days and records restored.
+    """
+    days = ArchivedAttendance.objects.filter(date__range=(start, end))
+    markers = {
+        (class_schedule_id, date): marked_by_id or faculty_id
+        for class_schedule_id, date, marked_by_id, faculty_id in days.values_list(
+            'class_schedule_id', 'date', 'marked_by_id', 'class_schedule__faculty_id'
+        )
+    }
+    lock_classes({class_schedule_id for class_schedule_id, _ in markers})
+    records = 0
+    for chunk in archived_record_chunks(start, end, notes=True):
+        live = set(Attendance.objects.filter(
+            student_id__in={record[0] for record in chunk},
+            class_schedule_id__in={record[1] for record in chunk},
+            date__in={record[2] for record in chunk},
+        ).values_list('student_id', 'class_schedule_id', 'date'))
+        restored = [record for record in chunk if record[:3] not in live]
+        Attendance.objects.bulk_create(
+            [
+                Attendance(
+                    student_id=student_id,
+                    class_schedule_id=class_schedule_id,
+                    date=date,
+                    status=status,
+                    notes=notes,
+                    marked_by_id=markers[(class_schedule_id, date)],
+                )
+                for student_id, class_schedule_id, date, status, notes in restored
+            ],
+            batch_size=getattr(settings, 'ATTENDANCE_BULK_BATCH_SIZE', 500),
+        )
+        # The live record was counted as new when it was written, so the
+        # archived one it replaces is dropped from the derived tables
+        record_changes([record[:3] + (record[3], None) for record in chunk if record[:3] in live])
+        records += len(restored)
+    days.delete()
+    AttendanceArchiveRoster.objects.filter(days__isnull=True).delete()
+    return ArchiveResult(len(markers), records)
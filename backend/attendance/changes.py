@@ -0,0 +1,87 @@
+"""
+The stream of Attendance changes that derived tables are maintained from.
+
+Writers describe what they did as (student_id, class_schedule_id, date,
+old_status, new_status) tuples - old_status is None for a created row and
+new_status None for a deleted one - and record_changes() passes them to
+every maintainer: AttendanceStatistics and the attendance rollups, and drops
+the cached heatmaps they affect.
+"""
+import time
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+
+from scheduling.models import ClassSchedule
+
+
+@transaction.atomic
+def apply_counter_deltas(model, key_fields, counters, deltas):
+    """
+    Add {key tuple: counter deltas} to the rows of model identified by
+    key_fields, creating missing rows. Rows receiving the same delta are
+    updated together with one F() expression UPDATE. Returns the ids of the
+    rows touched.
+    """
+    deltas = {key: tuple(delta) for key, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return []
+    model.objects.bulk_create(
+        [model(**dict(zip(key_fields, key))) for key in deltas],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    lookup = {
+        f'{field}__in': {key[index] for key in deltas} for index, field in enumerate(key_fields)
+    }
+    rows = {
+        tuple(row[1:]): row[0]
+        for row in model.objects.filter(**lookup).values_list('id', *key_fields)
+        if tuple(row[1:]) in deltas
+    }
+    by_delta = defaultdict(list)
+    for key, delta in deltas.items():
+        by_delta[delta].append(rows[key])
+    for delta, ids in by_delta.items():
+        model.objects.filter(id__in=ids).update(**{
+            counter: F(counter) + change for counter, change in zip(counters, delta) if change
+        })
+    return list(rows.values())
+
+
+def lock_classes(class_schedule_ids):
+    """
+    Lock the ClassSchedule rows of the classes a writer is about to mark, in
+    id order, so that concurrent writers of the same class and date take
+    turns and each reads the statuses it replaces after the previous one
+    has committed. Must be called inside a transaction.
+    """
+    list(ClassSchedule.objects.select_for_update().filter(
+        id__in=set(class_schedule_ids)
+    ).order_by('id').values_list('id', flat=True))
+
+
+def version_clock():
+    """
+    Record version for a server-side write: the time in milliseconds, the
+    same clock offline clients version their edits with (see attendance.sync)
+    """
+    return int(time.time() * 1000)
+
+
+@transaction.atomic
+def record_changes(changes):
+    """
+    Bring every derived attendance table up to date with a batch of changes
+    """
+    from . import heatmaps, rollups, statistics
+
+    changes = [change for change in changes if change[3] != change[4]]
+    if not changes:
+        return
+    # Statistics rebuilds hold these locks while they replace their rows
+    lock_classes({change[1] for change in changes})
+    statistics.record_changes(changes)
+    rollups.record_changes(changes)
+    heatmaps.invalidate(changes)
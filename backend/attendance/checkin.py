@@ -0,0 +1,284 @@
+"""
+Student self check-in to an active AttendanceSession.
+
+The faculty opens check-in with open_check_in(), which gives the session a
+short-lived code and caches its roster ({user id: student id}), the time
+after which a check-in counts as late (the class start plus the strictest
+active AttendancePolicy.late_threshold_minutes of the subject's department)
+and the code's expiry. A check-in is then validated against the cache -
+one cache.add() per student and session rejects duplicates, even across
+processes sharing the cache - plus one primary key lookup that the session
+is still active with the same code, so a closed check-in is refused by
+every process at once.
+
+Accepted check-ins are not written by the request. They are appended to a
+process-wide buffer that a background thread flushes to Attendance with one
+bulk_create every ATTENDANCE_CHECKIN_FLUSH_INTERVAL seconds (or as soon as
+ATTENDANCE_CHECKIN_FLUSH_SIZE records are waiting), so a burst of check-ins
+costs a handful of inserts instead of one transaction per student. Students
+the faculty has already marked keep their mark. Records still failing after
+ATTENDANCE_CHECKIN_FLUSH_RETRIES flushes are dropped and their students are
+allowed to check in again.
+"""
+import atexit
+import datetime
+import logging
+import secrets
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from accounts.models import StudentProfile
+from .changes import lock_classes, record_changes, version_clock
+from .models import Attendance, AttendancePolicy, AttendanceSession
+
+
+logger = logging.getLogger(__name__)
+
+CODE_ALPHABET = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'
+
+Roster = namedtuple('Roster', [
+    'session_id', 'class_schedule_id', 'faculty_id', 'date', 'late_after', 'expires_at', 'students'
+])
+
+
+class CheckInError(Exception):
+    """
+    A rejected check-in; reason is 'invalid', 'not_enrolled' or 'duplicate'
+    """
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+
+def _roster_key(code):
+    return f'attendance:checkin:{code}'
+
+
+def _seen_key(session_id, student_id):
+    return f'attendance:checkin:{session_id}:{student_id}'
+
+
+def _seconds_left(expires_at):
+    return max(1, int((expires_at - timezone.now()).total_seconds()) + 1)
+
+
+def late_threshold(class_schedule):
+    """
+    Minutes after the start of a class after which a check-in is late
+    """
+    minutes = AttendancePolicy.objects.filter(
+        department_id=class_schedule.subject.department_id, is_active=True
+    ).aggregate(minutes=Min('late_threshold_minutes'))['minutes']
+    if minutes is None:
+        minutes = AttendancePolicy._meta.get_field('late_threshold_minutes').default
+    return minutes
+
+
+def load_roster(session):
+    class_schedule = session.class_schedule
+    starts_at = timezone.make_aware(datetime.datetime.combine(session.date, class_schedule.start_time))
+    students = dict(StudentProfile.objects.filter(
+        groups__schedules__class_schedule_id=class_schedule.pk,
+        groups__schedules__is_active=True,
+        groups__is_active=True,
+    ).values_list('user_id', 'id').distinct())
+    return Roster(
+        session.pk, class_schedule.pk, session.faculty_id, session.date,
+        starts_at + datetime.timedelta(minutes=late_threshold(class_schedule)),
+        session.check_in_expires_at, students,
+    )
+
+
+def _new_code():
+    length = getattr(settings, 'ATTENDANCE_CHECKIN_CODE_LENGTH', 6)
+    while True:
+        code = ''.join(secrets.choice(CODE_ALPHABET) for _ in range(length))
+        if not AttendanceSession.objects.filter(
+            check_in_code=code, check_in_expires_at__gt=timezone.now()
+        ).exists():
+            return code
+
+
+def open_check_in(session, ttl=None):
+    """
+    Give an active session a new check-in code valid for ttl seconds
+    (ATTENDANCE_CHECKIN_CODE_TTL by default) and cache its roster
+    """
+    if not session.is_active:
+        raise ValueError('The attendance session has ended')
+    if ttl is None:
+        ttl = getattr(settings, 'ATTENDANCE_CHECKIN_CODE_TTL', 120)
+    if session.check_in_code:
+        cache.delete(_roster_key(session.check_in_code))
+    session.check_in_code = _new_code()
+    session.check_in_expires_at = timezone.now() + datetime.timedelta(seconds=ttl)
+    session.save(update_fields=['check_in_code', 'check_in_expires_at', 'updated_at'])
+    roster = load_roster(session)
+    transaction.on_commit(lambda: cache.set(_roster_key(session.check_in_code), roster, ttl))
+    return session.check_in_code, session.check_in_expires_at
+
+
+def close_check_in(session):
+    if session.check_in_code:
+        cache.delete(_roster_key(session.check_in_code))
+    session.check_in_code = ''
+    session.check_in_expires_at = None
+    session.save(update_fields=['check_in_code', 'check_in_expires_at', 'updated_at'])
+
+
+def get_roster(code):
+    """
+    The cached roster of the session a code opens, loaded from the database
+    if the cache has lost it; None for an unknown or expired code
+    """
+    roster = cache.get(_roster_key(code))
+    if roster is not None:
+        return roster
+    session = AttendanceSession.objects.filter(
+        check_in_code=code, is_active=True, check_in_expires_at__gt=timezone.now()
+    ).select_related('class_schedule__subject').first()
+    if session is None:
+        return None
+    roster = load_roster(session)
+    cache.set(_roster_key(code), roster, _seconds_left(roster.expires_at))
+    return roster
+
+
+def check_in(user_id, code):
+    """
+    Check a student in with a session code and return the status recorded,
+    'present' or 'late'. Raises CheckInError.
+    """
+    code = code.strip().upper()
+    now = timezone.now()
+    roster = get_roster(code)
+    if roster is None or now >= roster.expires_at:
+        raise CheckInError('invalid', 'Invalid or expired check-in code.')
+    student_id = roster.students.get(user_id)
+    if student_id is None:
+        raise CheckInError('not_enrolled', 'You are not on the roster of this class.')
+    # The cached roster outlives a session that was ended or had its check-in closed
+    if not AttendanceSession.objects.filter(pk=roster.session_id, is_active=True, check_in_code=code).exists():
+        raise CheckInError('invalid', 'Invalid or expired check-in code.')
+    seen_key = _seen_key(roster.session_id, student_id)
+    if not cache.add(seen_key, True, _seconds_left(roster.expires_at) + 60):
+        raise CheckInError('duplicate', 'You have already checked in.')
+    status = 'late' if now > roster.late_after else 'present'
+    buffer.add(seen_key, Attendance(
+        student_id=student_id,
+        class_schedule_id=roster.class_schedule_id,
+        date=roster.date,
+        status=status,
+        marked_by_id=roster.faculty_id,
+        notes='Self check-in',
+        version=version_clock(),
+    ))
+    return status
+
+
+@transaction.atomic
+def write_check_ins(records):
+    """
+    Insert check-ins for students that have no mark yet and feed the ones
+    actually inserted to the derived attendance tables
+    """
+    lock_classes({record.class_schedule_id for record in records})
+    keys = {
+        'student_id__in': {record.student_id for record in records},
+        'class_schedule_id__in': {record.class_schedule_id for record in records},
+        'date__in': {record.date for record in records},
+    }
+    existing = set(Attendance.objects.filter(**keys).values_list('student_id', 'class_schedule_id', 'date'))
+    new = {}
+    for record in records:
+        key = (record.student_id, record.class_schedule_id, record.date)
+        if key not in existing:
+            new.setdefault(key, record)
+    if not new:
+        return 0
+    Attendance.objects.bulk_create(
+        list(new.values()),
+        batch_size=getattr(settings, 'ATTENDANCE_BULK_BATCH_SIZE', 500),
+        ignore_conflicts=True,
+    )
+    # A mark written without the class lock may still have won the key;
+    # only rows that carry the check-in's own version were inserted here
+    stored = Attendance.objects.filter(**keys).values_list('student_id', 'class_schedule_id', 'date', 'version')
+    inserted = [
+        (student_id, class_schedule_id, date)
+        for student_id, class_schedule_id, date, version in stored
+        if (student_id, class_schedule_id, date) in new and version == new[student_id, class_schedule_id, date].version
+    ]
+    record_changes([key + (None, new[key].status) for key in inserted])
+    return len(inserted)
+
+
+class CheckInBuffer:
+    """
+    Check-ins waiting to be written. A flusher thread is started with the
+    first record and exits once the buffer has been drained.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.pending = []  # (seen key, record, failed attempts)
+        self.thread = None
+
+    def add(self, seen_key, record):
+        with self.lock:
+            self.pending.append((seen_key, record, 0))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True, name='attendance-check-in')
+                self.thread.start()
+            if len(self.pending) >= getattr(settings, 'ATTENDANCE_CHECKIN_FLUSH_SIZE', 500):
+                self.wake.set()
+
+    def flush(self):
+        """
+        Write everything waiting; failed records are retried on the next
+        flush, up to ATTENDANCE_CHECKIN_FLUSH_RETRIES times, then dropped
+        and their students let check in again
+        """
+        with self.lock:
+            pending, self.pending = self.pending, []
+        if not pending:
+            return 0
+        try:
+            return write_check_ins([record for _, record, _ in pending])
+        except Exception:
+            logger.exception('Writing %s check-ins failed', len(pending))
+            retries = getattr(settings, 'ATTENDANCE_CHECKIN_FLUSH_RETRIES', 3)
+            retry = [(seen_key, record, failed + 1) for seen_key, record, failed in pending if failed + 1 < retries]
+            dropped = [seen_key for seen_key, _, failed in pending if failed + 1 >= retries]
+            if dropped:
+                logger.error('Dropping %s check-ins after %s failed writes', len(dropped), retries)
+                cache.delete_many(dropped)
+            with self.lock:
+                self.pending[:0] = retry
+            return 0
+
+    def _run(self):
+        interval = getattr(settings, 'ATTENDANCE_CHECKIN_FLUSH_INTERVAL', 0.25)
+        try:
+            while True:
+                self.wake.wait(interval)
+                self.wake.clear()
+                self.flush()
+                with self.lock:
+                    if not self.pending:
+                        self.thread = None
+                        return
+        finally:
+            connection.close()
+
+
+buffer = CheckInBuffer()
+atexit.register(buffer.flush)
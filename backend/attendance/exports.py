@@ -0,0 +1,95 @@
+"""
+Row-by-row exports of attendance reports (see campus_ecosystem.exports)
+"""
+import heapq
+from itertools import groupby
+from operator import itemgetter
+
+from campus_ecosystem.exports import chunk_size, csv_response, write_export
+from scheduling.models import ClassSchedule, GroupSchedule
+from .archive import archived_records
+from .models import ArchivedAttendance, Attendance
+
+
+HEADER = ['Roll number', 'Student', 'Subject', 'Date', 'Start time', 'Status', 'Notes']
+
+
+def _archived_rows(report, class_ids, students):
+    """
+    Archived records of the report in the same order as the live ones
+    """
+    classes = {
+        pk: (code, start_time.strftime('%H:%M'))
+        for pk, code, start_time in ClassSchedule.objects.filter(id__in=class_ids).values_list(
+            'id', 'subject__code', 'start_time'
+        )
+    }
+    records = archived_records(
+        report.start_date, report.end_date, class_schedule_ids=class_ids, student_ids=students, notes=True
+    )
+    for date, day in groupby(records, key=itemgetter(2)):
+        rows = [
+            (*students[student_id], classes[class_schedule_id][0], date.isoformat(), classes[class_schedule_id][1],
+             status, notes)
+            for student_id, class_schedule_id, _, status, notes in day
+        ]
+        rows.sort(key=_order)
+        yield from rows
+
+
+def _order(row):
+    return (row[3], row[4], row[0])
+
+
+def attendance_report_rows(report):
+    """
+    Every attendance record of the report's group and period, live and
+    archived, read in chunks
+    """
+    group = report.student_group
+    records = Attendance.objects.filter(
+        date__range=(report.start_date, report.end_date),
+        class_schedule__group_schedules__group=group,
+        class_schedule__group_schedules__is_active=True,
+        student__groups=group,
+    ).order_by('date', 'class_schedule__start_time', 'student__roll_number').values_list(
+        'student__roll_number', 'student__user__first_name', 'student__user__last_name',
+        'class_schedule__subject__code', 'date', 'class_schedule__start_time', 'status', 'notes',
+    )
+    live = (
+        (roll_number, f'{first_name} {last_name}'.strip(), subject,
+         date.isoformat(), start_time.strftime('%H:%M'), status, notes)
+        for roll_number, first_name, last_name, subject, date, start_time, status, notes in records.iterator(
+            chunk_size=chunk_size()
+        )
+    )
+    if not ArchivedAttendance.objects.filter(date__range=(report.start_date, report.end_date)).exists():
+        return live
+    class_ids = list(GroupSchedule.objects.filter(group=group, is_active=True).values_list(
+        'class_schedule_id', flat=True
+    ))
+    students = {
+        pk: (roll_number, f'{first_name} {last_name}'.strip())
+        for pk, roll_number, first_name, last_name in group.students.values_list(
+            'id', 'roll_number', 'user__first_name', 'user__last_name'
+        )
+    }
+    return heapq.merge(live, _archived_rows(report, class_ids, students), key=_order)
+
+
+def export_attendance_report(report, export_format='csv'):
+    """
+    Write the report to a file under MEDIA_ROOT and record its path
+    """
+    report.file_path = write_export(
+        'attendance', f'attendance-report-{report.pk}', export_format, HEADER, attendance_report_rows(report)
+    )
+    report.save(update_fields=['file_path'])
+    return report.file_path
+
+
+def attendance_report_response(report):
+    """
+    The report as a CSV streamed straight to the client
+    """
+    return csv_response(f'attendance-report-{report.pk}.csv', HEADER, attendance_report_rows(report))
@@ -0,0 +1,197 @@
+"""
+Attendance heatmaps computed with NumPy.
+
+The attendance of a set of student groups over a date range (live and
+archived, counted towards every group that takes the class and contains the
+student, as in the rollups) is loaded once with values_list - counted per
+group, class, date and status - into parallel arrays, and two matrices are
+reduced from them with np.bincount over flattened cell indexes:
+
+    group x weekday x class start time
+    subject x week (weeks starting on Monday)
+
+Each cell holds the records counted (excused ones left out) and attended
+(present, late or half-day). Results are cached per scope and date range
+under the versions of the groups involved, which the attendance change
+stream bumps through invalidate().
+"""
+import datetime
+import hashlib
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F
+
+from campus_ecosystem.cache_versions import bump_version, get_versions
+from scheduling.models import ClassSchedule, GroupSchedule, StudentGroup, TimeSlot
+from .archive import archived_record_chunks
+from .models import Attendance
+from .rollups import ATTENDED, _class_groups, week_start
+
+
+VERSION_NAMESPACE = 'attendance_heatmap'
+DAYS = [day for day, _ in TimeSlot.DAY_CHOICES]
+STATUS_INDEX = {status: index for index, (status, _) in enumerate(Attendance.STATUS_CHOICES)}
+
+
+def _load(group_ids, start, end):
+    """
+    Parallel lists of group id, class id, date, status and number of
+    records, the live ones counted by the database in one grouped query
+    """
+    rows = list(Attendance.objects.filter(
+        date__range=(start, end),
+        class_schedule__group_schedules__group_id__in=group_ids,
+        class_schedule__group_schedules__is_active=True,
+        class_schedule__group_schedules__group__students=F('student'),
+    ).values_list(
+        'class_schedule__group_schedules__group_id', 'class_schedule_id', 'date', 'status'
+    ).annotate(records=Count('id')).order_by())
+    class_ids = list(GroupSchedule.objects.filter(group_id__in=group_ids, is_active=True).values_list(
+        'class_schedule_id', flat=True
+    ))
+    wanted = set(group_ids)
+    archived = Counter()
+    for chunk in archived_record_chunks(start, end, class_schedule_ids=class_ids):
+        groups = _class_groups({(student_id, class_schedule_id) for student_id, class_schedule_id, _, _ in chunk})
+        archived.update(
+            (group_id, class_schedule_id, date, status)
+            for student_id, class_schedule_id, date, status in chunk
+            for group_id in groups[(student_id, class_schedule_id)]
+            if group_id in wanted
+        )
+    rows.extend(key + (records,) for key, records in archived.items())
+    if not rows:
+        return [], [], [], [], []
+    return [list(column) for column in zip(*rows)]
+
+
+def _cells(index, counted, attended, shape):
+    size = int(np.prod(shape))
+    return (
+        np.bincount(index, weights=counted, minlength=size).reshape(shape).astype(np.int64),
+        np.bincount(index, weights=attended, minlength=size).reshape(shape).astype(np.int64),
+    )
+
+
+def _matrix(counted, attended):
+    rate = np.round(np.divide(
+        attended * 100.0, counted, out=np.zeros(counted.shape), where=counted > 0
+    ), 2)
+    return {
+        'counted': counted.tolist(),
+        'attended': attended.tolist(),
+        'rate': np.where(counted > 0, rate, np.nan).tolist(),
+    }
+
+
+def _clean(value):
+    """
+    NaN (a cell with no records) to None, for JSON
+    """
+    if isinstance(value, dict):
+        return {key: _clean(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_clean(item) for item in value]
+    return None if isinstance(value, float) and value != value else value
+
+
+def build_heatmaps(groups, start, end):
+    """
+    Group x weekday x time and subject x week matrices for the given
+    StudentGroups over [start, end]
+    """
+    groups = sorted(groups, key=lambda group: group.name)
+    group_ids = [group.pk for group in groups]
+    row_groups, class_ids, dates, statuses, records = _load(group_ids, start, end)
+
+    classes = {
+        pk: (subject_id, code, day, start_time)
+        for pk, subject_id, code, day, start_time in ClassSchedule.objects.filter(
+            id__in=set(class_ids)
+        ).values_list('id', 'subject_id', 'subject__code', 'day', 'start_time')
+    }
+    slots = sorted({start_time for _, _, _, start_time in classes.values()})
+    subjects = sorted({(code, subject_id) for subject_id, code, _, _ in classes.values()})
+    first_week = week_start(start)
+    week_count = (week_start(end) - first_week).days // 7 + 1
+
+    group_index = {group_id: index for index, group_id in enumerate(group_ids)}
+    slot_index = {slot: index for index, slot in enumerate(slots)}
+    subject_index = {subject_id: index for index, (_, subject_id) in enumerate(subjects)}
+    day_index = {day: index for index, day in enumerate(DAYS)}
+    # Per-class lookups, gathered into per-record arrays in one step
+    class_keys = sorted(classes)
+    class_position = {pk: index for index, pk in enumerate(class_keys)}
+    class_day = np.array([day_index[classes[pk][2]] for pk in class_keys], dtype=np.int64)
+    class_slot = np.array([slot_index[classes[pk][3]] for pk in class_keys], dtype=np.int64)
+    class_subject = np.array([subject_index[classes[pk][0]] for pk in class_keys], dtype=np.int64)
+
+    weeks = {date: (date - first_week).days // 7 for date in set(dates)}
+    record_class = np.fromiter((class_position[pk] for pk in class_ids), dtype=np.int64, count=len(class_ids))
+    record_group = np.fromiter((group_index[pk] for pk in row_groups), dtype=np.int64, count=len(row_groups))
+    record_week = np.fromiter((weeks[date] for date in dates), dtype=np.int64, count=len(dates))
+    record_status = np.fromiter((STATUS_INDEX[status] for status in statuses), dtype=np.int64, count=len(statuses))
+    weight = np.array(records, dtype=np.float64)
+    attended = weight * np.isin(record_status, [STATUS_INDEX[status] for status in ATTENDED])
+    counted = weight * (record_status != STATUS_INDEX['excused'])
+
+    shape = (len(groups), len(DAYS), len(slots))
+    group_counted, group_attended = _cells(
+        np.ravel_multi_index((record_group, class_day[record_class], class_slot[record_class]), shape),
+        counted, attended, shape,
+    )
+    shape = (len(subjects), week_count)
+    subject_counted, subject_attended = _cells(
+        np.ravel_multi_index((class_subject[record_class], record_week), shape), counted, attended, shape,
+    )
+
+    return _clean({
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'groups': [{'id': group.pk, 'name': group.name} for group in groups],
+        'days': DAYS,
+        'slots': [slot.strftime('%H:%M') for slot in slots],
+        'subjects': [{'id': subject_id, 'code': code} for code, subject_id in subjects],
+        'weeks': [(first_week + datetime.timedelta(weeks=week)).isoformat() for week in range(week_count)],
+        'group_day_slot': _matrix(group_counted, group_attended),
+        'subject_week': _matrix(subject_counted, subject_attended),
+    })
+
+
+def get_heatmaps(scope, scope_id, start, end):
+    """
+    Cached heatmaps of one student group (scope 'group') or of every active
+    group of a department (scope 'department')
+    """
+    if scope == 'group':
+        groups = list(StudentGroup.objects.filter(pk=scope_id))
+    else:
+        groups = list(StudentGroup.objects.filter(department_id=scope_id, is_active=True))
+    versions = get_versions(VERSION_NAMESPACE, [group.pk for group in groups])
+    digest = hashlib.sha1(repr(sorted(versions.items())).encode()).hexdigest()
+    key = f'{VERSION_NAMESPACE}:{scope}:{scope_id}:{start}:{end}:{digest}'
+    heatmaps = cache.get(key)
+    if heatmaps is None:
+        heatmaps = build_heatmaps(groups, start, end)
+        cache.set(key, heatmaps, getattr(settings, 'ATTENDANCE_HEATMAP_CACHE_TTL', 3600))
+    return heatmaps
+
+
+def invalidate(changes):
+    """
+    Drop cached heatmaps of the groups taking the classes of a batch of
+    Attendance changes once the current transaction commits
+    """
+    group_ids = set(GroupSchedule.objects.filter(
+        class_schedule_id__in={change[1] for change in changes}
+    ).values_list('group_id', flat=True))
+
+    def bump():
+        for group_id in group_ids:
+            bump_version(VERSION_NAMESPACE, group_id)
+
+    transaction.on_commit(bump)
@@ -0,0 +1,150 @@
+"""
+Expansion of BulkAttendance payloads into Attendance rows.
+
+A payload maps each student to a status (or to {"status": ..., "notes":
+...}). Students may be identified by StudentProfile.student_id or by primary
+key. A class is ingested with a constant number of queries however many
+students it has: one for the roster, one for the statuses already marked,
+one upsert on the (student, class_schedule, date) key, a few batched
+updates of the derived tables and one to mark the batch verified.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import StudentProfile
+from .changes import lock_classes, record_changes, version_clock
+from .models import Attendance, BulkAttendance
+
+
+IngestionResult = namedtuple('IngestionResult', ['written', 'missing'])
+
+STATUSES = {status for status, _ in Attendance.STATUS_CHOICES}
+
+
+class AttendanceIngestionError(Exception):
+    """
+    A payload that does not match the class; errors maps each offending
+    payload key (or 'date') to a message
+    """
+
+    def __init__(self, errors):
+        super().__init__('; '.join(f'{key}: {message}' for key, message in errors.items()))
+        self.errors = errors
+
+
+def class_roster(class_schedule_id):
+    """
+    {student_id: pk} and {str(pk): pk} lookups for the students of every
+    active group taking a class, with one query
+    """
+    by_code, by_pk = {}, {}
+    for pk, code in StudentProfile.objects.filter(
+        groups__schedules__class_schedule_id=class_schedule_id,
+        groups__schedules__is_active=True,
+        groups__is_active=True,
+    ).values_list('id', 'student_id').distinct():
+        by_code[code] = pk
+        by_pk[str(pk)] = pk
+    return by_code, by_pk
+
+
+def parse_payload(attendance_data, roster):
+    """
+    Validate a payload against a class roster and return {student pk:
+    (status, notes)}. Raises AttendanceIngestionError listing every bad key.
+    """
+    by_code, by_pk = roster
+    if not isinstance(attendance_data, dict):
+        raise AttendanceIngestionError({'attendance_data': 'Expected an object mapping students to statuses.'})
+    marks, errors = {}, {}
+    for key, value in attendance_data.items():
+        key = str(key)
+        student = by_code.get(key, by_pk.get(key))
+        if student is None:
+            errors[key] = 'Student is not on the class roster.'
+            continue
+        notes = ''
+        if isinstance(value, dict):
+            notes = value.get('notes') or ''
+            value = value.get('status')
+        if value not in STATUSES:
+            errors[key] = f'Invalid status {value!r}.'
+            continue
+        if student in marks:
+            errors[key] = 'Student appears more than once.'
+            continue
+        marks[student] = (value, notes)
+    if errors:
+        raise AttendanceIngestionError(errors)
+    return marks
+
+
+@transaction.atomic
+def ingest_bulk_attendance(bulk, verified_by=None):
+    """
+    Write the Attendance rows of a BulkAttendance, updating any rows already
+    marked for the same students, and mark the batch verified. Returns the
+    number of rows written and the roster students the payload left out.
+    bulk.class_schedule should already be loaded (select_related).
+    """
+    class_schedule = bulk.class_schedule
+    if bulk.date.strftime('%A').lower() != class_schedule.day:
+        raise AttendanceIngestionError({'date': f'The class does not meet on {bulk.date:%A}s.'})
+
+    roster = class_roster(class_schedule.pk)
+    marks = parse_payload(bulk.attendance_data, roster)
+    # The statuses being replaced are read under lock so that concurrent
+    # submissions and syncs of the class record correct deltas
+    lock_classes([class_schedule.pk])
+    previous = dict(Attendance.objects.select_for_update().filter(
+        class_schedule_id=class_schedule.pk, date=bulk.date, student_id__in=list(marks)
+    ).values_list('student_id', 'status'))
+    version = version_clock()
+    Attendance.objects.bulk_create(
+        [
+            Attendance(
+                student_id=student_id,
+                class_schedule_id=class_schedule.pk,
+                date=bulk.date,
+                status=status,
+                marked_by_id=bulk.faculty_id,
+                notes=notes,
+                version=version,
+            )
+            for student_id, (status, notes) in marks.items()
+        ],
+        batch_size=getattr(settings, 'ATTENDANCE_BULK_BATCH_SIZE', 500),
+        update_conflicts=True,
+        unique_fields=['student', 'class_schedule', 'date'],
+        update_fields=['status', 'marked_by', 'notes', 'version', 'updated_at'],
+    )
+    record_changes(
+        (student_id, class_schedule.pk, bulk.date, previous.get(student_id), status)
+        for student_id, (status, _) in marks.items()
+    )
+
+    bulk.is_verified = True
+    bulk.verified_by_id = verified_by.pk if verified_by is not None else bulk.faculty_id
+    bulk.verified_at = timezone.now()
+    bulk.save(update_fields=['is_verified', 'verified_by', 'verified_at'])
+    missing = sorted(set(roster[0].values()) - marks.keys())
+    return IngestionResult(len(marks), missing)
+
+
+def ingest_pending(queryset=None):
+    """
+    Ingest every unverified BulkAttendance; returns {pk: IngestionResult or
+    AttendanceIngestionError}
+    """
+    if queryset is None:
+        queryset = BulkAttendance.objects.all()
+    results = {}
+    for bulk in queryset.filter(is_verified=False).select_related('class_schedule'):
+        try:
+            results[bulk.pk] = ingest_bulk_attendance(bulk)
+        except AttendanceIngestionError as exc:
+            results[bulk.pk] = exc
+    return results
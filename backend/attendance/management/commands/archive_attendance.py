@@ -0,0 +1,29 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.archive import archive, restore
+
+
+class Command(BaseCommand):
+    help = 'Move the attendance of a past period into the packed archive, or back with --restore'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', required=True, help='First date to move (YYYY-MM-DD)')
+        parser.add_argument('--end', required=True, help='Last date to move (YYYY-MM-DD)')
+        parser.add_argument('--restore', action='store_true', help='Move archived attendance back into Attendance')
+
+    def handle(self, *args, **options):
+        try:
+            start = datetime.date.fromisoformat(options['start'])
+            end = datetime.date.fromisoformat(options['end'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        if start > end:
+            raise CommandError('--start must not be after --end')
+        if options['restore']:
+            result = restore(start, end)
+            self.stdout.write(self.style.SUCCESS(f'Restored {result.records} records of {result.days} class days'))
+        else:
+            result = archive(start, end)
+            self.stdout.write(self.style.SUCCESS(f'Archived {result.records} records of {result.days} class days'))
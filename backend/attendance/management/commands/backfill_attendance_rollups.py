@@ -0,0 +1,24 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.rollups import backfill
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily, weekly and monthly attendance rollups from Attendance'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First date to rebuild (YYYY-MM-DD); defaults to all history')
+        parser.add_argument('--end', help='Last date to rebuild (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        try:
+            start = datetime.date.fromisoformat(options['start']) if options['start'] else None
+            end = datetime.date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        if start and end and start > end:
+            raise CommandError('--start must not be after --end')
+        written = backfill(start, end)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} rollup rows'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from academics.exports import export_performance_report
+from academics.models import PerformanceReport
+from attendance.exports import export_attendance_report
+from attendance.models import AttendanceReport
+from campus_ecosystem.exports import FORMATS
+
+
+EXPORTERS = {
+    'attendance': (AttendanceReport, export_attendance_report),
+    'performance': (PerformanceReport, export_performance_report),
+}
+
+
+class Command(BaseCommand):
+    help = 'Write an attendance or performance report to a file under MEDIA_ROOT and record its path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTERS))
+        parser.add_argument('report_id', type=int)
+        parser.add_argument('--format', dest='export_format', choices=FORMATS, default='csv')
+
+    def handle(self, *args, **options):
+        model, export = EXPORTERS[options['kind']]
+        try:
+            report = model.objects.get(pk=options['report_id'])
+        except model.DoesNotExist:
+            raise CommandError(f"{options['kind'].capitalize()} report {options['report_id']} does not exist")
+        path = export(report, options['export_format'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {path}'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from attendance.statistics import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuild AttendanceStatistics from Attendance and report drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report drift')
+
+    def handle(self, *args, **options):
+        drift = rebuild(dry_run=options['dry_run'])
+        message = (
+            f'{drift.rows} statistics rows: {drift.missing} missing, {drift.stale} stale, '
+            f'{drift.orphaned} orphaned'
+        )
+        if drift.missing or drift.stale or drift.orphaned:
+            self.stdout.write(self.style.WARNING(message + ('' if options['dry_run'] else ' (fixed)')))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
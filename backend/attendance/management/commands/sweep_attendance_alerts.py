@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import Department
+from attendance.alerts import sweep
+
+
+class Command(BaseCommand):
+    help = 'Raise low-attendance alerts from the attendance policies of each department'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--department', help='Department code; defaults to every department')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the alerts that would be raised')
+
+    def handle(self, *args, **options):
+        department = None
+        if options['department']:
+            department = Department.objects.filter(code=options['department']).first()
+            if department is None:
+                raise CommandError(f"Department {options['department']} does not exist")
+        result = sweep(department, dry_run=options['dry_run'])
+        verb = 'Would raise' if options['dry_run'] else 'Raised'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {result.warning} warning and {result.critical} critical alerts'
+        ))
@@ -0,0 +1,31 @@
+"""
+Class occurrences that were held but have no attendance.
+
+An occurrence (see scheduling.occurrences) counts as missing when it was not
+cancelled, its date has passed (today included) and neither Attendance nor
+the archive has a record of the class on that date. Both checks are
+correlated EXISTS subqueries on the (class_schedule, date) indexes, so the
+whole report is one query over the occurrence range.
+"""
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from scheduling.models import ClassOccurrence
+from .models import ArchivedAttendance, Attendance
+
+
+def missing_attendance(start, end, faculty=None):
+    """
+    Non-cancelled occurrences in [start, end] (up to today) with no
+    attendance marked, optionally of one faculty's classes
+    """
+    end = min(end, timezone.localdate())
+    occurrences = ClassOccurrence.objects.filter(date__range=(start, end), is_cancelled=False)
+    if faculty is not None:
+        occurrences = occurrences.filter(class_schedule__faculty=faculty)
+    marked = {'class_schedule_id': OuterRef('class_schedule_id'), 'date': OuterRef('date')}
+    return occurrences.exclude(
+        Exists(Attendance.objects.filter(**marked))
+    ).exclude(
+        Exists(ArchivedAttendance.objects.filter(**marked))
+    ).select_related('class_schedule__subject', 'class_schedule__room').order_by('date', 'class_schedule__start_time')
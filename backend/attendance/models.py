@@ -23,6 +23,9 @@ class Attendance(models.Model):
     marked_by = models.ForeignKey(FacultyProfile, on_delete=models.CASCADE, related_name='marked_attendance')
     marked_at = models.DateTimeField(auto_now_add=True)
     notes = models.TextField(blank=True)
+    # Offline sync (see attendance.sync): the newest version wins
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     def __str__(self):
         return f"{self.student.user.get_full_name()} - {self.class_schedule.subject.name} - {self.date} ({self.status})"
@@ -43,6 +46,11 @@ class AttendanceSession(models.Model):
     end_time = models.TimeField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
     notes = models.TextField(blank=True)
+    # Student self check-in (see attendance.checkin)
+    check_in_code = models.CharField(max_length=12, blank=True, db_index=True)
+    check_in_expires_at = models.DateTimeField(null=True, blank=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     def __str__(self):
         return f"{self.faculty.user.get_full_name()} - {self.class_schedule.subject.name} - {self.date}"
@@ -52,6 +60,24 @@ class AttendanceSession(models.Model):
         ordering = ['-date', '-start_time']
 
 
+class SyncBatch(models.Model):
+    """
+    An offline sync batch already applied, kept so that a retried upload
+    with the same idempotency key gets the original response
+    """
+    faculty = models.ForeignKey(FacultyProfile, on_delete=models.CASCADE, related_name='sync_batches')
+    idempotency_key = models.CharField(max_length=64)
+    response = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.faculty} - {self.idempotency_key}"
+    
+    class Meta:
+        unique_together = ['faculty', 'idempotency_key']
+        ordering = ['-created_at']
+
+
 class AttendanceReport(models.Model):
     """
     Generated attendance reports
@@ -137,6 +163,9 @@ class AttendanceAlert(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['student', 'subject', 'is_resolved']),
+        ]
 
 
 class AttendanceStatistics(models.Model):
@@ -183,3 +212,81 @@ class BulkAttendance(models.Model):
     class Meta:
         unique_together = ['faculty', 'class_schedule', 'date']
         ordering = ['-date', '-created_at']
+
+
+class AttendanceRollup(models.Model):
+    """
+    Attendance counts of a student group in one subject over a day, week or
+    month, maintained incrementally for report generation
+    """
+    PERIOD_CHOICES = [
+        ('day', 'Day'),
+        ('week', 'Week'),
+        ('month', 'Month'),
+    ]
+    
+    group = models.ForeignKey(StudentGroup, on_delete=models.CASCADE, related_name='attendance_rollups')
+    subject = models.ForeignKey('scheduling.Subject', on_delete=models.CASCADE, related_name='attendance_rollups')
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField()  # the day, the Monday of the week or the 1st of the month
+    total = models.IntegerField(default=0)
+    present = models.IntegerField(default=0)
+    absent = models.IntegerField(default=0)
+    late = models.IntegerField(default=0)
+    excused = models.IntegerField(default=0)
+    half_day = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.group} - {self.subject.name} - {self.period} of {self.period_start}"
+    
+    class Meta:
+        unique_together = ['group', 'subject', 'period', 'period_start']
+        indexes = [models.Index(fields=['group', 'period', 'period_start'])]
+
+
+class AttendanceArchiveRoster(models.Model):
+    """
+    Packed student ids giving the order of archived statuses; shared by
+    every archived day of a class with the same students
+    """
+    class_schedule = models.ForeignKey(ClassSchedule, on_delete=models.CASCADE, related_name='archive_rosters')
+    digest = models.CharField(max_length=40)
+    student_ids = models.BinaryField()
+    
+    def __str__(self):
+        return f"{self.class_schedule} - {self.digest[:8]}"
+    
+    class Meta:
+        unique_together = ['class_schedule', 'digest']
+
+
+class ArchivedAttendance(models.Model):
+    """
+    Attendance of one class on one day moved out of Attendance: one status
+    code per roster student (see attendance.archive)
+    """
+    class_schedule = models.ForeignKey(ClassSchedule, on_delete=models.CASCADE, related_name='archived_attendance')
+    date = models.DateField()
+    roster = models.ForeignKey(AttendanceArchiveRoster, on_delete=models.PROTECT, related_name='days')
+    statuses = models.BinaryField()
+    marked_by = models.ForeignKey(FacultyProfile, on_delete=models.SET_NULL, related_name='archived_attendance', null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.class_schedule} - {self.date}"
+    
+    class Meta:
+        unique_together = ['class_schedule', 'date']
+        ordering = ['-date']
+
+
+class ArchivedAttendanceNote(models.Model):
+    """
+    Notes of archived attendance records, kept only for records that had any
+    """
+    archive = models.ForeignKey(ArchivedAttendance, on_delete=models.CASCADE, related_name='notes')
+    student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE, related_name='archived_attendance_notes')
+    notes = models.TextField()
+    
+    class Meta:
+        unique_together = ['archive', 'student']
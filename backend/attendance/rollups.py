@@ -0,0 +1,261 @@
+"""
+Materialized attendance rollups for report generation.
+
+Attendance is counted per student group, subject and day, and the same
+counts are kept per ISO week and per calendar month. An Attendance record
+counts towards every group that both takes the class and contains the
+student. The rollups are maintained from the attendance change stream (see
+attendance.changes) and can be rebuilt for any range with backfill(), which
+reads the attendance archive as well.
+
+A report period is covered greedily by whole months, then whole weeks, then
+single days, so a semester summary reads a few rows per subject instead of
+every Attendance row in the range.
+"""
+import datetime
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q
+
+from scheduling.models import ClassSchedule, GroupSchedule, StudentGroup
+from .archive import archived_record_chunks
+from .changes import apply_counter_deltas
+from .models import ArchivedAttendance, Attendance, AttendanceReport, AttendanceRollup
+
+
+COUNTERS = ('total', 'present', 'absent', 'late', 'excused', 'half_day')
+STATUSES = COUNTERS[1:]
+ATTENDED = ('present', 'late', 'half_day')
+KEY_FIELDS = ('group_id', 'subject_id', 'period', 'period_start')
+
+
+def week_start(day):
+    return day - datetime.timedelta(days=day.weekday())
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def month_end(day):
+    following = (day.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    return following - datetime.timedelta(days=1)
+
+
+def _periods(day):
+    return (('day', day), ('week', week_start(day)), ('month', month_start(day)))
+
+
+def _status_counts(status):
+    return tuple(1 if counter == 'total' or counter == status else 0 for counter in COUNTERS)
+
+
+def _class_groups(pairs):
+    """
+    {(student_id, class_schedule_id): group ids} for the groups that
+    currently take each class and contain the student
+    """
+    class_ids = {class_schedule_id for _, class_schedule_id in pairs}
+    student_ids = {student_id for student_id, _ in pairs}
+    groups_by_class = defaultdict(set)
+    for class_schedule_id, group_id in GroupSchedule.objects.filter(
+        class_schedule_id__in=class_ids, is_active=True
+    ).values_list('class_schedule_id', 'group_id'):
+        groups_by_class[class_schedule_id].add(group_id)
+    group_ids = set().union(*groups_by_class.values()) if groups_by_class else set()
+    memberships = set(StudentGroup.students.through.objects.filter(
+        studentgroup_id__in=group_ids, studentprofile_id__in=student_ids
+    ).values_list('studentprofile_id', 'studentgroup_id'))
+    return {
+        (student_id, class_schedule_id): [
+            group_id for group_id in groups_by_class[class_schedule_id] if (student_id, group_id) in memberships
+        ]
+        for student_id, class_schedule_id in pairs
+    }
+
+
+def record_changes(changes):
+    """
+    Apply the rollup deltas of a batch of Attendance changes
+    """
+    subjects = dict(
+        ClassSchedule.objects.filter(id__in={change[1] for change in changes}).values_list('id', 'subject_id')
+    )
+    groups = _class_groups({(change[0], change[1]) for change in changes})
+    deltas = defaultdict(lambda: [0] * len(COUNTERS))
+    for student_id, class_schedule_id, date, old_status, new_status in changes:
+        for status, sign in ((old_status, -1), (new_status, 1)):
+            if status is None:
+                continue
+            counts = _status_counts(status)
+            for group_id in groups[(student_id, class_schedule_id)]:
+                for period, start in _periods(date):
+                    delta = deltas[(group_id, subjects[class_schedule_id], period, start)]
+                    for index, count in enumerate(counts):
+                        delta[index] += sign * count
+    apply_counter_deltas(AttendanceRollup, KEY_FIELDS, COUNTERS, deltas)
+
+
+def _backfill_range(start, end):
+    """
+    Widen [start, end] so that it covers every week and month it touches
+    """
+    first = week_start(month_start(start))
+    last_day = month_end(end)
+    last = week_start(last_day) + datetime.timedelta(days=6)
+    return first, last
+
+
+@transaction.atomic
+def backfill(start=None, end=None):
+    """
+    Rebuild the rollups from Attendance, for every day or for the weeks and
+    months touching [start, end]. Returns the number of rollup rows written.
+    """
+    attendance = Attendance.objects.all()
+    rollups = AttendanceRollup.objects.all()
+    months = first = last = None
+    if start is not None or end is not None:
+        dates = [
+            day for model in (Attendance, ArchivedAttendance)
+            for day in model.objects.aggregate(first=Min('date'), last=Max('date')).values()
+            if day is not None
+        ]
+        if not dates:
+            return 0
+        start = start or min(dates)
+        end = end or max(dates)
+        first, last = _backfill_range(start, end)
+        months = (month_start(start), month_start(end))
+        attendance = attendance.filter(date__range=(first, last))
+        rollups = rollups.filter(
+            Q(period__in=['day', 'week'], period_start__range=(first, last))
+            | Q(period='month', period_start__range=months)
+        )
+
+    daily = attendance.filter(
+        class_schedule__group_schedules__is_active=True,
+        class_schedule__group_schedules__group__students=F('student'),
+    ).values(
+        'class_schedule__group_schedules__group_id', 'class_schedule__subject_id', 'date'
+    ).annotate(
+        total=Count('id'),
+        **{status: Count('id', filter=Q(status=status)) for status in STATUSES}
+    ).order_by()
+
+    counts = defaultdict(lambda: [0] * len(COUNTERS))
+
+    def add(group_id, subject_id, date, values):
+        for period, period_start in _periods(date):
+            # The widened range only holds whole weeks, and the months at
+            # its edges are partial
+            if period == 'month' and months is not None and not months[0] <= period_start <= months[1]:
+                continue
+            total = counts[(group_id, subject_id, period, period_start)]
+            for index, value in enumerate(values):
+                total[index] += value
+
+    for row in daily:
+        add(
+            row['class_schedule__group_schedules__group_id'], row['class_schedule__subject_id'], row['date'],
+            [row[counter] for counter in COUNTERS],
+        )
+    subjects = dict(ClassSchedule.objects.values_list('id', 'subject_id'))
+    for chunk in archived_record_chunks(first, last):
+        groups = _class_groups({(student_id, class_schedule_id) for student_id, class_schedule_id, _, _ in chunk})
+        for student_id, class_schedule_id, date, status in chunk:
+            for group_id in groups[(student_id, class_schedule_id)]:
+                add(group_id, subjects[class_schedule_id], date, _status_counts(status))
+
+    rollups.delete()
+    AttendanceRollup.objects.bulk_create(
+        [
+            AttendanceRollup(**dict(zip(KEY_FIELDS, key)), **dict(zip(COUNTERS, values)))
+            for key, values in counts.items()
+        ],
+        batch_size=500,
+    )
+    return len(counts)
+
+
+def _cover_weeks(cover, start, end):
+    day = start
+    while day <= end:
+        if day.weekday() == 0 and day + datetime.timedelta(days=6) <= end:
+            cover['week'].append(day)
+            day += datetime.timedelta(days=7)
+        else:
+            cover['day'].append(day)
+            day += datetime.timedelta(days=1)
+
+
+def cover_period(start, end):
+    """
+    Split [start, end] into whole months, and the remainder at either end
+    into whole weeks and single days; returns {period: [period_start, ...]}
+    """
+    cover = {'day': [], 'week': [], 'month': []}
+    month = start if start.day == 1 else month_end(start) + datetime.timedelta(days=1)
+    first_month = month
+    while month_end(month) <= end:
+        cover['month'].append(month)
+        month = month_end(month) + datetime.timedelta(days=1)
+    if not cover['month']:
+        _cover_weeks(cover, start, end)
+        return cover
+    _cover_weeks(cover, start, first_month - datetime.timedelta(days=1))
+    _cover_weeks(cover, month, end)
+    return cover
+
+
+def _rates(counts):
+    attended = sum(counts[status] for status in ATTENDED)
+    counted = counts['total'] - counts['excused']
+    counts['attended'] = attended
+    counts['attendance_percentage'] = round(attended * 100 / counted, 2) if counted > 0 else 0
+    return counts
+
+
+def build_summary(group, start_date, end_date):
+    """
+    Attendance summary of a group over [start_date, end_date], per subject
+    and overall, assembled from rollup rows
+    """
+    cover = cover_period(start_date, end_date)
+    rows = AttendanceRollup.objects.filter(group=group).filter(
+        Q(period='month', period_start__in=cover['month'])
+        | Q(period='week', period_start__in=cover['week'])
+        | Q(period='day', period_start__in=cover['day'])
+    ).values_list('subject_id', 'subject__code', 'subject__name', *COUNTERS)
+
+    subjects = {}
+    overall = dict.fromkeys(COUNTERS, 0)
+    for subject_id, code, name, *values in rows:
+        subject = subjects.setdefault(subject_id, dict(
+            {'subject_id': subject_id, 'code': code, 'name': name}, **dict.fromkeys(COUNTERS, 0)
+        ))
+        for counter, value in zip(COUNTERS, values):
+            subject[counter] += value
+            overall[counter] += value
+    return {
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'overall': _rates(overall),
+        'subjects': [_rates(subject) for subject in sorted(subjects.values(), key=lambda row: row['code'])],
+    }
+
+
+def generate_report(group, start_date, end_date, generated_by, report_type='custom', name=''):
+    """
+    Create an AttendanceReport whose summary_data comes from the rollups
+    """
+    return AttendanceReport.objects.create(
+        name=name or f"{group} {start_date} to {end_date}",
+        report_type=report_type,
+        student_group=group,
+        start_date=start_date,
+        end_date=end_date,
+        generated_by=generated_by,
+        summary_data=build_summary(group, start_date, end_date),
+    )
@@ -0,0 +1,102 @@
+from django.conf import settings
+from rest_framework import serializers
+
+from accounts.models import Department
+from scheduling.models import ClassSchedule, StudentGroup
+from .models import Attendance, AttendanceReport, AttendanceStatistics
+
+
+class BulkAttendanceSubmitSerializer(serializers.Serializer):
+    class_schedule = serializers.PrimaryKeyRelatedField(
+        queryset=ClassSchedule.objects.filter(is_active=True)
+    )
+    date = serializers.DateField()
+    attendance_data = serializers.DictField()
+
+
+class AttendanceStatisticsSerializer(serializers.ModelSerializer):
+    subject_name = serializers.CharField(source='subject.name', read_only=True)
+    subject_code = serializers.CharField(source='subject.code', read_only=True)
+
+    class Meta:
+        model = AttendanceStatistics
+        fields = '__all__'
+
+
+class AttendanceReportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AttendanceReport
+        fields = '__all__'
+        read_only_fields = ['generated_by', 'file_path', 'summary_data']
+
+
+class AttendanceReportRequestSerializer(serializers.Serializer):
+    student_group = serializers.PrimaryKeyRelatedField(queryset=StudentGroup.objects.all())
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    report_type = serializers.ChoiceField(choices=AttendanceReport.REPORT_TYPE_CHOICES, default='custom')
+    name = serializers.CharField(max_length=100, required=False, default='')
+
+    def validate(self, attrs):
+        if attrs['start_date'] > attrs['end_date']:
+            raise serializers.ValidationError('start_date must not be after end_date.')
+        return attrs
+
+
+class SyncSessionSerializer(serializers.Serializer):
+    class_schedule = serializers.IntegerField(min_value=1)
+    date = serializers.DateField()
+    is_active = serializers.BooleanField(default=True)
+    end_time = serializers.TimeField(required=False, allow_null=True, default=None)
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+    version = serializers.IntegerField(min_value=0)
+
+
+class SyncAttendanceSerializer(serializers.Serializer):
+    student = serializers.IntegerField(min_value=1)
+    class_schedule = serializers.IntegerField(min_value=1)
+    date = serializers.DateField()
+    status = serializers.ChoiceField(choices=Attendance.STATUS_CHOICES)
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+    version = serializers.IntegerField(min_value=0)
+
+
+class AttendanceSyncSerializer(serializers.Serializer):
+    idempotency_key = serializers.CharField(max_length=64)
+    cursor = serializers.CharField(required=False, allow_null=True, allow_blank=True, default=None)
+    sessions = SyncSessionSerializer(many=True, required=False, default=list)
+    attendance = SyncAttendanceSerializer(many=True, required=False, default=list)
+
+    def validate(self, attrs):
+        limit = getattr(settings, 'ATTENDANCE_SYNC_MAX_RECORDS', 5000)
+        if len(attrs['sessions']) + len(attrs['attendance']) > limit:
+            raise serializers.ValidationError(f'A batch may hold at most {limit} records.')
+        return attrs
+
+
+class CheckInSerializer(serializers.Serializer):
+    code = serializers.CharField(max_length=12)
+
+
+class HeatmapQuerySerializer(serializers.Serializer):
+    group = serializers.PrimaryKeyRelatedField(queryset=StudentGroup.objects.all(), required=False)
+    department = serializers.PrimaryKeyRelatedField(queryset=Department.objects.all(), required=False)
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+
+    def validate(self, attrs):
+        if ('group' in attrs) == ('department' in attrs):
+            raise serializers.ValidationError('Give either group or department.')
+        if attrs['start_date'] > attrs['end_date']:
+            raise serializers.ValidationError('start_date must not be after end_date.')
+        return attrs
+
+
+class MissingAttendanceQuerySerializer(serializers.Serializer):
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+
+    def validate(self, attrs):
+        if attrs['start_date'] > attrs['end_date']:
+            raise serializers.ValidationError('start_date must not be after end_date.')
+        return attrs
@@ -0,0 +1,32 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .changes import record_changes
+from .models import Attendance
+
+
+@receiver(pre_save, sender=Attendance)
+def attendance_saving(sender, instance, **kwargs):
+    instance._previous_mark = None
+    if instance.pk is not None:
+        instance._previous_mark = Attendance.objects.filter(pk=instance.pk).values_list(
+            'student_id', 'class_schedule_id', 'date', 'status'
+        ).first()
+
+
+@receiver(post_save, sender=Attendance)
+def attendance_saved(sender, instance, **kwargs):
+    key = (instance.student_id, instance.class_schedule_id, instance.date)
+    changes = [key + (None, instance.status)]
+    previous = getattr(instance, '_previous_mark', None)
+    if previous is not None:
+        if previous[:3] == key:
+            changes = [key + (previous[3], instance.status)]
+        else:
+            changes.append(previous + (None,))
+    record_changes(changes)
+
+
+@receiver(post_delete, sender=Attendance)
+def attendance_deleted(sender, instance, **kwargs):
+    record_changes([(instance.student_id, instance.class_schedule_id, instance.date, instance.status, None)])
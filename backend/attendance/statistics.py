@@ -0,0 +1,172 @@
+"""
+Incremental maintenance of AttendanceStatistics.
+
+Every change to an Attendance row is turned into a per-status delta on its
+(student, subject) statistics row. Deltas for many rows are grouped so that
+all rows receiving the same delta are updated with a single F() expression
+UPDATE, and attendance percentages are then recomputed in SQL for just the
+touched rows. Changes arrive through attendance.changes. rebuild() recomputes
+the whole table from Attendance and the attendance archive and reports how
+far it had drifted.
+"""
+from collections import defaultdict, namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, FloatField, Q, Value, When
+from django.db.models.functions import Cast, Round
+
+from scheduling.models import ClassSchedule, Subject
+from .archive import archived_records
+from .changes import apply_counter_deltas, lock_classes
+from .models import Attendance, AttendanceStatistics
+
+
+COUNTERS = ('total_classes', 'classes_attended', 'classes_absent', 'classes_late', 'classes_excused')
+
+# Contribution of one record of each status to COUNTERS. Late and half-day
+# classes count as attended; excused classes are left out of the percentage.
+STATUS_COUNTS = {
+    'present': (1, 1, 0, 0, 0),
+    'late': (1, 1, 0, 1, 0),
+    'half_day': (1, 1, 0, 0, 0),
+    'absent': (1, 0, 1, 0, 0),
+    'excused': (1, 0, 0, 0, 1),
+}
+ATTENDED_STATUSES = [status for status, counts in STATUS_COUNTS.items() if counts[1]]
+
+Drift = namedtuple('Drift', ['missing', 'stale', 'orphaned', 'rows'])
+
+
+def _percentage():
+    """
+    SQL expression for attendance_percentage from the counters
+    """
+    counted = F('total_classes') - F('classes_excused')
+    ratio = ExpressionWrapper(F('classes_attended') * 100.0 / counted, output_field=FloatField())
+    return Case(
+        When(total_classes__gt=F('classes_excused'), then=Cast(Round(ratio, 2), DecimalField(max_digits=5, decimal_places=2))),
+        default=Value(0, output_field=DecimalField(max_digits=5, decimal_places=2)),
+    )
+
+
+def percentage(attended, total, excused):
+    counted = total - excused
+    if counted <= 0:
+        return Decimal('0.00')
+    return (Decimal(attended * 100) / counted).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def record_changes(changes):
+    """
+    Apply the statistics deltas of a batch of Attendance changes (see
+    attendance.changes)
+    """
+    subjects = dict(
+        ClassSchedule.objects.filter(id__in={change[1] for change in changes}).values_list('id', 'subject_id')
+    )
+    deltas = defaultdict(lambda: [0] * len(COUNTERS))
+    for student_id, class_schedule_id, _, old_status, new_status in changes:
+        delta = deltas[(student_id, subjects[class_schedule_id])]
+        for status, sign in ((old_status, -1), (new_status, 1)):
+            if status is not None:
+                for index, count in enumerate(STATUS_COUNTS[status]):
+                    delta[index] += sign * count
+    ids = apply_counter_deltas(AttendanceStatistics, ('student_id', 'subject_id'), COUNTERS, deltas)
+    if ids:
+        AttendanceStatistics.objects.filter(id__in=ids).update(attendance_percentage=_percentage())
+
+
+def _true_counts(subject_ids):
+    """
+    {(student_id, subject_id): counters} of the given subjects computed from
+    Attendance in one grouped query, plus the archived records
+    """
+    rows = Attendance.objects.filter(class_schedule__subject_id__in=subject_ids).values(
+        'student_id', 'class_schedule__subject_id'
+    ).annotate(
+        total=Count('id'),
+        attended=Count('id', filter=Q(status__in=ATTENDED_STATUSES)),
+        absent=Count('id', filter=Q(status='absent')),
+        late=Count('id', filter=Q(status='late')),
+        excused=Count('id', filter=Q(status='excused')),
+    ).order_by()
+    counts = {
+        (row['student_id'], row['class_schedule__subject_id']): [
+            row['total'], row['attended'], row['absent'], row['late'], row['excused']
+        ]
+        for row in rows
+    }
+    subjects = dict(ClassSchedule.objects.filter(subject_id__in=subject_ids).values_list('id', 'subject_id'))
+    for student_id, class_schedule_id, _, status in archived_records(class_schedule_ids=list(subjects)):
+        total = counts.setdefault((student_id, subjects[class_schedule_id]), [0] * len(COUNTERS))
+        for index, count in enumerate(STATUS_COUNTS[status]):
+            total[index] += count
+    return {key: tuple(values) for key, values in counts.items()}
+
+
+@transaction.atomic
+def _rebuild_subjects(subject_ids, dry_run):
+    """
+    Recompute the statistics rows of some subjects; returns their Drift
+    """
+    if not dry_run:
+        # record_changes() takes the same locks before applying deltas, so
+        # none can commit between reading the truth and replacing the rows
+        lock_classes(ClassSchedule.objects.filter(subject_id__in=subject_ids).values_list('id', flat=True))
+    truth = _true_counts(subject_ids)
+    stored = {
+        (student_id, subject_id): (pk, tuple(counts), stored_percentage)
+        for student_id, subject_id, pk, stored_percentage, *counts in AttendanceStatistics.objects.filter(
+            subject_id__in=subject_ids
+        ).values_list('student_id', 'subject_id', 'id', 'attendance_percentage', *COUNTERS)
+    }
+    missing = {key for key in truth if key not in stored}
+    stale = {
+        key for key, counts in truth.items()
+        if key in stored and (
+            stored[key][1] != counts
+            or stored[key][2] != percentage(counts[1], counts[0], counts[4])
+        )
+    }
+    orphaned = [row[0] for key, row in stored.items() if key not in truth]
+    drift = Drift(len(missing), len(stale), len(orphaned), len(truth))
+    if dry_run:
+        return drift
+
+    AttendanceStatistics.objects.filter(id__in=orphaned).delete()
+    AttendanceStatistics.objects.bulk_create(
+        [
+            AttendanceStatistics(
+                student_id=student_id,
+                subject_id=subject_id,
+                attendance_percentage=percentage(counts[1], counts[0], counts[4]),
+                **dict(zip(COUNTERS, counts))
+            )
+            for (student_id, subject_id), counts in truth.items()
+            if (student_id, subject_id) in missing or (student_id, subject_id) in stale
+        ],
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['student', 'subject'],
+        update_fields=list(COUNTERS) + ['attendance_percentage'],
+    )
+    return drift
+
+
+def rebuild(dry_run=False):
+    """
+    Recompute AttendanceStatistics from Attendance and the archive and
+    return the Drift between the stored rows and the truth. Subjects are
+    processed ATTENDANCE_REBUILD_SUBJECTS at a time, each batch in its own
+    transaction holding the locks of its classes, so memory does not grow
+    with the size of the table. With dry_run nothing is written.
+    """
+    subject_ids = list(Subject.objects.order_by('id').values_list('id', flat=True))
+    size = getattr(settings, 'ATTENDANCE_REBUILD_SUBJECTS', 50)
+    total = Drift(0, 0, 0, 0)
+    for index in range(0, len(subject_ids), size):
+        drift = _rebuild_subjects(subject_ids[index:index + size], dry_run)
+        total = Drift(*(a + b for a, b in zip(total, drift)))
+    return total
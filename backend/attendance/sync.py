@@ -0,0 +1,269 @@
+"""
+Offline-first attendance sync.
+
+Faculty devices queue AttendanceSession and Attendance edits while offline
+and upload them in batches. Records are identified by their natural keys -
+(class_schedule, date) for a session of the signed-in faculty and (student,
+class_schedule, date) for a mark - and carry a version that grows with every
+edit (the device's clock in milliseconds; server-side writes use
+changes.version_clock()). A record is applied only if its version is newer
+than the stored one, so the last writer wins whatever order batches arrive
+in; older records are returned as conflicts with the server's copy. The
+classes of a batch are locked while it is applied, so batches that touch
+the same records compare versions one after the other.
+
+Every batch carries a client-generated idempotency key. The batch is applied
+in one transaction together with a SyncBatch row holding the response, so a
+retried upload is answered from that row instead of being applied twice.
+
+The response also carries everything that changed on the server since the
+client's cursor, as compact {"fields": [...], "rows": [[...], ...]} tables,
+and the cursor to send next time. A cursor is a server timestamp in
+microseconds; changes are read from ATTENDANCE_SYNC_CURSOR_OVERLAP seconds
+before it so that transactions committing late are not missed, which means a
+client can receive a record it already has and should compare versions.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from scheduling.models import ClassSchedule
+from .changes import lock_classes, record_changes
+from .ingestion import class_roster
+from .models import Attendance, AttendanceSession, SyncBatch
+
+
+SESSION_FIELDS = ['class_schedule', 'date', 'is_active', 'end_time', 'notes', 'version']
+ATTENDANCE_FIELDS = ['student', 'class_schedule', 'date', 'status', 'notes', 'version']
+
+
+class SyncError(Exception):
+    """
+    A batch that cannot be applied; errors maps each offending record (or
+    field) to a message
+    """
+
+    def __init__(self, errors):
+        super().__init__('; '.join(f'{key}: {message}' for key, message in errors.items()))
+        self.errors = errors
+
+
+def encode_cursor(moment):
+    return str(int(moment.timestamp() * 1_000_000))
+
+
+def decode_cursor(cursor):
+    try:
+        return datetime.datetime.fromtimestamp(int(cursor) / 1_000_000, tz=datetime.timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise SyncError({'cursor': 'Invalid cursor.'})
+
+
+def _session_key(record):
+    return (record['class_schedule'], record['date'])
+
+
+def _attendance_key(record):
+    return (record['student'], record['class_schedule'], record['date'])
+
+
+def _newest(records, key):
+    """
+    The newest version of each record in a batch, by key
+    """
+    newest = {}
+    for record in records:
+        current = newest.get(key(record))
+        if current is None or record['version'] > current['version']:
+            newest[key(record)] = record
+    return newest
+
+
+def _row(values):
+    return [value.isoformat() if isinstance(value, (datetime.date, datetime.time)) else value for value in values]
+
+
+def _check_classes(faculty, sessions, attendance):
+    """
+    Make sure every record belongs to a class the faculty teaches, on a day
+    it meets, and every mark to a student on its roster
+    """
+    class_ids = {key[0] for key in sessions} | {key[1] for key in attendance}
+    days = dict(ClassSchedule.objects.filter(id__in=class_ids, faculty=faculty).values_list('id', 'day'))
+    errors = {}
+    for class_schedule_id in sorted(class_ids - days.keys()):
+        errors[f'class_schedule {class_schedule_id}'] = 'You do not teach this class.'
+    for class_schedule_id, date in set(sessions) | {key[1:] for key in attendance}:
+        if class_schedule_id in days and date.strftime('%A').lower() != days[class_schedule_id]:
+            errors[f'class_schedule {class_schedule_id} on {date}'] = f'The class does not meet on {date:%A}s.'
+    rosters = {
+        class_schedule_id: set(class_roster(class_schedule_id)[0].values())
+        for class_schedule_id in {key[1] for key in attendance} & days.keys()
+    }
+    for student_id, class_schedule_id, date in attendance:
+        if class_schedule_id in rosters and student_id not in rosters[class_schedule_id]:
+            errors[f'student {student_id} in class_schedule {class_schedule_id}'] = 'Student is not on the class roster.'
+    if errors:
+        raise SyncError(errors)
+
+
+def _apply_sessions(faculty, sessions):
+    """
+    Write the sessions newer than the stored ones; returns the stored copies
+    of the rest
+    """
+    if not sessions:
+        return []
+    stored = {
+        (values[0], values[1]): values
+        for values in AttendanceSession.objects.select_for_update().filter(
+            faculty=faculty,
+            class_schedule_id__in={key[0] for key in sessions},
+            date__in={key[1] for key in sessions},
+        ).values_list('class_schedule_id', 'date', 'is_active', 'end_time', 'notes', 'version')
+    }
+    winners = [
+        record for key, record in sessions.items() if key not in stored or record['version'] > stored[key][-1]
+    ]
+    AttendanceSession.objects.bulk_create(
+        [
+            AttendanceSession(
+                faculty=faculty,
+                class_schedule_id=record['class_schedule'],
+                date=record['date'],
+                is_active=record['is_active'],
+                end_time=record['end_time'],
+                notes=record['notes'],
+                version=record['version'],
+            )
+            for record in winners
+        ],
+        batch_size=getattr(settings, 'ATTENDANCE_BULK_BATCH_SIZE', 500),
+        update_conflicts=True,
+        unique_fields=['faculty', 'class_schedule', 'date'],
+        update_fields=['is_active', 'end_time', 'notes', 'version', 'updated_at'],
+    )
+    return [_row(stored[key]) for key, record in sessions.items() if key in stored and record['version'] <= stored[key][-1]]
+
+
+def _apply_attendance(faculty, attendance):
+    """
+    Write the marks newer than the stored ones and feed the status changes
+    to the derived tables; returns the stored copies of the rest
+    """
+    if not attendance:
+        return []
+    stored = {
+        values[:3]: values
+        for values in Attendance.objects.select_for_update().filter(
+            student_id__in={key[0] for key in attendance},
+            class_schedule_id__in={key[1] for key in attendance},
+            date__in={key[2] for key in attendance},
+        ).values_list('student_id', 'class_schedule_id', 'date', 'status', 'notes', 'version')
+    }
+    winners = [
+        record for key, record in attendance.items() if key not in stored or record['version'] > stored[key][-1]
+    ]
+    Attendance.objects.bulk_create(
+        [
+            Attendance(
+                student_id=record['student'],
+                class_schedule_id=record['class_schedule'],
+                date=record['date'],
+                status=record['status'],
+                marked_by=faculty,
+                notes=record['notes'],
+                version=record['version'],
+            )
+            for record in winners
+        ],
+        batch_size=getattr(settings, 'ATTENDANCE_BULK_BATCH_SIZE', 500),
+        update_conflicts=True,
+        unique_fields=['student', 'class_schedule', 'date'],
+        update_fields=['status', 'marked_by', 'notes', 'version', 'updated_at'],
+    )
+    record_changes([
+        (
+            record['student'], record['class_schedule'], record['date'],
+            stored[_attendance_key(record)][3] if _attendance_key(record) in stored else None,
+            record['status'],
+        )
+        for record in winners
+    ])
+    return [
+        _row(stored[key]) for key, record in attendance.items() if key in stored and record['version'] <= stored[key][-1]
+    ]
+
+
+def _changes_since(faculty, since, sent):
+    """
+    Sessions and marks of the faculty's classes changed since a cursor,
+    within the last ATTENDANCE_SYNC_WINDOW_DAYS days, leaving out the
+    records the client has just sent
+    """
+    window = timezone.localdate() - datetime.timedelta(days=getattr(settings, 'ATTENDANCE_SYNC_WINDOW_DAYS', 14))
+    sessions = AttendanceSession.objects.filter(faculty=faculty, date__gte=window)
+    attendance = Attendance.objects.filter(class_schedule__faculty=faculty, date__gte=window)
+    if since is not None:
+        since -= datetime.timedelta(seconds=getattr(settings, 'ATTENDANCE_SYNC_CURSOR_OVERLAP', 5))
+        sessions = sessions.filter(updated_at__gt=since)
+        attendance = attendance.filter(updated_at__gt=since)
+    session_rows = sessions.values_list(
+        'class_schedule_id', 'date', 'is_active', 'end_time', 'notes', 'version'
+    ).order_by()
+    attendance_rows = attendance.values_list(
+        'student_id', 'class_schedule_id', 'date', 'status', 'notes', 'version'
+    ).order_by()
+    return {
+        'sessions': {
+            'fields': SESSION_FIELDS,
+            'rows': [_row(values) for values in session_rows if ('session', values[:2], values[-1]) not in sent],
+        },
+        'attendance': {
+            'fields': ATTENDANCE_FIELDS,
+            'rows': [_row(values) for values in attendance_rows if ('attendance', values[:3], values[-1]) not in sent],
+        },
+    }
+
+
+@transaction.atomic
+def sync(faculty, idempotency_key, sessions=(), attendance=(), cursor=None):
+    """
+    Apply a batch of offline edits for a faculty and return the response
+    dict: the number of records applied, the server copies of the records
+    that lost, the server changes since cursor and the next cursor. A batch
+    whose idempotency key was already applied gets its original response.
+    """
+    try:
+        with transaction.atomic():
+            batch = SyncBatch.objects.create(faculty=faculty, idempotency_key=idempotency_key)
+    except IntegrityError:
+        return SyncBatch.objects.get(faculty=faculty, idempotency_key=idempotency_key).response
+    since = decode_cursor(cursor) if cursor else None
+
+    sessions = _newest(sessions, _session_key)
+    attendance = _newest(attendance, _attendance_key)
+    _check_classes(faculty, sessions, attendance)
+    # Versions are compared, and replaced statuses read, only once the
+    # classes are locked, so concurrent batches for them apply one by one
+    lock_classes({key[0] for key in sessions} | {key[1] for key in attendance})
+    now = timezone.now()
+    session_conflicts = _apply_sessions(faculty, sessions)
+    attendance_conflicts = _apply_attendance(faculty, attendance)
+    sent = {('session', key, record['version']) for key, record in sessions.items()}
+    sent |= {('attendance', key, record['version']) for key, record in attendance.items()}
+
+    response = {
+        'applied': len(sessions) + len(attendance) - len(session_conflicts) - len(attendance_conflicts),
+        'conflicts': {
+            'sessions': {'fields': SESSION_FIELDS, 'rows': session_conflicts},
+            'attendance': {'fields': ATTENDANCE_FIELDS, 'rows': attendance_conflicts},
+        },
+        'changes': _changes_since(faculty, since, sent),
+        'cursor': encode_cursor(now),
+    }
+    batch.response = response
+    batch.save(update_fields=['response'])
+    return response
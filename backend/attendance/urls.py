@@ -0,0 +1,29 @@
+from django.urls import path
+from . import views
+
+app_name = 'attendance'
+
+urlpatterns = [
+    # Bulk attendance
+    path('bulk/', views.BulkAttendanceSubmitView.as_view(), name='bulk_attendance_submit'),
+
+    # Offline sync
+    path('sync/', views.AttendanceSyncView.as_view(), name='attendance_sync'),
+
+    # Self check-in
+    path('sessions/<int:pk>/check-in/', views.CheckInCodeView.as_view(), name='check_in_code'),
+    path('check-in/', views.StudentCheckInView.as_view(), name='student_check_in'),
+
+    # Missing attendance
+    path('missing/', views.MissingAttendanceView.as_view(), name='missing_attendance'),
+
+    # Statistics
+    path('statistics/', views.AttendanceStatisticsView.as_view(), name='attendance_statistics'),
+
+    # Analytics
+    path('heatmaps/', views.AttendanceHeatmapView.as_view(), name='attendance_heatmaps'),
+
+    # Reports
+    path('reports/', views.AttendanceReportCreateView.as_view(), name='attendance_report_create'),
+    path('reports/<int:pk>/export/', views.AttendanceReportExportView.as_view(), name='attendance_report_export'),
+]
@@ -0,0 +1,250 @@
+import io
+import zlib
+
+from django.conf import settings
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.decorators.gzip import gzip_page
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from accounts.models import StudentProfile
+from accounts.views import IsAdminUser, IsFacultyUser, IsStudentUser
+from campus_ecosystem.exports import FORMATS, file_response
+from scheduling.serializers import ClassOccurrenceSerializer
+from .checkin import CheckInError, check_in, close_check_in, open_check_in
+from .exports import attendance_report_response, export_attendance_report
+from .heatmaps import get_heatmaps
+from .ingestion import AttendanceIngestionError, ingest_bulk_attendance
+from .missing import missing_attendance
+from .models import AttendanceReport, AttendanceSession, AttendanceStatistics, BulkAttendance
+from .rollups import generate_report
+from .serializers import (
+    BulkAttendanceSubmitSerializer, AttendanceStatisticsSerializer, AttendanceReportSerializer,
+    AttendanceReportRequestSerializer, AttendanceSyncSerializer, CheckInSerializer, HeatmapQuerySerializer,
+    MissingAttendanceQuerySerializer
+)
+from .sync import SyncError, sync
+
+
+class GzipJSONParser(JSONParser):
+    """
+    JSON parser that also accepts bodies sent with Content-Encoding: gzip,
+    up to ATTENDANCE_SYNC_MAX_BYTES once decompressed
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = (parser_context or {}).get('request')
+        if request is None or request.META.get('HTTP_CONTENT_ENCODING', '').lower() != 'gzip':
+            return super().parse(stream, media_type, parser_context)
+        limit = getattr(settings, 'ATTENDANCE_SYNC_MAX_BYTES', 10 * 1024 * 1024)
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = decompressor.decompress(stream.read(), limit + 1)
+        except zlib.error as exc:
+            raise ParseError(f'Invalid gzip body - {exc}')
+        if len(body) > limit or decompressor.unconsumed_tail:
+            raise ParseError('Request body is too large.')
+        return super().parse(io.BytesIO(body), media_type, parser_context)
+
+
+class BulkAttendanceSubmitView(APIView):
+    """
+    Submit a whole class's attendance in one request
+    """
+    permission_classes = [IsFacultyUser]
+
+    def post(self, request):
+        serializer = BulkAttendanceSubmitSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        faculty = request.user.faculty_profile
+        class_schedule = data['class_schedule']
+        if class_schedule.faculty_id != faculty.pk:
+            return Response({'error': 'You do not teach this class.'}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            with transaction.atomic():
+                bulk, _ = BulkAttendance.objects.update_or_create(
+                    faculty=faculty,
+                    class_schedule=class_schedule,
+                    date=data['date'],
+                    defaults={'attendance_data': data['attendance_data'], 'is_verified': False},
+                )
+                result = ingest_bulk_attendance(bulk)
+        except AttendanceIngestionError as exc:
+            return Response({'errors': exc.errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'id': bulk.pk,
+            'written': result.written,
+            'missing_students': result.missing,
+        }, status=status.HTTP_201_CREATED)
+
+
+class AttendanceStatisticsView(APIView):
+    """
+    Per-subject attendance statistics of a student: the signed-in student,
+    or ?student=<id> for faculty and admins
+    """
+    def get(self, request):
+        if request.user.role == 'student':
+            student = get_object_or_404(StudentProfile, user=request.user)
+        elif request.user.role in ('faculty', 'admin'):
+            student_id = request.query_params.get('student', '')
+            if not student_id.isdigit():
+                return Response({'error': 'student is required.'}, status=status.HTTP_400_BAD_REQUEST)
+            student = get_object_or_404(StudentProfile, pk=student_id)
+        else:
+            return Response({'error': 'Not allowed.'}, status=status.HTTP_403_FORBIDDEN)
+        rows = AttendanceStatistics.objects.filter(student=student).select_related('subject')
+        return Response(AttendanceStatisticsSerializer(rows, many=True).data)
+
+
+class AttendanceReportCreateView(APIView):
+    """
+    Generate an attendance report for a student group over a period
+    """
+    permission_classes = [IsFacultyUser]
+
+    def post(self, request):
+        serializer = AttendanceReportRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        report = generate_report(
+            data['student_group'],
+            data['start_date'],
+            data['end_date'],
+            request.user.faculty_profile,
+            report_type=data['report_type'],
+            name=data['name'],
+        )
+        return Response(AttendanceReportSerializer(report).data, status=status.HTTP_201_CREATED)
+
+
+class AttendanceReportExportView(APIView):
+    """
+    Download an attendance report: ?export_format=csv is streamed as it is
+    read, xlsx is written to a file first and its path recorded on the report
+    """
+    permission_classes = [IsFacultyUser]
+
+    def get(self, request, pk):
+        report = get_object_or_404(AttendanceReport, pk=pk)
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in FORMATS:
+            return Response(
+                {'error': f"export_format must be one of {', '.join(FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if export_format == 'csv':
+            return attendance_report_response(report)
+        return file_response(export_attendance_report(report, export_format))
+
+
+@method_decorator(gzip_page, name='dispatch')
+class AttendanceSyncView(APIView):
+    """
+    Upload a batch of offline session and attendance edits and download the
+    server changes since the last sync (see attendance.sync)
+    """
+    permission_classes = [IsFacultyUser]
+    parser_classes = [GzipJSONParser]
+
+    def post(self, request):
+        serializer = AttendanceSyncSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            response = sync(request.user.faculty_profile, **serializer.validated_data)
+        except SyncError as exc:
+            return Response({'errors': exc.errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(response)
+
+
+class CheckInCodeView(APIView):
+    """
+    Open student self check-in for one of the faculty's active sessions
+    (POST returns a new code), or close it (DELETE)
+    """
+    permission_classes = [IsFacultyUser]
+
+    def get_session(self, request, pk):
+        return get_object_or_404(
+            AttendanceSession.objects.select_related('class_schedule__subject'),
+            pk=pk, faculty__user=request.user,
+        )
+
+    def post(self, request, pk):
+        session = self.get_session(request, pk)
+        try:
+            code, expires_at = open_check_in(session)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response({'code': code, 'expires_at': expires_at}, status=status.HTTP_201_CREATED)
+
+    def delete(self, request, pk):
+        close_check_in(self.get_session(request, pk))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+CHECK_IN_ERROR_STATUS = {
+    'invalid': status.HTTP_400_BAD_REQUEST,
+    'not_enrolled': status.HTTP_403_FORBIDDEN,
+    'duplicate': status.HTTP_409_CONFLICT,
+}
+
+
+class StudentCheckInView(APIView):
+    """
+    Check the signed-in student in with a session code. The record is
+    written shortly after the response, so this answers 202.
+    """
+    permission_classes = [IsStudentUser]
+
+    def post(self, request):
+        serializer = CheckInSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            attendance_status = check_in(request.user.pk, serializer.validated_data['code'])
+        except CheckInError as exc:
+            return Response({'error': str(exc)}, status=CHECK_IN_ERROR_STATUS[exc.reason])
+        return Response({'status': attendance_status}, status=status.HTTP_202_ACCEPTED)
+
+
+class AttendanceHeatmapView(APIView):
+    """
+    Group x weekday x time and subject x week attendance heatmaps of a
+    student group or a department over a period
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        serializer = HeatmapQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        scope = 'group' if 'group' in data else 'department'
+        return Response(get_heatmaps(scope, data[scope].pk, data['start_date'], data['end_date']))
+
+
+class MissingAttendanceView(APIView):
+    """
+    Classes of the signed-in faculty held in a period with no attendance
+    marked
+    """
+    permission_classes = [IsFacultyUser]
+
+    def get(self, request):
+        serializer = MissingAttendanceQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        occurrences = missing_attendance(data['start_date'], data['end_date'], faculty=request.user.faculty_profile)
+        return Response(ClassOccurrenceSerializer(occurrences, many=True).data)
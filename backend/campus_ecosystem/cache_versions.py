@@ -0,0 +1,51 @@
+"""
+Version counters for cache invalidation.
+
+Cached values are stored under a key that includes the current version of
+the data they were computed from; bumping the version makes every older
+entry unreachable without having to know or delete its keys.
+"""
+import time
+
+from django.core.cache import cache
+
+
+def _version_key(namespace, key):
+    return f'{namespace}:version:{key}'
+
+
+def _initial_version():
+    # A fresh counter must never reuse a version that was live before the
+    # counter was evicted, so start from the clock instead of 1.
+    return time.time_ns()
+
+
+def get_version(namespace, key):
+    version_key = _version_key(namespace, key)
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, _initial_version(), None)
+        version = cache.get(version_key)
+    return version
+
+
+def get_versions(namespace, keys):
+    """
+    Versions of many keys with one cache round trip
+    """
+    version_keys = {_version_key(namespace, key): key for key in keys}
+    found = cache.get_many(list(version_keys))
+    versions = {version_keys[version_key]: version for version_key, version in found.items()}
+    for key in keys:
+        if key not in versions:
+            versions[key] = get_version(namespace, key)
+    return versions
+
+
+def bump_version(namespace, key):
+    version_key = _version_key(namespace, key)
+    try:
+        return cache.incr(version_key)
+    except ValueError:
+        cache.set(version_key, _initial_version(), None)
+        return cache.get(version_key)
@@ -0,0 +1,98 @@
+"""
+Streaming CSV and XLSX writers for report exports.
+
+Rows are consumed one at a time from any iterable - typically a
+values_list() queryset read with .iterator(chunk_size=EXPORT_CHUNK_SIZE) -
+and written out as they arrive, so memory use does not grow with the size
+of the report. CSV can be streamed straight into a StreamingHttpResponse;
+XLSX is written with openpyxl's write-only workbook to a file under
+MEDIA_ROOT.
+"""
+import csv
+import os
+import uuid
+
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+
+
+FORMATS = ('csv', 'xlsx')
+
+
+def chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+class _Echo:
+    """
+    File-like object whose write() returns what it was given, so csv.writer
+    can produce lines one at a time
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(header, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def csv_response(filename, header, rows):
+    response = StreamingHttpResponse(csv_lines(header, rows), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def export_path(kind, name, extension):
+    """
+    A new relative path under MEDIA_ROOT for an export file
+    """
+    return os.path.join('exports', kind, f'{name}-{uuid.uuid4().hex[:8]}.{extension}')
+
+
+def write_csv(relative_path, header, rows):
+    path = os.path.join(settings.MEDIA_ROOT, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', newline='', encoding='utf-8') as output:
+        writer = csv.writer(output)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return relative_path
+
+
+def write_xlsx(relative_path, header, rows, title='Report'):
+    from openpyxl import Workbook
+
+    path = os.path.join(settings.MEDIA_ROOT, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=title[:31])
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+    return relative_path
+
+
+def write_export(kind, name, export_format, header, rows):
+    """
+    Write rows to a new file in the given format and return its path
+    relative to MEDIA_ROOT
+    """
+    if export_format not in FORMATS:
+        raise ValueError(f"Unsupported export format {export_format!r}")
+    relative_path = export_path(kind, name, export_format)
+    if export_format == 'xlsx':
+        return write_xlsx(relative_path, header, rows, title=name)
+    return write_csv(relative_path, header, rows)
+
+
+def file_response(relative_path):
+    """
+    Download response for an export file written by write_export()
+    """
+    path = os.path.join(settings.MEDIA_ROOT, relative_path)
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=os.path.basename(path))
@@ -3,6 +3,7 @@ Django settings for campus_ecosystem project.
 """
 
 import os
+import tempfile
 from pathlib import Path
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -76,6 +77,20 @@ DATABASES = {
     }
 }
 
+# Cache
+# The cache holds the version counters that keep the per-process scheduling
+# indexes, faculty availability masks and statistics of every web worker and
+# job thread in step, so it must be shared by all of them. The file cache is
+# shared by the processes of one host; use
+# django.core.cache.backends.redis.RedisCache when running on several hosts.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'campus_ecosystem_cache'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
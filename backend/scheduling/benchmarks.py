@@ -0,0 +1,185 @@
+"""
+Scheduling benchmark suite.
+
+For each campus size a synthetic campus is generated inside a transaction
+that is rolled back afterwards, and the suite times:
+
+- loading the synthetic campus
+- generating every department's timetable (build, solve and persist)
+- clash checks through the occupancy index, cold and warm
+- free-room lookups
+- reading a department timetable and a group timetable as the API would
+
+Results are returned as a dict (see run_benchmarks) that the
+benchmark_scheduling command writes as JSON, so runs from different
+releases can be compared.
+"""
+import datetime
+import platform
+import random
+import statistics
+import time
+
+import django
+from django.conf import settings
+from django.db import connection, transaction
+
+from accounts.models import User
+from . import occupancy, room_availability
+from .models import Timetable, TimetableEntry, TimeSlot, Room, StudentGroup
+from .occupancy import check_conflicts
+from .room_availability import find_free_rooms
+from .solver import generate_timetable
+from .synthetic import SIZES, generate_campus
+
+
+ACADEMIC_YEAR = 'BENCH'
+SEMESTER = 1
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _summary(samples):
+    """
+    Timing statistics in milliseconds
+    """
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'min_ms': round(ordered[0] * 1000, 4),
+        'median_ms': round(statistics.median(ordered) * 1000, 4),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 4),
+        'max_ms': round(ordered[-1] * 1000, 4),
+        'total_ms': round(sum(ordered) * 1000, 4),
+    }
+
+
+def _timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def _reset_indexes():
+    occupancy.reset_index()
+    room_availability.reset_index()
+
+
+def _read_timetable(entries):
+    return [
+        (
+            entry.group.name,
+            entry.class_schedule.day,
+            entry.class_schedule.start_time,
+            entry.class_schedule.subject.code,
+            entry.class_schedule.room.room_number,
+            entry.class_schedule.faculty.user.get_full_name(),
+        )
+        for entry in entries.select_related(
+            'group', 'class_schedule__subject', 'class_schedule__room', 'class_schedule__faculty__user'
+        )
+    ]
+
+
+def _random_proposals(rng, count, slots, rooms, faculty, groups):
+    return [
+        dict(
+            zip(('day', 'start_time', 'end_time'), rng.choice(slots)),
+            room_id=rng.choice(rooms),
+            faculty_id=rng.choice(faculty),
+            group_ids=[rng.choice(groups)],
+        )
+        for _ in range(count)
+    ]
+
+
+def benchmark_size(name, size, time_limit=None, queries=1000, seed=0):
+    """
+    Benchmark one campus size; nothing it creates is kept
+    """
+    rng = random.Random(seed)
+    result = {'size': name, 'parameters': size._asdict()}
+    try:
+        with transaction.atomic():
+            _reset_indexes()
+            created_by = User.objects.create(
+                username=f'bench-{name}', email=f'bench-{name}@example.com', role='admin'
+            )
+            elapsed, (departments, counts) = _timed(generate_campus, size, prefix=f'b{name}', seed=seed)
+            result['campus'] = counts
+            result['load'] = _summary([elapsed])
+
+            generation, quality = [], []
+            for department in departments:
+                elapsed, (timetable, solution) = _timed(
+                    generate_timetable, department, ACADEMIC_YEAR, SEMESTER, created_by,
+                    time_limit=time_limit, seed=seed,
+                )
+                generation.append(elapsed)
+                quality.append({
+                    'department': department.code,
+                    'sessions': len(solution.placements) + len(solution.unplaced),
+                    'unplaced': len(solution.unplaced),
+                    'penalty': solution.penalty,
+                    'passes': solution.iterations,
+                })
+            result['generation'] = _summary(generation)
+            result['generation']['departments'] = quality
+
+            slots = list(TimeSlot.objects.filter(is_active=True).values_list('day', 'start_time', 'end_time'))
+            rooms = list(Room.objects.filter(department__in=departments).values_list('id', flat=True))
+            groups = list(StudentGroup.objects.filter(department__in=departments).values_list('id', flat=True))
+            faculty = list(
+                TimetableEntry.objects.filter(timetable__department__in=departments)
+                .values_list('class_schedule__faculty_id', flat=True).distinct()
+            )
+            proposals = _random_proposals(rng, queries, slots, rooms, faculty, groups)
+
+            _reset_indexes()
+            elapsed, _ = _timed(check_conflicts, proposals[0])
+            result['clash_check_cold'] = _summary([elapsed])
+            result['clash_check'] = _summary([_timed(check_conflicts, proposal)[0] for proposal in proposals])
+
+            lookups = [rng.choice(slots) for _ in range(max(1, queries // 10))]
+            elapsed, _ = _timed(find_free_rooms, *lookups[0])
+            result['free_rooms_cold'] = _summary([elapsed])
+            result['free_rooms'] = _summary([_timed(find_free_rooms, *lookup)[0] for lookup in lookups])
+
+            timetables = list(Timetable.objects.filter(department__in=departments))
+            result['timetable_read'] = _summary([
+                _timed(_read_timetable, TimetableEntry.objects.filter(timetable=timetable))[0]
+                for timetable in timetables
+            ])
+            result['group_timetable_read'] = _summary([
+                _timed(_read_timetable, TimetableEntry.objects.filter(group_id=group_id))[0]
+                for group_id in rng.sample(groups, min(len(groups), 50))
+            ])
+            raise _Rollback
+    except _Rollback:
+        pass
+    finally:
+        _reset_indexes()
+    return result
+
+
+def run_benchmarks(sizes, time_limit=None, queries=1000, seed=0):
+    """
+    Run the suite for the named sizes (keys of synthetic.SIZES) and return
+    the results together with the environment they were measured in
+    """
+    return {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'machine': platform.machine(),
+            'solver_time_limit': time_limit or getattr(settings, 'SCHEDULING_SOLVER_TIME_LIMIT', 10),
+        },
+        'results': [
+            benchmark_size(name, SIZES[name], time_limit=time_limit, queries=queries, seed=seed)
+            for name in sizes
+        ],
+    }
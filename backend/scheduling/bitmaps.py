@@ -0,0 +1,56 @@
+"""
+Weekly minute bitmaps.
+
+A day is split into fixed blocks of SCHEDULING_BITMAP_MINUTES minutes and a
+time range becomes an int with one bit per block, so overlap between two
+ranges is a single AND.
+"""
+from django.conf import settings
+
+from .models import TimeSlot
+
+
+MINUTES_PER_BIT = getattr(settings, 'SCHEDULING_BITMAP_MINUTES', 5)
+BITS_PER_DAY = (24 * 60) // MINUTES_PER_BIT
+DAYS = [day for day, _ in TimeSlot.DAY_CHOICES]
+DAY_INDEX = {day: index for index, day in enumerate(DAYS)}
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def range_mask(start_time, end_time):
+    """
+    Bits of every block touched by [start_time, end_time)
+    """
+    first = _minutes(start_time) // MINUTES_PER_BIT
+    last = -(-_minutes(end_time) // MINUTES_PER_BIT)
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def covered_mask(start_time, end_time):
+    """
+    Bits of the blocks that lie entirely inside [start_time, end_time)
+    """
+    first = -(-_minutes(start_time) // MINUTES_PER_BIT)
+    last = _minutes(end_time) // MINUTES_PER_BIT
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def week_mask(day, start_time, end_time):
+    """
+    range_mask() shifted into a whole-week bitmap
+    """
+    return range_mask(start_time, end_time) << (DAY_INDEX[day] * BITS_PER_DAY)
+
+
+def week_covered_mask(day, start_time, end_time):
+    """
+    covered_mask() shifted into a whole-week bitmap
+    """
+    return covered_mask(start_time, end_time) << (DAY_INDEX[day] * BITS_PER_DAY)
@@ -0,0 +1,181 @@
+"""
+Campus-wide timetable generation.
+
+Timetables are unique per department and term, so each department is solved
+independently in a process pool. The only shared resource is a Room with no
+department: before solving, every (shared room, time slot) pair is handed to
+exactly one department in proportion to how much room capacity it lacks,
+and a reconciliation pass checks the combined result before anything is
+written. The current classes of the departments regenerated in the same run
+do not block rooms, since they are all replaced together.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.db import connections, transaction
+
+from accounts.models import Department
+from .models import ClassSchedule, Timetable, TimetableEntry
+from .solver import build_problem, solve, persist_solution, regeneration_blocker, _bits
+
+
+def _init_worker():
+    if not apps.ready:
+        django.setup()
+
+
+def _shared_room_demand(problem):
+    """
+    Room-slots a department needs beyond its own rooms
+    """
+    free_own = 0
+    for index, blocked in enumerate(problem.room_blocked):
+        if (problem.own_rooms >> index) & 1:
+            free_own += len(problem.slots) - bin(blocked).count('1')
+    return max(len(problem.sessions) - free_own, 0)
+
+
+def partition_shared_rooms(problems):
+    """
+    Give every (shared room, slot) pair to one department by blocking it in
+    all the others. Overlapping slots of a room always go to the same
+    department, so two departments can never clash in a shared room.
+    """
+    problems = [p for p in problems if p.sessions]
+    if len(problems) < 2:
+        return
+    demand = [_shared_room_demand(p) + 1 for p in problems]
+    total_demand = sum(demand)
+
+    reference = problems[0]
+    shared_rooms = sorted({
+        room_id for p in problems for room_id, _, department_id in p.rooms if department_id is None
+    })
+    room_indexes = [
+        {room_id: index for index, (room_id, _, _) in enumerate(p.rooms)} for p in problems
+    ]
+    pairs = [(slot, room_id) for slot in range(len(reference.slots)) for room_id in shared_rooms]
+    assigned = [0] * len(problems)
+    owner = {}
+    for count, (slot, room_id) in enumerate(pairs, start=1):
+        taken = next(
+            (owner[(other, room_id)] for other in _bits(reference.slot_conflicts[slot])
+             if (other, room_id) in owner),
+            None,
+        )
+        if taken is None:
+            taken = max(
+                range(len(problems)),
+                key=lambda i: demand[i] * count / total_demand - assigned[i],
+            )
+        owner[(slot, room_id)] = taken
+        assigned[taken] += 1
+
+    for (slot, room_id), taken in owner.items():
+        for position, problem in enumerate(problems):
+            if position != taken and room_id in room_indexes[position]:
+                problem.room_blocked[room_indexes[position][room_id]] |= 1 << slot
+
+
+def reconcile(problems, solutions):
+    """
+    Drop any placement that clashes in a shared room with a placement of a
+    department earlier in the list; returns the number of sessions dropped.
+    Partitioning makes this a safety net rather than a repair step.
+    """
+    used = {}
+    dropped = 0
+    for problem, solution in zip(problems, solutions):
+        kept = []
+        for session, slot, room in solution.placements:
+            room_id, _, department_id = problem.rooms[room]
+            if department_id is not None:
+                kept.append((session, slot, room))
+                continue
+            _, day, start_time, end_time = problem.slots[slot]
+            clash = any(
+                other_start < end_time and start_time < other_end
+                for other_start, other_end in used.get((room_id, day), ())
+            )
+            if clash:
+                solution.unplaced.append(session)
+                dropped += 1
+                continue
+            used.setdefault((room_id, day), []).append((start_time, end_time))
+            kept.append((session, slot, room))
+        solution.placements = kept
+    return dropped
+
+
+def generate_campus_timetables(academic_year, semester, created_by, departments=None,
+                               max_workers=None, time_limit=None, seed=None):
+    """
+    Generate draft timetables for every department in parallel.
+
+    Returns a dict mapping each department to its (timetable, solution), or
+    to None when the department was skipped because its timetable is
+    already approved or active, or it has nothing to schedule.
+    """
+    if departments is None:
+        departments = Department.objects.all()
+    results = {}
+    candidates = []
+    for department in departments:
+        existing = Timetable.objects.filter(
+            department=department, academic_year=academic_year, semester=semester
+        ).first()
+        if existing is not None and regeneration_blocker(existing):
+            results[department] = None
+            continue
+        candidates.append((department, existing))
+
+    replaced = [existing for _, existing in candidates if existing is not None]
+    built = [
+        (department, existing, build_problem(
+            department, academic_year, semester, exclude_timetable=existing, replaced_timetables=replaced
+        ))
+        for department, existing in candidates
+    ]
+    kept = [existing for _, existing, problem in built if existing is not None and problem.sessions]
+    if len(kept) < len(replaced):
+        # A department with nothing to schedule keeps its classes, so they
+        # block rooms after all
+        built = [
+            (department, existing, build_problem(
+                department, academic_year, semester, exclude_timetable=existing, replaced_timetables=kept
+            ))
+            for department, existing, problem in built if problem.sessions
+        ]
+    problems = []
+    owners = []
+    for department, existing, problem in built:
+        if not problem.sessions:
+            results[department] = None
+            continue
+        problems.append(problem)
+        owners.append(department)
+
+    partition_shared_rooms(problems)
+
+    # Workers never touch the database; close connections so forked
+    # processes do not inherit open sockets.
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as pool:
+        futures = [
+            pool.submit(solve, problem, time_limit, None, None if seed is None else seed + index)
+            for index, problem in enumerate(problems)
+        ]
+        solutions = [future.result() for future in futures]
+
+    reconcile(problems, solutions)
+    with transaction.atomic():
+        # Drop every replaced class first: a department may now be placed on
+        # the room/day/start_time key of another department's old class
+        ClassSchedule.objects.filter(
+            id__in=TimetableEntry.objects.filter(timetable__in=kept).values('class_schedule_id')
+        ).delete()
+        for department, problem, solution in zip(owners, problems, solutions):
+            timetable = persist_solution(problem, solution, created_by)
+            results[department] = (timetable, solution)
+    return results
@@ -0,0 +1,98 @@
+"""
+Compiled FacultyAvailability bitmasks.
+
+A faculty member's availability rows are compiled into two week bitmaps
+(see scheduling.bitmaps): the blocks inside their declared available windows
+and the blocks they marked unavailable. The compiled masks are cached per
+faculty under a version that the FacultyAvailability signals bump, so the
+solver and the clash checker test availability with a single AND.
+"""
+from django.core.cache import cache
+
+from campus_ecosystem.cache_versions import get_versions, bump_version
+from .bitmaps import BITS_PER_DAY, DAYS, week_mask, week_covered_mask
+from .models import FacultyAvailability
+
+
+VERSION_NAMESPACE = 'faculty_availability'
+ALL_WEEK = (1 << (BITS_PER_DAY * len(DAYS))) - 1
+
+
+class AvailabilityMask:
+    """
+    Compiled availability of one faculty member
+    """
+
+    def __init__(self, windows=None, blocked=0):
+        self.windows = windows  # blocks inside available windows, None if unrestricted
+        self.blocked = blocked  # blocks marked unavailable
+
+    @property
+    def allowed(self):
+        windows = ALL_WEEK if self.windows is None else self.windows
+        return windows & ~self.blocked
+
+    def is_blocked(self, mask):
+        """
+        True if any block of mask was marked unavailable
+        """
+        return bool(mask & self.blocked)
+
+    def is_available(self, mask):
+        """
+        True if every block of mask is inside an available window and none
+        is marked unavailable
+        """
+        return not mask & ~self.allowed
+
+    def is_available_at(self, day, start_time, end_time):
+        return self.is_available(week_mask(day, start_time, end_time))
+
+
+def compile_masks(faculty_ids):
+    """
+    Compile AvailabilityMasks for the given faculty with one query
+    """
+    masks = {faculty_id: AvailabilityMask() for faculty_id in faculty_ids}
+    for faculty_id, day, start_time, end_time, is_available in FacultyAvailability.objects.filter(
+        faculty_id__in=list(masks)
+    ).values_list('faculty_id', 'day', 'start_time', 'end_time', 'is_available'):
+        mask = masks[faculty_id]
+        if is_available:
+            mask.windows = (mask.windows or 0) | week_covered_mask(day, start_time, end_time)
+        else:
+            mask.blocked |= week_mask(day, start_time, end_time)
+    return masks
+
+
+def _cache_key(faculty_id, version):
+    return f'{VERSION_NAMESPACE}:{faculty_id}:{version}'
+
+
+def get_masks(faculty_ids):
+    """
+    AvailabilityMasks for many faculty, compiling only the ones whose cached
+    mask is missing or stale
+    """
+    faculty_ids = list(faculty_ids)
+    versions = get_versions(VERSION_NAMESPACE, faculty_ids)
+    keys = {_cache_key(faculty_id, versions[faculty_id]): faculty_id for faculty_id in faculty_ids}
+    cached = cache.get_many(list(keys))
+    masks = {keys[key]: AvailabilityMask(*value) for key, value in cached.items()}
+    missing = [faculty_id for faculty_id in faculty_ids if faculty_id not in masks]
+    if missing:
+        compiled = compile_masks(missing)
+        cache.set_many({
+            _cache_key(faculty_id, versions[faculty_id]): (mask.windows, mask.blocked)
+            for faculty_id, mask in compiled.items()
+        }, None)
+        masks.update(compiled)
+    return masks
+
+
+def get_mask(faculty_id):
+    return get_masks([faculty_id])[faculty_id]
+
+
+def invalidate(faculty_id):
+    bump_version(VERSION_NAMESPACE, faculty_id)
@@ -0,0 +1,253 @@
+"""
+Anytime timetable generation in the background.
+
+start_generation_job() records a TimetableGenerationJob and runs the solver
+on a worker thread once the transaction commits, so the request that started
+it returns immediately. While the solver runs, the best solution found so far
+is written as the department's draft Timetable (at most every
+SCHEDULING_JOB_PERSIST_INTERVAL seconds) and its penalty, placed sessions and
+elapsed time are recorded on the job row. The job row is the only channel
+between the worker and the outside world: progress streams read it, and
+stop_job() sets a flag on it that the solver polls, so stopping early leaves
+the best draft found so far in place.
+
+The worker is a daemon thread of the web process, so it dies with it. A job
+whose row has not been touched for SCHEDULING_JOB_STALE_AFTER seconds is
+taken to be dead and marked failed before a new job for the term is started
+or while its progress is streamed; a worker that was only slow notices on
+its next poll and stops.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts.models import Department
+from .models import Timetable, TimetableGenerationJob
+from .solver import build_problem, solve, persist_solution, regeneration_blocker
+
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('queued', 'running')
+EVENT_FIELDS = (
+    'id', 'status', 'timetable_id', 'best_penalty', 'placed_sessions', 'total_sessions',
+    'iterations', 'elapsed', 'error', 'updated_at',
+)
+
+
+class _JobProgress:
+    """
+    Solver callbacks for one job: persists improvements and polls for a stop
+    request, both throttled so that the search is not slowed down by writes
+    """
+
+    def __init__(self, job, problem):
+        self.job = job
+        self.problem = problem
+        self.persist_interval = getattr(settings, 'SCHEDULING_JOB_PERSIST_INTERVAL', 2)
+        self.poll_interval = getattr(settings, 'SCHEDULING_JOB_POLL_INTERVAL', 0.5)
+        self.started = time.monotonic()
+        self.last_persist = None
+        self.last_poll = self.started
+        self.pending = None
+        self.stopping = False
+
+    def on_progress(self, solution):
+        self.pending = solution
+        now = time.monotonic()
+        if self.last_persist is None or now - self.last_persist >= self.persist_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Persist the pending best solution as the draft timetable
+        """
+        solution, self.pending = self.pending, None
+        if solution is None:
+            return
+        self.last_persist = time.monotonic()
+        timetable = persist_solution(self.problem, solution, self.job.created_by, self.job.name or None)
+        TimetableGenerationJob.objects.filter(pk=self.job.pk).update(
+            timetable=timetable,
+            best_penalty=solution.penalty,
+            placed_sessions=len(solution.placements),
+            iterations=solution.iterations,
+            elapsed=solution.elapsed,
+            updated_at=timezone.now(),
+        )
+
+    def should_stop(self):
+        now = time.monotonic()
+        if self.stopping or now - self.last_poll < self.poll_interval:
+            return self.stopping
+        self.last_poll = now
+        if self.pending is not None and (
+            self.last_persist is None or now - self.last_persist >= self.persist_interval
+        ):
+            self.flush()
+        jobs = TimetableGenerationJob.objects.filter(pk=self.job.pk)
+        # The heartbeat keeps elapsed current for progress streams between
+        # improvements.
+        jobs.update(elapsed=now - self.started, updated_at=timezone.now())
+        # A job that was expired as stale is no longer running
+        self.stopping = jobs.filter(status='running').values_list('stop_requested', flat=True).first() is not False
+        return self.stopping
+
+
+def run_generation_job(job_id):
+    """
+    Solve and persist the timetable of a queued job. Runs on the worker
+    thread but can also be called directly, e.g. from a management command.
+    """
+    job = TimetableGenerationJob.objects.select_related('department', 'created_by').get(pk=job_id)
+    jobs = TimetableGenerationJob.objects.filter(pk=job_id)
+    if jobs.filter(status='queued').update(status='running', updated_at=timezone.now()) == 0:
+        return
+    try:
+        existing = Timetable.objects.filter(
+            department=job.department, academic_year=job.academic_year, semester=job.semester
+        ).first()
+        problem = build_problem(job.department, job.academic_year, job.semester, exclude_timetable=existing)
+        jobs.filter(status='running').update(total_sessions=len(problem.sessions), updated_at=timezone.now())
+        progress = _JobProgress(job, problem)
+        solution = solve(
+            problem,
+            time_limit=job.time_limit,
+            on_progress=progress.on_progress,
+            should_stop=progress.should_stop,
+        )
+        progress.pending = solution
+        if jobs.filter(status='running').exists():
+            progress.flush()
+        jobs.filter(status='running').update(
+            status='stopped' if progress.stopping else 'completed',
+            iterations=solution.iterations,
+            elapsed=solution.elapsed,
+            finished_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+    except Exception as exc:
+        logger.exception('Timetable generation job %s failed', job_id)
+        jobs.filter(status='running').update(
+            status='failed', error=str(exc), finished_at=timezone.now(), updated_at=timezone.now()
+        )
+
+
+def _run_in_thread(job_id):
+    try:
+        run_generation_job(job_id)
+    finally:
+        connection.close()
+
+
+def expire_stale_jobs(jobs=None):
+    """
+    Mark active jobs whose worker stopped updating them as failed. Returns
+    the number of jobs expired.
+    """
+    if jobs is None:
+        jobs = TimetableGenerationJob.objects.all()
+    stale_after = timedelta(seconds=getattr(settings, 'SCHEDULING_JOB_STALE_AFTER', 300))
+    now = timezone.now()
+    return jobs.filter(status__in=ACTIVE_STATUSES, updated_at__lt=now - stale_after).update(
+        status='failed', error='The worker running this job stopped responding.', finished_at=now, updated_at=now
+    )
+
+
+@transaction.atomic
+def start_generation_job(department, academic_year, semester, created_by, time_limit=None, name=''):
+    """
+    Queue a generation job and start it on a background thread once the
+    current transaction commits. Raises ValueError if the timetable cannot
+    be regenerated or another job for the same term is still active.
+    """
+    if time_limit is None:
+        time_limit = getattr(settings, 'SCHEDULING_SOLVER_TIME_LIMIT', 10)
+    # Serializes job starts of a department, so two requests cannot both
+    # pass the active job check below
+    Department.objects.select_for_update().filter(pk=department.pk).first()
+    timetable = Timetable.objects.filter(
+        department=department, academic_year=academic_year, semester=semester
+    ).first()
+    blocker = regeneration_blocker(timetable) if timetable is not None else None
+    if blocker:
+        raise ValueError(blocker)
+    term_jobs = TimetableGenerationJob.objects.filter(
+        department=department, academic_year=academic_year, semester=semester
+    )
+    expire_stale_jobs(term_jobs)
+    if term_jobs.filter(status__in=ACTIVE_STATUSES).exists():
+        raise ValueError('A generation job for this term is already running')
+
+    job = TimetableGenerationJob.objects.create(
+        department=department,
+        academic_year=academic_year,
+        semester=semester,
+        name=name,
+        time_limit=time_limit,
+        created_by=created_by,
+    )
+    transaction.on_commit(
+        lambda: threading.Thread(target=_run_in_thread, args=(job.pk,), daemon=True).start()
+    )
+    return job
+
+
+def stop_job(job):
+    """
+    Ask a running job to stop; it keeps the best timetable found so far
+    """
+    updated = TimetableGenerationJob.objects.filter(pk=job.pk, status__in=ACTIVE_STATUSES).update(
+        stop_requested=True, updated_at=timezone.now()
+    )
+    # A job that has not started yet has nothing to keep
+    TimetableGenerationJob.objects.filter(pk=job.pk, status='queued').update(
+        status='stopped', finished_at=timezone.now()
+    )
+    return bool(updated)
+
+
+def _event(name, data):
+    return f"event: {name}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+async def job_events(job_id):
+    """
+    Server-Sent Events for a job: a progress event whenever the job row
+    changes and a final done event once it finishes. Polls the job row
+    without blocking the event loop, so it should be served through the
+    ASGI application.
+    """
+    interval = getattr(settings, 'SCHEDULING_JOB_STREAM_INTERVAL', 1)
+    keepalive = getattr(settings, 'SCHEDULING_JOB_STREAM_KEEPALIVE', 15)
+    last_update = None
+    quiet = 0
+    while True:
+        row = await TimetableGenerationJob.objects.filter(pk=job_id).values(*EVENT_FIELDS).afirst()
+        if row is None:
+            yield _event('error', {'error': 'Job not found.'})
+            return
+        if row['updated_at'] != last_update:
+            last_update = row['updated_at']
+            quiet = 0
+            finished = row['status'] not in ACTIVE_STATUSES
+            yield _event('done' if finished else 'progress', row)
+            if finished:
+                return
+        else:
+            quiet += interval
+            if quiet >= keepalive:
+                quiet = 0
+                # The worker may have died with its process
+                await sync_to_async(expire_stale_jobs)(TimetableGenerationJob.objects.filter(pk=job_id))
+                yield ': keepalive\n\n'
+        await asyncio.sleep(interval)
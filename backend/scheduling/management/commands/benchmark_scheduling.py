@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from scheduling.benchmarks import run_benchmarks
+from scheduling.synthetic import SIZES
+
+
+class Command(BaseCommand):
+    help = 'Benchmark timetable generation, clash checks and timetable reads on synthetic campuses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=['small', 'medium', 'large'])
+        parser.add_argument('--time-limit', type=float, default=None, help='Solver seconds per department')
+        parser.add_argument('--queries', type=int, default=1000, help='Clash checks per size')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write JSON results to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        results = run_benchmarks(
+            options['sizes'],
+            time_limit=options['time_limit'],
+            queries=options['queries'],
+            seed=options['seed'],
+        )
+        report = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report + '\n')
+            for result in results['results']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{result['size']}: generation {result['generation']['total_ms']:.0f} ms, "
+                    f"clash check median {result['clash_check']['median_ms']:.3f} ms, "
+                    f"timetable read median {result['timetable_read']['median_ms']:.1f} ms"
+                ))
+        else:
+            self.stdout.write(report)
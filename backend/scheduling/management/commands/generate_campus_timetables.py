@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import Department, User
+from scheduling.campus import generate_campus_timetables
+
+
+class Command(BaseCommand):
+    help = 'Generate draft timetables for all departments in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('academic_year', help='Academic year, e.g. 2024-25')
+        parser.add_argument('semester', type=int)
+        parser.add_argument('--created-by', required=True, help='Email of the user recorded as creator')
+        parser.add_argument('--department', action='append', dest='departments',
+                            help='Department code to generate (repeatable); defaults to all')
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+        parser.add_argument('--time-limit', type=float, default=None, help='Seconds per department')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        try:
+            created_by = User.objects.get(email=options['created_by'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user with email {options['created_by']}")
+
+        departments = Department.objects.all()
+        if options['departments']:
+            departments = departments.filter(code__in=options['departments'])
+
+        results = generate_campus_timetables(
+            options['academic_year'],
+            options['semester'],
+            created_by,
+            departments=departments,
+            max_workers=options['workers'],
+            time_limit=options['time_limit'],
+            seed=options['seed'],
+        )
+        for department, result in results.items():
+            if result is None:
+                self.stdout.write(f'{department.code}: skipped')
+                continue
+            timetable, solution = result
+            self.stdout.write(self.style.SUCCESS(f'{department.code}: {timetable.notes}'))
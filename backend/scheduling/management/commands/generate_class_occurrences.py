@@ -0,0 +1,26 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scheduling.occurrences import generate
+
+
+class Command(BaseCommand):
+    help = 'Expand the active weekly classes into dated occurrences for a semester'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', required=True, help='First day of the semester (YYYY-MM-DD)')
+        parser.add_argument('--end', required=True, help='Last day of the semester (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        try:
+            start = datetime.date.fromisoformat(options['start'])
+            end = datetime.date.fromisoformat(options['end'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        if start > end:
+            raise CommandError('--start must not be after --end')
+        created, removed, flagged = generate(start, end)
+        self.stdout.write(self.style.SUCCESS(
+            f'{created} occurrences created, {removed} removed, {flagged} re-flagged'
+        ))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from scheduling.synthetic import SIZES, generate_campus
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic campus for load testing and benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', choices=sorted(SIZES), default='small',
+                            help='Preset to start from (default: small)')
+        parser.add_argument('--departments', type=int)
+        parser.add_argument('--groups', type=int, help='Student groups per department')
+        parser.add_argument('--students-per-group', type=int)
+        parser.add_argument('--faculty', type=int, help='Faculty per department')
+        parser.add_argument('--subjects', type=int, help='Subjects per department')
+        parser.add_argument('--rooms', type=int, help='Rooms per department')
+        parser.add_argument('--shared-rooms', type=int, help='Rooms not owned by any department')
+        parser.add_argument('--prefix', default='syn', help='Tag for generated codes, emails and ids')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        size = SIZES[options['size']]
+        size = size._replace(**{
+            field: options[field] for field in size._fields if options.get(field) is not None
+        })
+        _, counts = generate_campus(size, prefix=options['prefix'], seed=options['seed'])
+        self.stdout.write(self.style.SUCCESS(
+            ', '.join(f'{count} {name}' for name, count in counts.items())
+        ))
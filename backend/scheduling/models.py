@@ -229,6 +229,55 @@ class TimetableEntry(models.Model):
         unique_together = ['timetable', 'group', 'class_schedule']
 
 
+class TimetableVersion(models.Model):
+    """
+    Copy-on-write revisions of a timetable. A version stores only the
+    entries added or removed relative to its parent.
+    """
+    STATUS_CHOICES = [
+        ('draft', 'Draft'),
+        ('published', 'Published'),
+        ('archived', 'Archived'),
+    ]
+    
+    timetable = models.ForeignKey(Timetable, on_delete=models.CASCADE, related_name='versions')
+    parent = models.ForeignKey('self', on_delete=models.PROTECT, related_name='children', null=True, blank=True)
+    depth = models.PositiveIntegerField(default=0)
+    name = models.CharField(max_length=100, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft')
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timetable_versions')
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.timetable.name} - v{self.pk} {self.name} ({self.get_status_display()})"
+    
+    class Meta:
+        ordering = ['-created_at']
+
+
+class TimetableVersionChange(models.Model):
+    """
+    An entry added to or removed from a version's parent
+    """
+    ACTION_CHOICES = [
+        ('add', 'Add'),
+        ('remove', 'Remove'),
+    ]
+    
+    version = models.ForeignKey(TimetableVersion, on_delete=models.CASCADE, related_name='changes')
+    group = models.ForeignKey(StudentGroup, on_delete=models.CASCADE, related_name='timetable_version_changes')
+    class_schedule = models.ForeignKey(ClassSchedule, on_delete=models.PROTECT, related_name='timetable_version_changes')
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    
+    def __str__(self):
+        return f"{self.version} - {self.action} {self.group} - {self.class_schedule}"
+    
+    class Meta:
+        unique_together = ['version', 'group', 'class_schedule']
+        indexes = [models.Index(fields=['class_schedule', 'group'])]
+
+
 class SchedulingRequest(models.Model):
     """
     Requests for schedule changes
@@ -250,6 +299,7 @@ class SchedulingRequest(models.Model):
     requester = models.ForeignKey(User, on_delete=models.CASCADE, related_name='scheduling_requests')
     request_type = models.CharField(max_length=20, choices=REQUEST_TYPE_CHOICES)
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='scheduling_requests')
+    student_group = models.ForeignKey(StudentGroup, on_delete=models.CASCADE, related_name='scheduling_requests', null=True, blank=True)  # group of an added class
     current_schedule = models.ForeignKey(ClassSchedule, on_delete=models.CASCADE, related_name='change_requests', null=True, blank=True)
     proposed_day = models.CharField(max_length=10, choices=TimeSlot.DAY_CHOICES, blank=True)
     proposed_start_time = models.TimeField(null=True, blank=True)
@@ -268,3 +318,63 @@ class SchedulingRequest(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+
+
+class TimetableGenerationJob(models.Model):
+    """
+    Background timetable generation runs
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('stopped', 'Stopped'),
+        ('failed', 'Failed'),
+    ]
+    
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, related_name='timetable_jobs')
+    academic_year = models.CharField(max_length=10)
+    semester = models.PositiveIntegerField()
+    name = models.CharField(max_length=100, blank=True)
+    time_limit = models.FloatField()  # wall-clock budget in seconds
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    stop_requested = models.BooleanField(default=False)
+    timetable = models.ForeignKey(Timetable, on_delete=models.SET_NULL, related_name='generation_jobs', null=True, blank=True)
+    best_penalty = models.FloatField(null=True, blank=True)
+    placed_sessions = models.PositiveIntegerField(default=0)
+    total_sessions = models.PositiveIntegerField(default=0)
+    iterations = models.PositiveIntegerField(default=0)
+    elapsed = models.FloatField(default=0)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timetable_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.department.name} - {self.academic_year} Sem {self.semester} ({self.get_status_display()})"
+    
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'stopped', 'failed')
+    
+    class Meta:
+        ordering = ['-created_at']
+
+
+class ClassOccurrence(models.Model):
+    """
+    A date on which a weekly ClassSchedule meets, expanded over the semester
+    and cancelled by holidays, breaks and exams (see scheduling.occurrences)
+    """
+    class_schedule = models.ForeignKey(ClassSchedule, on_delete=models.CASCADE, related_name='occurrences')
+    date = models.DateField()
+    is_cancelled = models.BooleanField(default=False)
+    
+    def __str__(self):
+        return f"{self.class_schedule} - {self.date}{' (cancelled)' if self.is_cancelled else ''}"
+    
+    class Meta:
+        unique_together = ['class_schedule', 'date']
+        indexes = [models.Index(fields=['date', 'is_cancelled'])]
+        ordering = ['date', 'class_schedule__start_time']
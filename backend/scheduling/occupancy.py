@@ -0,0 +1,304 @@
+"""
+In-memory occupancy index for clash checks.
+
+Every active ClassSchedule is kept in sorted per-day timelines keyed by room,
+faculty and student group (through GroupSchedule). The index is built once per
+process on first use and kept current by the signal handlers in
+scheduling.signals, so check_conflicts() answers from memory with a couple of
+bisects per resource instead of querying the database.
+
+Each write also bumps a shared cache version once it commits. An index
+remembers the version it was built at and is rebuilt on next use when the
+version has moved on without it, so a process never keeps answering from
+timelines another process has since changed.
+"""
+import threading
+from bisect import bisect_left, insort
+from collections import namedtuple
+
+from django.db import transaction
+
+from campus_ecosystem.cache_versions import bump_version, get_version
+from .faculty_availability import get_mask
+from .models import ClassSchedule, GroupSchedule
+
+
+VERSION_NAMESPACE = 'scheduling'
+VERSION_KEY = 'occupancy'
+
+Conflict = namedtuple('Conflict', ['kind', 'resource_id', 'class_schedule_id'])
+
+_Placement = namedtuple('_Placement', ['room_id', 'faculty_id', 'day', 'start', 'end', 'start_time'])
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+class _Timeline:
+    """
+    Intervals of one resource on one day, sorted by start minute
+    """
+
+    def __init__(self):
+        self.items = []  # (start, end, class_schedule_id)
+        self.longest = 0
+
+    def add(self, start, end, schedule_id):
+        insort(self.items, (start, end, schedule_id))
+        self.longest = max(self.longest, end - start)
+
+    def remove(self, start, end, schedule_id):
+        index = bisect_left(self.items, (start, end, schedule_id))
+        if index < len(self.items) and self.items[index] == (start, end, schedule_id):
+            del self.items[index]
+
+    def overlapping(self, start, end):
+        """
+        Yield ids of intervals overlapping [start, end). Only intervals that
+        start after start - longest can reach it, so the scan is bounded by
+        two bisects.
+        """
+        low = bisect_left(self.items, (start - self.longest + 1,))
+        high = bisect_left(self.items, (end,))
+        for item_start, item_end, schedule_id in self.items[low:high]:
+            if item_end > start:
+                yield schedule_id
+
+
+class OccupancyIndex:
+    """
+    Room, faculty and group timelines for all active classes
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.version = None
+        self._clear()
+
+    def _clear(self):
+        self.timelines = {'room': {}, 'faculty': {}, 'group': {}}
+        self.placements = {}    # class_schedule_id -> _Placement
+        self.groups = {}        # class_schedule_id -> set of group ids
+        self.reserved = {}      # (room_id, day, start_time) -> inactive class_schedule_id
+        self.reserved_keys = {}  # inactive class_schedule_id -> reserved key
+
+    def build(self):
+        with self.lock:
+            self._clear()
+            for schedule_id, group_id in GroupSchedule.objects.filter(is_active=True).values_list(
+                'class_schedule_id', 'group_id'
+            ):
+                self.groups.setdefault(schedule_id, set()).add(group_id)
+            for row in ClassSchedule.objects.values_list(
+                'id', 'room_id', 'faculty_id', 'day', 'start_time', 'end_time', 'is_active'
+            ):
+                self._add(*row)
+        return self
+
+    def _timeline(self, kind, resource_id, day):
+        return self.timelines[kind].setdefault((resource_id, day), _Timeline())
+
+    def _resources(self, schedule_id, placement):
+        yield 'room', placement.room_id
+        yield 'faculty', placement.faculty_id
+        for group_id in self.groups.get(schedule_id, ()):
+            yield 'group', group_id
+
+    def _add(self, schedule_id, room_id, faculty_id, day, start_time, end_time, is_active):
+        if not is_active:
+            key = (room_id, day, start_time)
+            self.reserved[key] = schedule_id
+            self.reserved_keys[schedule_id] = key
+            return
+        placement = _Placement(room_id, faculty_id, day, _minutes(start_time), _minutes(end_time), start_time)
+        self.placements[schedule_id] = placement
+        for kind, resource_id in self._resources(schedule_id, placement):
+            self._timeline(kind, resource_id, day).add(placement.start, placement.end, schedule_id)
+
+    def _discard(self, schedule_id):
+        placement = self.placements.pop(schedule_id, None)
+        if placement is not None:
+            for kind, resource_id in self._resources(schedule_id, placement):
+                self._timeline(kind, resource_id, placement.day).remove(
+                    placement.start, placement.end, schedule_id
+                )
+        key = self.reserved_keys.pop(schedule_id, None)
+        if key is not None and self.reserved.get(key) == schedule_id:
+            del self.reserved[key]
+
+    def update_schedule(self, schedule):
+        with self.lock:
+            self._discard(schedule.pk)
+            self._add(schedule.pk, schedule.room_id, schedule.faculty_id, schedule.day,
+                      schedule.start_time, schedule.end_time, schedule.is_active)
+
+    def remove_schedule(self, schedule_id):
+        with self.lock:
+            self._discard(schedule_id)
+            self.groups.pop(schedule_id, None)
+
+    def refresh(self, schedule_ids):
+        """
+        Reload the given classes from the database, for bulk writes that do
+        not send model signals
+        """
+        schedule_ids = list(schedule_ids)
+        groups = {}
+        for schedule_id, group_id in GroupSchedule.objects.filter(
+            class_schedule_id__in=schedule_ids, is_active=True
+        ).values_list('class_schedule_id', 'group_id'):
+            groups.setdefault(schedule_id, set()).add(group_id)
+        rows = ClassSchedule.objects.filter(id__in=schedule_ids).values_list(
+            'id', 'room_id', 'faculty_id', 'day', 'start_time', 'end_time', 'is_active'
+        )
+        with self.lock:
+            for schedule_id in schedule_ids:
+                self._discard(schedule_id)
+                self.groups.pop(schedule_id, None)
+            self.groups.update(groups)
+            for row in rows:
+                self._add(*row)
+
+    def conflicts(self, day, start_time, end_time, room_id=None, faculty_id=None, group_ids=(), exclude=None):
+        start, end = _minutes(start_time), _minutes(end_time)
+        found = []
+        if faculty_id is not None and not get_mask(faculty_id).is_available_at(day, start_time, end_time):
+            found.append(Conflict('faculty_availability', faculty_id, None))
+        with self.lock:
+            wanted = [('room', room_id), ('faculty', faculty_id)] + [('group', g) for g in group_ids]
+            for kind, resource_id in wanted:
+                if resource_id is None:
+                    continue
+                timeline = self.timelines[kind].get((resource_id, day))
+                if timeline is None:
+                    continue
+                for schedule_id in timeline.overlapping(start, end):
+                    if schedule_id != exclude:
+                        found.append(Conflict(kind, resource_id, schedule_id))
+            if room_id is not None:
+                reserved = self.reserved.get((room_id, day, start_time))
+                if reserved is not None and reserved != exclude:
+                    found.append(Conflict('room_key', room_id, reserved))
+        return found
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """
+    Return the process-wide index, building it on first use and rebuilding
+    it when another process has changed the classes since
+    """
+    global _index
+    version = get_version(VERSION_NAMESPACE, VERSION_KEY)
+    if _index is None or _index.version != version:
+        with _index_lock:
+            if _index is None or _index.version != version:
+                _index = OccupancyIndex().build()
+                _index.version = version
+    return _index
+
+
+def reset_index():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def index_loaded():
+    return _index is not None
+
+
+def index_changed(update):
+    """
+    Once the current transaction commits, bump the shared version and apply
+    update to this process's index. The index is dropped instead when
+    another process bumped the version since it was built.
+    """
+    def apply():
+        global _index
+        with _index_lock:
+            version = bump_version(VERSION_NAMESPACE, VERSION_KEY)
+            if _index is not None and _index.version == version - 1:
+                update(_index)
+                _index.version = version
+            else:
+                _index = None
+
+    transaction.on_commit(apply)
+
+
+def schedules_changed(schedule_ids):
+    """
+    Refresh the given classes in the index once the current transaction
+    commits. Used by bulk writes, which bypass the model signals.
+    """
+    schedule_ids = list(schedule_ids)
+    index_changed(lambda index: index.refresh(schedule_ids))
+
+
+def check_conflicts(proposal, group_ids=None):
+    """
+    Return the Conflicts a proposed class would cause.
+
+    proposal may be a (possibly unsaved) ClassSchedule, a SchedulingRequest,
+    or a dict with day, start_time, end_time and any of room_id, faculty_id,
+    group_ids and exclude (a class_schedule id to ignore, e.g. the class
+    being moved). A faculty member who is unavailable at that time is
+    reported as a 'faculty_availability' conflict with no class_schedule_id.
+    """
+    index = get_index()
+    if isinstance(proposal, dict):
+        query = dict(proposal)
+    elif isinstance(proposal, ClassSchedule):
+        query = {
+            'day': proposal.day,
+            'start_time': proposal.start_time,
+            'end_time': proposal.end_time,
+            'room_id': proposal.room_id,
+            'faculty_id': proposal.faculty_id,
+            'group_ids': index.groups.get(proposal.pk, ()),
+            'exclude': proposal.pk,
+        }
+    else:
+        query = _request_query(index, proposal)
+    if group_ids is not None:
+        query['group_ids'] = group_ids
+    return index.conflicts(**query)
+
+
+def _request_query(index, scheduling_request):
+    current = scheduling_request.current_schedule
+    if current is not None:
+        faculty_id = current.faculty_id
+        room_id = current.room_id
+        day, start_time, end_time = current.day, current.start_time, current.end_time
+        group_ids = index.groups.get(current.pk, ())
+    else:
+        faculty = getattr(scheduling_request.requester, 'faculty_profile', None)
+        faculty_id = faculty.pk if faculty is not None else None
+        room_id = None
+        day = start_time = end_time = None
+        group_ids = (scheduling_request.student_group_id,) if scheduling_request.student_group_id else ()
+    if scheduling_request.request_type != 'change_room':
+        day = scheduling_request.proposed_day or day
+        start_time = scheduling_request.proposed_start_time or start_time
+        if scheduling_request.proposed_end_time is not None:
+            end_time = scheduling_request.proposed_end_time
+        elif current is not None and start_time is not None:
+            end = _minutes(start_time) + _minutes(current.end_time) - _minutes(current.start_time)
+            end_time = start_time.replace(hour=end // 60, minute=end % 60)
+    if scheduling_request.proposed_room_id is not None:
+        room_id = scheduling_request.proposed_room_id
+    return {
+        'day': day,
+        'start_time': start_time,
+        'end_time': end_time,
+        'room_id': room_id,
+        'faculty_id': faculty_id,
+        'group_ids': group_ids,
+        'exclude': current.pk if current is not None else None,
+    }
@@ -0,0 +1,159 @@
+"""
+Materialized class occurrences.
+
+Every active ClassSchedule is expanded into one ClassOccurrence per date it
+meets within the semester, cancelled when an active AcademicCalendar event
+of a CLASS_CANCELLING_EVENTS type (holidays, breaks and exams by default)
+covers the date. generate() materializes a semester; afterwards the table
+is kept current incrementally: changed classes are re-expanded from today to
+the end of the materialized range, so past occurrences stay as they were,
+and a calendar change only re-flags the dates it covers. "Classes held so
+far", missing attendance and calendar feeds are then indexed range queries
+on (date, is_cancelled).
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+
+from .bitmaps import DAY_INDEX
+from .models import ClassOccurrence, ClassSchedule
+
+
+def cancelling_events():
+    return getattr(settings, 'CLASS_CANCELLING_EVENTS', ('holiday', 'break', 'exam'))
+
+
+def cancelled_dates(start, end):
+    """
+    Dates in [start, end] covered by an active cancelling calendar event
+    """
+    from academics.models import AcademicCalendar
+
+    dates = set()
+    for event_start, event_end in AcademicCalendar.objects.filter(
+        is_active=True, event_type__in=cancelling_events(), start_date__lte=end, end_date__gte=start
+    ).values_list('start_date', 'end_date'):
+        day = max(event_start, start)
+        while day <= min(event_end, end):
+            dates.add(day)
+            day += datetime.timedelta(days=1)
+    return dates
+
+
+def materialized_range():
+    """
+    (first, last) date of the materialized occurrences, None if there are none
+    """
+    bounds = ClassOccurrence.objects.aggregate(first=Min('date'), last=Max('date'))
+    if bounds['first'] is None:
+        return None
+    return bounds['first'], bounds['last']
+
+
+def _dates(day, start, end):
+    first = start + datetime.timedelta(days=(DAY_INDEX[day] - start.weekday()) % 7)
+    return [first + datetime.timedelta(weeks=week) for week in range((end - first).days // 7 + 1)] if first <= end else []
+
+
+def _sync(start, end, class_ids=None):
+    """
+    Make the occurrences in [start, end] of the given classes (all classes
+    if None) match their schedules and the calendar. Returns the numbers of
+    occurrences created, removed and re-flagged.
+    """
+    schedules = ClassSchedule.objects.filter(is_active=True)
+    occurrences = ClassOccurrence.objects.filter(date__range=(start, end))
+    if class_ids is not None:
+        schedules = schedules.filter(id__in=class_ids)
+        occurrences = occurrences.filter(class_schedule_id__in=class_ids)
+    cancelled = cancelled_dates(start, end)
+    wanted = {
+        (class_schedule_id, date): date in cancelled
+        for class_schedule_id, day in schedules.values_list('id', 'day')
+        for date in _dates(day, start, end)
+    }
+    existing = {
+        (class_schedule_id, date): (pk, is_cancelled)
+        for pk, class_schedule_id, date, is_cancelled in occurrences.values_list(
+            'id', 'class_schedule_id', 'date', 'is_cancelled'
+        )
+    }
+    removed = [pk for key, (pk, _) in existing.items() if key not in wanted]
+    ClassOccurrence.objects.filter(id__in=removed).delete()
+    created = ClassOccurrence.objects.bulk_create(
+        [
+            ClassOccurrence(class_schedule_id=class_schedule_id, date=date, is_cancelled=is_cancelled)
+            for (class_schedule_id, date), is_cancelled in wanted.items()
+            if (class_schedule_id, date) not in existing
+        ],
+        batch_size=1000,
+    )
+    flagged = 0
+    for flag in (True, False):
+        flagged += ClassOccurrence.objects.filter(id__in=[
+            pk for key, (pk, is_cancelled) in existing.items()
+            if key in wanted and wanted[key] == flag and is_cancelled != flag
+        ]).update(is_cancelled=flag)
+    return len(created), len(removed), flagged
+
+
+@transaction.atomic
+def generate(start, end):
+    """
+    Materialize the occurrences of every active class in [start, end]
+    """
+    return _sync(start, end)
+
+
+def refresh_classes(class_ids):
+    """
+    Re-expand changed classes from today to the end of the materialized range
+    """
+    window = materialized_range()
+    if window is None:
+        return None
+    start = max(window[0], timezone.localdate())
+    if start > window[1]:
+        return None
+    return _sync(start, window[1], class_ids)
+
+
+def refresh_calendar(start, end):
+    """
+    Re-flag the materialized occurrences in [start, end] after a calendar
+    change
+    """
+    cancelled = cancelled_dates(start, end)
+    occurrences = ClassOccurrence.objects.filter(date__range=(start, end))
+    return (
+        occurrences.filter(date__in=cancelled, is_cancelled=False).update(is_cancelled=True)
+        + occurrences.filter(is_cancelled=True).exclude(date__in=cancelled).update(is_cancelled=False)
+    )
+
+
+def schedules_changed(class_ids):
+    """
+    Refresh the given classes once the current transaction commits. Used by
+    bulk writes, which bypass the model signals.
+    """
+    class_ids = list(class_ids)
+    transaction.on_commit(lambda: refresh_classes(class_ids))
+
+
+def calendar_changed(start, end):
+    transaction.on_commit(lambda: refresh_calendar(start, end))
+
+
+def expected_classes(class_ids, until, since=None):
+    """
+    {class_schedule_id: occurrences held up to until (and from since)}
+    """
+    occurrences = ClassOccurrence.objects.filter(
+        class_schedule_id__in=class_ids, date__lte=until, is_cancelled=False
+    )
+    if since is not None:
+        occurrences = occurrences.filter(date__gte=since)
+    return dict(occurrences.values_list('class_schedule_id').annotate(count=Count('id')).order_by())
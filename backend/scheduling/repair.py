@@ -0,0 +1,401 @@
+"""
+Local repair of an existing timetable when a SchedulingRequest is approved.
+
+Instead of re-solving the department, only the requested ClassSchedule is
+freed and re-placed. If the requested position is blocked, up to
+SCHEDULING_REPAIR_MAX_MOVES other classes are moved out of the way, searching
+the nearest positions first (the vacated slot, then the same day, then the
+rest of the week). The plan with the fewest moves wins and is returned as a
+diff before it is written. Clashes and faculty availability are checked
+against the in-memory OccupancyIndex, so only the classes the search touches
+are read from the database.
+"""
+import datetime
+from itertools import count
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ClassSchedule, Room, TimeSlot, StudentGroup, GroupSchedule
+from . import occupancy
+
+
+class RepairError(Exception):
+    """
+    Raised when a request cannot be satisfied within the move budget
+    """
+
+
+class _Entry:
+    """
+    Position and resources of one ClassSchedule during the search
+    """
+
+    def __init__(self, id, subject_id, faculty_id, room_id, time_slot_id, day, start_time, end_time,
+                 is_active=True, groups=(), size=0):
+        self.id = id
+        self.subject_id = subject_id
+        self.faculty_id = faculty_id
+        self.room_id = room_id
+        self.time_slot_id = time_slot_id
+        self.day = day
+        self.start_time = start_time
+        self.end_time = end_time
+        self.is_active = is_active
+        self.groups = frozenset(groups)
+        self.size = size
+
+    @property
+    def position(self):
+        return (self.day, self.start_time, self.end_time, self.room_id, self.time_slot_id)
+
+    @property
+    def duration(self):
+        return _minutes(self.end_time) - _minutes(self.start_time)
+
+    def placed_at(self, position):
+        day, start_time, end_time, room_id, time_slot_id = position
+        return _Entry(self.id, self.subject_id, self.faculty_id, room_id, time_slot_id, day,
+                      start_time, end_time, self.is_active, self.groups, self.size)
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def _position_dict(position):
+    day, start_time, end_time, room_id, time_slot_id = position
+    return {
+        'day': day,
+        'start_time': start_time.strftime('%H:%M'),
+        'end_time': end_time.strftime('%H:%M'),
+        'room_id': room_id,
+        'time_slot_id': time_slot_id,
+    }
+
+
+class RepairPlan:
+    """
+    Minimal diff that satisfies a request
+    """
+
+    def __init__(self):
+        self.moves = []    # (class_schedule_id, from position, to position)
+        self.created = []  # _Entry objects for new classes
+        self.removed = []  # class_schedule ids deactivated
+
+    @property
+    def diff(self):
+        return {
+            'moved': [
+                {'class_schedule': schedule_id, 'from': _position_dict(old), 'to': _position_dict(new)}
+                for schedule_id, old, new in self.moves
+            ],
+            'created': [_position_dict(entry.position) for entry in self.created],
+            'removed': list(self.removed),
+        }
+
+
+class _Occupancy:
+    """
+    Search state on top of the process-wide OccupancyIndex. Only the
+    classes the search touches are loaded; the ones it moves are kept in an
+    overlay that hides their indexed position.
+    """
+
+    def __init__(self):
+        self.index = occupancy.get_index()
+        self.placed = {}   # class_schedule_id -> _Entry at its position in the search
+        self.hidden = set()  # ids whose indexed position no longer applies
+        self.rooms = list(
+            Room.objects.filter(is_active=True).order_by('capacity', 'id').values_list('id', 'capacity')
+        )
+        self.capacity = dict(self.rooms)
+        self.slots = list(
+            TimeSlot.objects.filter(is_active=True).values_list('id', 'day', 'start_time', 'end_time')
+        )
+
+    def entry(self, schedule_id):
+        """
+        The class at its current position in the search, loaded from the
+        database the first time it is needed
+        """
+        if schedule_id in self.placed:
+            return self.placed[schedule_id]
+        groups = set(GroupSchedule.objects.filter(
+            class_schedule_id=schedule_id, is_active=True
+        ).values_list('group_id', flat=True))
+        size = StudentGroup.students.through.objects.filter(studentgroup_id__in=groups).count()
+        row = ClassSchedule.objects.filter(id=schedule_id).values_list(
+            'id', 'subject_id', 'faculty_id', 'room_id', 'time_slot_id',
+            'day', 'start_time', 'end_time', 'is_active'
+        ).get()
+        return _Entry(*row, groups=groups, size=size)
+
+    def add(self, entry):
+        self.placed[entry.id] = entry
+        if entry.id is not None:
+            self.hidden.add(entry.id)
+
+    def remove(self, entry):
+        self.placed.pop(entry.id, None)
+        if entry.id is not None:
+            self.hidden.add(entry.id)
+
+    def blockers(self, entry, position):
+        """
+        Return the ids of active classes that clash with entry at position, or
+        None when the position is unusable (capacity, faculty availability or
+        an inactive row holding the room/day/start_time key).
+        """
+        day, start_time, end_time, room_id, _ = position
+        if self.capacity.get(room_id, 0) < entry.size:
+            return None
+        found = {}
+        for conflict in self.index.conflicts(
+            day, start_time, end_time, room_id=room_id, faculty_id=entry.faculty_id,
+            group_ids=entry.groups, exclude=entry.id,
+        ):
+            if conflict.kind in ('faculty_availability', 'room_key'):
+                return None
+            if conflict.class_schedule_id not in self.hidden:
+                found[conflict.class_schedule_id] = True
+        for other in self.placed.values():
+            if other.id == entry.id or other.day != day:
+                continue
+            overlaps = other.start_time < end_time and start_time < other.end_time
+            if (other.room_id == room_id and other.start_time == start_time) or (overlaps and (
+                other.room_id == room_id
+                or other.faculty_id == entry.faculty_id
+                or other.groups & entry.groups
+            )):
+                found[other.id] = True
+        return list(found)
+
+    def candidate_positions(self, entry, vacated=None):
+        """
+        Positions for a displaced class, nearest first: a vacated position,
+        then the same day, then the rest of the week; the current room before
+        other rooms, and smaller fitting rooms before larger ones.
+        """
+        positions = []
+        if vacated is not None and _minutes(vacated[2]) - _minutes(vacated[1]) == entry.duration:
+            positions.append(vacated)
+        slots = [s for s in self.slots if _minutes(s[3]) - _minutes(s[2]) == entry.duration]
+        slots.sort(key=lambda s: (s[1] != entry.day, s[1], s[2]))
+        rooms = [entry.room_id] + [r for r, capacity in self.rooms if r != entry.room_id and capacity >= entry.size]
+        for slot_id, day, start_time, end_time in slots:
+            for room_id in rooms:
+                position = (day, start_time, end_time, room_id, slot_id)
+                if position != entry.position:
+                    positions.append(position)
+        return positions
+
+
+def _target_positions(occupancy, entry, scheduling_request):
+    """
+    Positions that satisfy the request, in order of preference
+    """
+    request_type = scheduling_request.request_type
+    if request_type == 'change_room':
+        if scheduling_request.proposed_room_id is None:
+            raise RepairError('A room change needs a proposed room')
+        return [(entry.day, entry.start_time, entry.end_time, scheduling_request.proposed_room_id, entry.time_slot_id)]
+
+    day = scheduling_request.proposed_day
+    start_time = scheduling_request.proposed_start_time
+    if not day or start_time is None:
+        raise RepairError('A proposed day and start time are required')
+    end_time = scheduling_request.proposed_end_time
+    if end_time is None:
+        end_minutes = _minutes(start_time) + entry.duration
+        end_time = datetime.time(end_minutes // 60, end_minutes % 60)
+    slot_id = next(
+        (s[0] for s in occupancy.slots if s[1] == day and s[2] == start_time and s[3] == end_time),
+        None,
+    )
+    if slot_id is None:
+        raise RepairError(f'No active time slot on {day} at {start_time}-{end_time}')
+
+    if scheduling_request.proposed_room_id is not None:
+        rooms = [scheduling_request.proposed_room_id]
+    else:
+        rooms = [entry.room_id] if entry.room_id is not None else []
+        rooms += [r for r, capacity in occupancy.rooms if r != entry.room_id and capacity >= entry.size]
+    return [(day, start_time, end_time, room_id, slot_id) for room_id in rooms]
+
+
+def _relocate(occupancy, blockers, vacated, max_moves):
+    """
+    Move every blocker to a clash-free position, or return None
+    """
+    if len(blockers) > max_moves:
+        return None
+    moves = []
+    for blocker_id in blockers:
+        blocker = occupancy.entry(blocker_id)
+        occupancy.remove(blocker)
+        for position in occupancy.candidate_positions(blocker, vacated):
+            if occupancy.blockers(blocker, position) == []:
+                moved = blocker.placed_at(position)
+                occupancy.add(moved)
+                moves.append((blocker, moved))
+                if position == vacated:
+                    vacated = None
+                break
+        else:
+            occupancy.add(blocker)
+            for original, moved in reversed(moves):
+                occupancy.remove(moved)
+                occupancy.add(original)
+            return None
+    return moves
+
+
+def plan_repair(scheduling_request, max_moves=None):
+    """
+    Work out the smallest set of changes that satisfies scheduling_request
+    """
+    if max_moves is None:
+        max_moves = getattr(settings, 'SCHEDULING_REPAIR_MAX_MOVES', 3)
+    plan = RepairPlan()
+    request_type = scheduling_request.request_type
+    current = scheduling_request.current_schedule
+
+    if request_type == 'remove_class':
+        if current is None:
+            raise RepairError('Nothing to remove')
+        plan.removed.append(current.id)
+        return plan
+
+    occupancy = _Occupancy()
+    if request_type == 'add_class':
+        faculty = getattr(scheduling_request.requester, 'faculty_profile', None)
+        if faculty is None:
+            raise RepairError('Only faculty members can request new classes')
+        if scheduling_request.proposed_start_time is None or scheduling_request.proposed_end_time is None:
+            raise RepairError('A new class needs a proposed start and end time')
+        if scheduling_request.student_group_id is None:
+            raise RepairError('A new class needs a student group')
+        groups = {scheduling_request.student_group_id}
+        size = StudentGroup.students.through.objects.filter(studentgroup_id__in=groups).count()
+        entry = _Entry(None, scheduling_request.subject_id, faculty.id, None, None,
+                       scheduling_request.proposed_day, scheduling_request.proposed_start_time,
+                       scheduling_request.proposed_end_time, groups=groups, size=size)
+        vacated = None
+    else:
+        if current is None:
+            raise RepairError('The request has no current schedule')
+        entry = occupancy.entry(current.id)
+        occupancy.remove(entry)
+        vacated = entry.position
+
+    options = []
+    for position in _target_positions(occupancy, entry, scheduling_request):
+        blockers = occupancy.blockers(entry, position)
+        if blockers is not None and len(blockers) <= max_moves:
+            options.append((len(blockers), position, blockers))
+    options.sort(key=lambda option: option[0])
+
+    for _, position, blockers in options:
+        placed = entry.placed_at(position)
+        occupancy.add(placed)
+        moves = _relocate(occupancy, blockers, vacated, max_moves)
+        if moves is not None:
+            if entry.id is None:
+                plan.created.append(placed)
+            else:
+                plan.moves.append((entry.id, entry.position, placed.position))
+            plan.moves.extend((original.id, original.position, moved.position) for original, moved in moves)
+            return plan
+        occupancy.remove(placed)
+    raise RepairError(f'No placement found within {max_moves} moves')
+
+
+def _parking_time(room_id, day):
+    """
+    A start time no row uses for room_id on day, used to break cycles of
+    moves without violating the room/day/start_time unique key
+    """
+    used = set(ClassSchedule.objects.filter(room_id=room_id, day=day).values_list('start_time', flat=True))
+    for second in count():
+        candidate = datetime.time(0, second // 60, second % 60)
+        if candidate not in used:
+            return candidate
+
+
+@transaction.atomic
+def apply_repair(plan):
+    """
+    Write a RepairPlan. Moves are ordered so that no two rows ever share a
+    room/day/start_time key; a cycle (such as a swap) is broken by parking
+    one row on an unused start time first.
+    """
+    if plan.removed:
+        for schedule in ClassSchedule.objects.filter(id__in=plan.removed):
+            schedule.is_active = False
+            schedule.save(update_fields=['is_active'])
+        GroupSchedule.objects.filter(class_schedule_id__in=plan.removed).update(is_active=False)
+        occupancy.schedules_changed(plan.removed)
+
+    schedules = ClassSchedule.objects.select_for_update().in_bulk([move[0] for move in plan.moves])
+    key = lambda position: (position[3], position[0], position[1])
+    held = {key(old): schedule_id for schedule_id, old, _ in plan.moves}
+    pending = list(plan.moves)
+    while pending:
+        for index, (schedule_id, old, new) in enumerate(pending):
+            if held.get(key(new), schedule_id) == schedule_id:
+                break
+        else:
+            schedule_id, old, new = pending[0]
+            schedule = schedules[schedule_id]
+            schedule.start_time = _parking_time(schedule.room_id, schedule.day)
+            schedule.save(update_fields=['start_time'])
+            del held[key(old)]
+            old = (schedule.day, schedule.start_time, schedule.end_time, schedule.room_id, schedule.time_slot_id)
+            held[key(old)] = schedule_id
+            pending[0] = (schedule_id, old, new)
+            continue
+        schedule = schedules[schedule_id]
+        day, start_time, end_time, room_id, time_slot_id = new
+        schedule.day = day
+        schedule.start_time = start_time
+        schedule.end_time = end_time
+        schedule.room_id = room_id
+        schedule.time_slot_id = time_slot_id
+        schedule.save(update_fields=['day', 'start_time', 'end_time', 'room_id', 'time_slot_id'])
+        del held[key(old)]
+        del pending[index]
+
+    for entry in plan.created:
+        schedule = ClassSchedule.objects.create(
+            subject_id=entry.subject_id,
+            faculty_id=entry.faculty_id,
+            room_id=entry.room_id,
+            time_slot_id=entry.time_slot_id,
+            day=entry.day,
+            start_time=entry.start_time,
+            end_time=entry.end_time,
+        )
+        for group_id in entry.groups:
+            GroupSchedule.objects.create(group_id=group_id, class_schedule=schedule)
+
+
+@transaction.atomic
+def approve_request(scheduling_request, reviewer, review_notes='', max_moves=None):
+    """
+    Approve a pending SchedulingRequest and repair the timetable around it.
+    Returns the applied RepairPlan; raises RepairError and leaves the request
+    pending when no repair fits the move budget.
+    """
+    if scheduling_request.status != 'pending':
+        raise RepairError(f'Request is already {scheduling_request.status}')
+    plan = plan_repair(scheduling_request, max_moves)
+    apply_repair(plan)
+    scheduling_request.status = 'approved'
+    scheduling_request.reviewed_by = reviewer
+    scheduling_request.reviewed_at = timezone.now()
+    scheduling_request.review_notes = review_notes
+    scheduling_request.save()
+    return plan
@@ -0,0 +1,186 @@
+"""
+Per-room weekly occupancy bitmaps for the free-room finder.
+
+Each room's active classes are folded into one week bitmap (see
+scheduling.bitmaps). The bitmaps are built once per process and updated
+incrementally from the ClassSchedule and Room signals, so finding a free
+room is an AND per room with no query against ClassSchedule. Like the
+occupancy index, the bitmaps are tied to a shared cache version that every
+committed write bumps, and are rebuilt when another process moved it on.
+"""
+import threading
+from collections import namedtuple
+
+from django.db import transaction
+
+from campus_ecosystem.cache_versions import bump_version, get_version
+from .bitmaps import week_mask
+from .models import Room, ClassSchedule
+
+
+VERSION_NAMESPACE = 'scheduling'
+VERSION_KEY = 'room_availability'
+
+_RoomInfo = namedtuple('_RoomInfo', ['capacity', 'room_type', 'department_id', 'is_active'])
+
+
+class RoomAvailabilityIndex:
+    """
+    Week bitmaps of every room, plus the room attributes used for filtering
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.version = None
+        self.rooms = {}      # room_id -> _RoomInfo
+        self.occupied = {}   # room_id -> week bitmap of active classes
+        self.schedules = {}  # class_schedule_id -> (room_id, week bitmap)
+        self.by_room = {}    # room_id -> set of class_schedule ids
+
+    def build(self):
+        with self.lock:
+            self.rooms = {
+                room_id: _RoomInfo(capacity, room_type, department_id, is_active)
+                for room_id, capacity, room_type, department_id, is_active in Room.objects.values_list(
+                    'id', 'capacity', 'room_type', 'department_id', 'is_active'
+                )
+            }
+            self.occupied = {room_id: 0 for room_id in self.rooms}
+            self.schedules = {}
+            self.by_room = {}
+            for row in ClassSchedule.objects.filter(is_active=True).values_list(
+                'id', 'room_id', 'day', 'start_time', 'end_time'
+            ):
+                self._add(*row)
+        return self
+
+    def _add(self, schedule_id, room_id, day, start_time, end_time):
+        mask = week_mask(day, start_time, end_time)
+        self.schedules[schedule_id] = (room_id, mask)
+        self.by_room.setdefault(room_id, set()).add(schedule_id)
+        self.occupied[room_id] = self.occupied.get(room_id, 0) | mask
+
+    def _discard(self, schedule_id):
+        previous = self.schedules.pop(schedule_id, None)
+        if previous is None:
+            return
+        room_id, _ = previous
+        remaining = self.by_room.get(room_id, set())
+        remaining.discard(schedule_id)
+        # Classes in one room can overlap, so rebuild the room's bitmap from
+        # the masks that are left rather than clearing bits.
+        mask = 0
+        for other in remaining:
+            mask |= self.schedules[other][1]
+        self.occupied[room_id] = mask
+
+    def update_schedule(self, schedule):
+        with self.lock:
+            self._discard(schedule.pk)
+            if schedule.is_active:
+                self._add(schedule.pk, schedule.room_id, schedule.day, schedule.start_time, schedule.end_time)
+
+    def remove_schedule(self, schedule_id):
+        with self.lock:
+            self._discard(schedule_id)
+
+    def update_room(self, room):
+        with self.lock:
+            self.rooms[room.pk] = _RoomInfo(room.capacity, room.room_type, room.department_id, room.is_active)
+            self.occupied.setdefault(room.pk, 0)
+
+    def remove_room(self, room_id):
+        with self.lock:
+            self.rooms.pop(room_id, None)
+            self.occupied.pop(room_id, None)
+
+    def refresh(self, schedule_ids):
+        schedule_ids = list(schedule_ids)
+        rows = ClassSchedule.objects.filter(id__in=schedule_ids, is_active=True).values_list(
+            'id', 'room_id', 'day', 'start_time', 'end_time'
+        )
+        with self.lock:
+            for schedule_id in schedule_ids:
+                self._discard(schedule_id)
+            for row in rows:
+                self._add(*row)
+
+    def free_rooms(self, day, start_time, end_time, min_capacity=0, room_type=None, department_id=None):
+        """
+        Ids of active rooms with no class in the range, smallest first
+        """
+        wanted = week_mask(day, start_time, end_time)
+        found = []
+        with self.lock:
+            for room_id, info in self.rooms.items():
+                if not info.is_active or info.capacity < min_capacity:
+                    continue
+                if room_type is not None and info.room_type != room_type:
+                    continue
+                if department_id is not None and info.department_id != department_id:
+                    continue
+                if not self.occupied.get(room_id, 0) & wanted:
+                    found.append((info.capacity, room_id))
+        return [room_id for _, room_id in sorted(found)]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    version = get_version(VERSION_NAMESPACE, VERSION_KEY)
+    if _index is None or _index.version != version:
+        with _index_lock:
+            if _index is None or _index.version != version:
+                _index = RoomAvailabilityIndex().build()
+                _index.version = version
+    return _index
+
+
+def index_loaded():
+    return _index is not None
+
+
+def reset_index():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def index_changed(update):
+    """
+    Once the current transaction commits, bump the shared version and apply
+    update to this process's bitmaps, or drop them if another process
+    bumped the version since they were built
+    """
+    def apply():
+        global _index
+        with _index_lock:
+            version = bump_version(VERSION_NAMESPACE, VERSION_KEY)
+            if _index is not None and _index.version == version - 1:
+                update(_index)
+                _index.version = version
+            else:
+                _index = None
+
+    transaction.on_commit(apply)
+
+
+def schedules_changed(schedule_ids):
+    """
+    Refresh the bitmaps of the given classes once the transaction commits
+    """
+    schedule_ids = list(schedule_ids)
+    index_changed(lambda index: index.refresh(schedule_ids))
+
+
+def find_free_rooms(day, start_time, end_time, min_capacity=0, room_type=None, department=None):
+    """
+    Rooms with no active class between start_time and end_time on day
+    """
+    department_id = getattr(department, 'pk', department)
+    room_ids = get_index().free_rooms(day, start_time, end_time, min_capacity, room_type, department_id)
+    rooms = Room.objects.in_bulk(room_ids)
+    return [rooms[room_id] for room_id in room_ids if room_id in rooms]
@@ -0,0 +1,311 @@
+"""
+Vectorised soft-constraint scoring of timetables.
+
+A timetable for a TimetableProblem is encoded as three integer arrays:
+room x slot (group occupying the room), faculty x slot (busy flags) and
+group x slot (subject taught). Stacking N timetables along a leading axis
+lets every soft penalty - department preference, room capacity slack,
+faculty availability preference, subject spread, faculty gaps and
+back-to-back runs - be computed for the whole batch with a handful of NumPy
+operations. improve() uses this to run a local search that scores batches
+of neighbour timetables at a time.
+"""
+import time
+
+import numpy as np
+from django.conf import settings
+
+
+def _bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class TimetableEvaluator:
+    """
+    Scores batches of encoded timetables for one problem
+    """
+
+    def __init__(self, problem):
+        self.problem = problem
+        self.slot_count = len(problem.slots)
+        pad = self.slot_count  # index of an always-empty column
+        room_count, faculty_count = len(problem.rooms), len(problem.faculty)
+
+        self.capacity = np.array([capacity for _, capacity, _ in problem.rooms], dtype=np.float64)
+        self.own_room = np.array(
+            [bool((problem.own_rooms >> r) & 1) for r in range(room_count)], dtype=bool
+        )
+        # Group sizes shifted by one so that 0 means "room free"
+        self.group_size = np.array([0] + [size for _, size in problem.groups], dtype=np.float64)
+        self.preferred = np.zeros((faculty_count, self.slot_count + 1), dtype=bool)
+        self.external = np.zeros((faculty_count, self.slot_count + 1), dtype=bool)
+        for f in range(faculty_count):
+            self.preferred[f, list(_bits(problem.faculty_preferred[f]))] = True
+            self.external[f, list(_bits(problem.faculty_busy[f]))] = True
+        self.preferred[:, pad] = True
+
+        longest = max((length for _, length in problem.day_spans), default=0)
+        self.day_layout = np.full((len(problem.day_spans), longest), pad, dtype=np.intp)
+        for day, (offset, length) in enumerate(problem.day_spans):
+            self.day_layout[day, :length] = np.arange(offset, offset + length)
+
+        subject_ids = sorted({subject_id for _, subject_id, _ in problem.sessions})
+        self.subject_code = {subject_id: code + 1 for code, subject_id in enumerate(subject_ids)}
+
+        weights = problem.weights
+        self.w_dept = weights.get('department_preference', 0)
+        self.w_slack = weights.get('room_capacity', 0)
+        self.w_avail = weights.get('faculty_availability', 0)
+        self.w_spread = weights.get('subject_spread', 0)
+        self.w_gaps = weights.get('faculty_gaps', 0)
+        self.w_b2b = weights.get('back_to_back', 0)
+        self.baseline = self._day_shape_penalty(self.external[None])[0]
+
+    def empty(self, batch=1):
+        problem = self.problem
+        columns = self.slot_count + 1
+        return (
+            np.zeros((batch, len(problem.rooms), columns), dtype=np.int32),
+            np.zeros((batch, len(problem.faculty), columns), dtype=bool),
+            np.zeros((batch, len(problem.groups), columns), dtype=np.int32),
+        )
+
+    def encode(self, placements):
+        """
+        Encode one list of (session, slot, room) placements as a batch of one
+        """
+        rooms, faculty, groups = self.empty()
+        for session, slot, room in placements:
+            group, subject_id, teacher = self.problem.sessions[session]
+            rooms[0, room, slot] = group + 1
+            faculty[0, teacher, slot] = True
+            groups[0, group, slot] = self.subject_code[subject_id]
+        return rooms, faculty, groups
+
+    def _day_shape_penalty(self, busy):
+        """
+        Faculty gap and back-to-back penalty for a (N, F, S+1) busy array
+        """
+        by_day = busy[:, :, self.day_layout]  # (N, F, D, L)
+        length = by_day.shape[-1]
+        if length == 0:
+            return np.zeros(busy.shape[0])
+        count = by_day.sum(axis=-1)
+        first = by_day.argmax(axis=-1)
+        last = length - 1 - by_day[..., ::-1].argmax(axis=-1)
+        gaps = np.where(count > 0, last - first + 1 - count, 0).sum(axis=(1, 2))
+
+        run = self.problem.max_consecutive + 1
+        if run > length:
+            excess = np.zeros(busy.shape[0])
+        else:
+            cumulative = np.concatenate(
+                [np.zeros(by_day.shape[:-1] + (1,), dtype=np.int64), by_day.cumsum(axis=-1)], axis=-1
+            )
+            window = cumulative[..., run:] - cumulative[..., :-run]
+            excess = (window == run).sum(axis=(1, 2, 3))
+        return self.w_gaps * gaps + self.w_b2b * excess
+
+    def score(self, rooms, faculty, groups):
+        """
+        Soft penalty of every timetable in the batch, as a (N,) array
+        """
+        occupied = rooms > 0
+        department = (occupied & ~self.own_room[None, :, None]).sum(axis=(1, 2))
+
+        size = self.group_size[rooms]
+        capacity = self.capacity[None, :, None]
+        slack = np.where(occupied & (capacity > 0), (capacity - size) / np.maximum(capacity, 1), 0.0)
+        slack = slack.sum(axis=(1, 2))
+
+        unpreferred = (faculty & ~self.preferred[None]).sum(axis=(1, 2))
+
+        repeats = self._repeats(groups)
+
+        shape = self._day_shape_penalty(faculty | self.external[None]) - self.baseline
+        return (
+            self.w_dept * department
+            + self.w_slack * slack
+            + self.w_avail * unpreferred
+            + self.w_spread * repeats
+            + shape
+        )
+
+    def _repeats(self, groups):
+        """
+        Classes of a subject beyond the first on the same day, for a
+        (N, G, S+1) subject array
+        """
+        subjects = np.sort(groups[:, :, self.day_layout], axis=-1)  # (N, G, D, L)
+        return ((subjects[..., 1:] == subjects[..., :-1]) & (subjects[..., 1:] > 0)).sum(axis=(1, 2, 3))
+
+    def _slack(self, room, size):
+        capacity = self.capacity[room]
+        return np.where(capacity > 0, (capacity - size) / np.maximum(capacity, 1), 0.0)
+
+    def score_moves(self, current, faculty, groups, moves):
+        """
+        Scores of the neighbours of an encoded timetable (a batch of one)
+        whose current score is current. moves is a tuple of equal-length
+        arrays (group, teacher, old_slot, old_room, new_slot, new_room).
+        Only the rows a move touches are re-scored, so the cost per
+        neighbour does not grow with the size of the timetable.
+        """
+        group, teacher, old_slot, old_room, new_slot, new_room = moves
+        rows = np.arange(len(group))
+
+        delta = self.w_dept * (
+            (~self.own_room[new_room]).astype(np.float64) - (~self.own_room[old_room])
+        )
+        size = self.group_size[group + 1]
+        delta += self.w_slack * (self._slack(new_room, size) - self._slack(old_room, size))
+        delta += self.w_avail * (
+            (~self.preferred[teacher, new_slot]).astype(np.float64) - (~self.preferred[teacher, old_slot])
+        )
+
+        busy = faculty[0, teacher]  # (B, S+1)
+        moved = busy.copy()
+        moved[rows, old_slot] = False
+        moved[rows, new_slot] = True
+        external = self.external[teacher]
+        delta += (
+            self._day_shape_penalty((moved | external)[:, None])
+            - self._day_shape_penalty((busy | external)[:, None])
+        )
+
+        subjects = groups[0, group]  # (B, S+1)
+        shifted = subjects.copy()
+        shifted[rows, old_slot] = 0
+        shifted[rows, new_slot] = subjects[rows, old_slot]
+        delta += self.w_spread * (self._repeats(shifted[:, None]) - self._repeats(subjects[:, None]))
+        return current + delta
+
+
+class _State:
+    """
+    Bitset occupancy of a placement list, supporting single-session moves
+    """
+
+    def __init__(self, problem, placements):
+        self.problem = problem
+        self.placements = list(placements)
+        self.slot_rooms = [0] * len(problem.slots)
+        self.group_busy = [0] * len(problem.groups)
+        self.faculty_busy = [0] * len(problem.faculty)
+        for session, slot, room in self.placements:
+            self._mark(session, slot, room, True)
+
+    def _mark(self, session, slot, room, on):
+        group, _, faculty = self.problem.sessions[session]
+        bit = 1 << slot
+        if on:
+            self.slot_rooms[slot] |= 1 << room
+            self.group_busy[group] |= bit
+            self.faculty_busy[faculty] |= bit
+        else:
+            self.slot_rooms[slot] &= ~(1 << room)
+            self.group_busy[group] &= ~bit
+            self.faculty_busy[faculty] &= ~bit
+
+    def _expand(self, mask):
+        expanded = 0
+        for slot in _bits(mask):
+            expanded |= self.problem.slot_conflicts[slot]
+        return expanded
+
+    def moves_for(self, index, rng):
+        """
+        A random feasible new (slot, room) for placement index, or None
+        """
+        problem = self.problem
+        session, slot, room = self.placements[index]
+        group, _, faculty = problem.sessions[session]
+        self._mark(session, slot, room, False)
+        try:
+            taken = self._expand(self.group_busy[group] | self.faculty_busy[faculty]) | problem.faculty_busy[faculty]
+            free = problem.faculty_allowed[faculty] & ~taken
+            slots = list(_bits(free))
+            rng.shuffle(slots)
+            for candidate in slots:
+                busy_rooms = 0
+                for other in _bits(problem.slot_conflicts[candidate]):
+                    busy_rooms |= self.slot_rooms[other]
+                rooms = problem.group_rooms[group] & ~busy_rooms
+                rooms = [r for r in _bits(rooms) if not (problem.room_blocked[r] >> candidate) & 1]
+                if rooms:
+                    new_room = rng.choice(rooms)
+                    if (candidate, new_room) != (slot, room):
+                        return candidate, new_room
+            return None
+        finally:
+            self._mark(session, slot, room, True)
+
+    def apply(self, index, slot, room):
+        session, old_slot, old_room = self.placements[index]
+        self._mark(session, old_slot, old_room, False)
+        self._mark(session, slot, room, True)
+        self.placements[index] = (session, slot, room)
+
+
+def improve(problem, solution, deadline, rng, on_progress=None, should_stop=None, batch_size=None):
+    """
+    Local search from solution until deadline (a time.monotonic() value).
+
+    Each step proposes batch_size single-session moves, scores all the
+    neighbour timetables in one vectorised call and keeps the best one if it
+    does not make things worse. Updates and returns solution.
+    """
+    if not solution.placements:
+        return solution
+    if batch_size is None:
+        batch_size = getattr(settings, 'SCHEDULING_LOCAL_SEARCH_BATCH', 128)
+    evaluator = TimetableEvaluator(problem)
+    state = _State(problem, solution.placements)
+    rooms, faculty, groups = evaluator.encode(state.placements)
+    current = float(evaluator.score(rooms, faculty, groups)[0])
+
+    while time.monotonic() < deadline and current > 0:
+        if should_stop is not None and should_stop():
+            break
+        moves = []
+        for _ in range(batch_size):
+            index = rng.randrange(len(state.placements))
+            move = state.moves_for(index, rng)
+            if move is not None:
+                moves.append((index,) + move)
+        if not moves:
+            break
+
+        columns = np.array([
+            (problem.sessions[state.placements[index][0]][0],
+             problem.sessions[state.placements[index][0]][2],
+             state.placements[index][1], state.placements[index][2], slot, room)
+            for index, slot, room in moves
+        ], dtype=np.intp)
+        scores = evaluator.score_moves(current, faculty, groups, tuple(columns.T))
+        best = int(scores.argmin())
+        if scores[best] <= current:
+            improved = scores[best] < current - 1e-9
+            index, slot, room = moves[best]
+            group, teacher, old_slot, old_room, _, _ = columns[best]
+            rooms[0, old_room, old_slot] = 0
+            rooms[0, room, slot] = group + 1
+            faculty[0, teacher, old_slot] = False
+            faculty[0, teacher, slot] = True
+            code = groups[0, group, old_slot]
+            groups[0, group, old_slot] = 0
+            groups[0, group, slot] = code
+            state.apply(index, slot, room)
+            current = float(scores[best])
+            if improved:
+                solution.placements = list(state.placements)
+                solution.penalty = round(current, 4)
+                if on_progress is not None:
+                    on_progress(solution)
+
+    solution.placements = list(state.placements)
+    solution.penalty = round(current, 4)
+    return solution
@@ -0,0 +1,109 @@
+from rest_framework import serializers
+
+from accounts.models import Department
+from .models import (
+    ClassOccurrence, ClassSchedule, Room, StudentGroup, TimeSlot, TimetableGenerationJob, TimetableVersion
+)
+
+
+class RoomSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Room
+        fields = '__all__'
+
+
+class FreeRoomQuerySerializer(serializers.Serializer):
+    day = serializers.ChoiceField(choices=TimeSlot.DAY_CHOICES)
+    start_time = serializers.TimeField()
+    end_time = serializers.TimeField()
+    capacity = serializers.IntegerField(min_value=0, required=False, default=0)
+    room_type = serializers.ChoiceField(choices=Room.ROOM_TYPE_CHOICES, required=False)
+    department = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        if attrs['start_time'] >= attrs['end_time']:
+            raise serializers.ValidationError('start_time must be before end_time.')
+        return attrs
+
+
+class TimetableGenerationJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TimetableGenerationJob
+        fields = '__all__'
+        read_only_fields = [
+            'status', 'stop_requested', 'timetable', 'best_penalty', 'placed_sessions',
+            'total_sessions', 'iterations', 'elapsed', 'error', 'created_by', 'finished_at',
+        ]
+
+
+class TimetableGenerationStartSerializer(serializers.Serializer):
+    department = serializers.PrimaryKeyRelatedField(queryset=Department.objects.all())
+    academic_year = serializers.CharField(max_length=10)
+    semester = serializers.IntegerField(min_value=1)
+    time_limit = serializers.FloatField(min_value=1, required=False)
+    name = serializers.CharField(max_length=100, required=False, default='')
+
+
+class TimetableVersionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TimetableVersion
+        fields = '__all__'
+        read_only_fields = ['timetable', 'parent', 'depth', 'status', 'created_by', 'published_at']
+
+
+class TimetableVersionCreateSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=100, required=False, default='')
+
+
+class VersionEntrySerializer(serializers.Serializer):
+    group = serializers.IntegerField()
+    class_schedule = serializers.IntegerField()
+
+
+class TimetableVersionEditSerializer(serializers.Serializer):
+    add = VersionEntrySerializer(many=True, required=False, default=list)
+    remove = VersionEntrySerializer(many=True, required=False, default=list)
+
+    def validate(self, attrs):
+        entries = attrs['add'] + attrs['remove']
+        if not entries:
+            raise serializers.ValidationError('Give entries to add or remove.')
+        group_ids = {entry['group'] for entry in entries}
+        class_schedule_ids = {entry['class_schedule'] for entry in entries}
+        missing_groups = group_ids - set(StudentGroup.objects.filter(id__in=group_ids).values_list('id', flat=True))
+        missing_classes = class_schedule_ids - set(
+            ClassSchedule.objects.filter(id__in=class_schedule_ids).values_list('id', flat=True)
+        )
+        errors = {}
+        if missing_groups:
+            errors['group'] = f"Unknown student groups: {', '.join(map(str, sorted(missing_groups)))}."
+        if missing_classes:
+            errors['class_schedule'] = f"Unknown classes: {', '.join(map(str, sorted(missing_classes)))}."
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
+
+class ClassOccurrenceSerializer(serializers.ModelSerializer):
+    subject = serializers.CharField(source='class_schedule.subject.code', read_only=True)
+    faculty = serializers.IntegerField(source='class_schedule.faculty_id', read_only=True)
+    room = serializers.CharField(source='class_schedule.room.name', read_only=True)
+    start_time = serializers.TimeField(source='class_schedule.start_time', read_only=True)
+    end_time = serializers.TimeField(source='class_schedule.end_time', read_only=True)
+
+    class Meta:
+        model = ClassOccurrence
+        fields = ['id', 'class_schedule', 'date', 'is_cancelled', 'subject', 'faculty', 'room', 'start_time', 'end_time']
+
+
+class OccurrenceQuerySerializer(serializers.Serializer):
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    group = serializers.PrimaryKeyRelatedField(queryset=StudentGroup.objects.all(), required=False)
+    faculty = serializers.IntegerField(required=False)
+    room = serializers.PrimaryKeyRelatedField(queryset=Room.objects.all(), required=False)
+
+    def validate(self, attrs):
+        if attrs['start_date'] > attrs['end_date']:
+            raise serializers.ValidationError('start_date must not be after end_date.')
+        return attrs
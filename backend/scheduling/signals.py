@@ -0,0 +1,44 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import faculty_availability, occupancy, occurrences, room_availability
+from .models import ClassSchedule, GroupSchedule, Room, FacultyAvailability
+
+
+@receiver(post_save, sender=ClassSchedule)
+def class_schedule_saved(sender, instance, **kwargs):
+    occupancy.index_changed(lambda index: index.update_schedule(instance))
+    room_availability.index_changed(lambda index: index.update_schedule(instance))
+    occurrences.schedules_changed([instance.pk])
+
+
+@receiver(post_delete, sender=ClassSchedule)
+def class_schedule_deleted(sender, instance, **kwargs):
+    schedule_id = instance.pk
+    occupancy.index_changed(lambda index: index.remove_schedule(schedule_id))
+    room_availability.index_changed(lambda index: index.remove_schedule(schedule_id))
+
+
+@receiver(post_save, sender=GroupSchedule)
+@receiver(post_delete, sender=GroupSchedule)
+def group_schedule_changed(sender, instance, **kwargs):
+    occupancy.schedules_changed([instance.class_schedule_id])
+
+
+@receiver(post_save, sender=Room)
+def room_saved(sender, instance, **kwargs):
+    room_availability.index_changed(lambda index: index.update_room(instance))
+
+
+@receiver(post_delete, sender=Room)
+def room_deleted(sender, instance, **kwargs):
+    room_id = instance.pk
+    room_availability.index_changed(lambda index: index.remove_room(room_id))
+
+
+@receiver(post_save, sender=FacultyAvailability)
+@receiver(post_delete, sender=FacultyAvailability)
+def faculty_availability_changed(sender, instance, **kwargs):
+    faculty_id = instance.faculty_id
+    transaction.on_commit(lambda: faculty_availability.invalidate(faculty_id))
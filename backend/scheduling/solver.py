@@ -0,0 +1,569 @@
+"""
+Native timetable solver for a single department.
+
+The problem is loaded once from the scheduling models into plain Python data
+(so it can be pickled and solved away from the database). Occupancy of rooms,
+faculty and student groups is kept as per-week bitsets with one bit per active
+TimeSlot, which makes every clash check a single AND. Sessions are placed by a
+randomised greedy construction that is restarted until the time budget runs
+out, keeping the best timetable found. The result is written back with one
+bulk write of ClassSchedule, GroupSchedule and TimetableEntry rows.
+"""
+import random
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+
+from accounts.models import FacultyProfile
+from . import occupancy, occurrences, room_availability
+from .bitmaps import week_mask
+from .faculty_availability import get_masks
+from .scoring import improve
+from .models import (
+    Subject, Room, TimeSlot, ClassSchedule, StudentGroup, GroupSchedule,
+    SchedulingConstraint, Timetable, TimetableEntry, TimetableVersionChange,
+)
+
+
+DAY_ORDER = [day for day, _ in TimeSlot.DAY_CHOICES]
+
+# Constraint types that can be switched between hard and soft through
+# SchedulingConstraint rows. Clashes and room capacity are always hard.
+DEFAULT_HARD_CONSTRAINTS = {'faculty_availability'}
+
+DEFAULT_SOFT_WEIGHTS = {
+    'department_preference': 2,
+    'room_capacity': 1,
+    'faculty_availability': 3,
+    'faculty_gaps': 1,
+    'back_to_back': 2,
+    'subject_spread': 2,
+}
+
+REGENERATABLE_STATUSES = ('draft', 'rejected')
+
+
+def _bits(mask):
+    """
+    Yield the indexes of the set bits of mask, lowest first
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _popcount(mask):
+    return bin(mask).count('1')
+
+
+@lru_cache(maxsize=None)
+def _day_shape(day_bits, max_consecutive):
+    """
+    Return (gaps, excess) for one day of busy slots: the number of idle slots
+    between the first and last class, and the number of classes beyond the
+    allowed run of back-to-back classes.
+    """
+    if not day_bits:
+        return 0, 0
+    span = day_bits.bit_length() - ((day_bits & -day_bits).bit_length() - 1)
+    gaps = span - _popcount(day_bits)
+    excess = 0
+    run = 0
+    while day_bits:
+        if day_bits & 1:
+            run += 1
+            if run > max_consecutive:
+                excess += 1
+        else:
+            run = 0
+        day_bits >>= 1
+    return gaps, excess
+
+
+class TimetableProblem:
+    """
+    Picklable description of one department's timetabling problem
+    """
+
+    def __init__(self, department_id, academic_year, semester):
+        self.department_id = department_id
+        self.academic_year = academic_year
+        self.semester = semester
+        self.slots = []              # (time_slot_id, day, start_time, end_time)
+        self.slot_conflicts = []     # per slot: mask of overlapping slots
+        self.slot_day = []           # per slot: index into day_spans
+        self.day_spans = []          # (first slot index, number of slots)
+        self.rooms = []              # (room_id, capacity, department_id)
+        self.room_blocked = []       # per room: slots taken outside this timetable
+        self.own_rooms = 0           # mask of rooms owned by the department
+        self.groups = []             # (group_id, size)
+        self.group_rooms = []        # per group: mask of rooms it may use
+        self.faculty = []            # faculty_id
+        self.faculty_allowed = []    # per faculty: slots allowed by hard constraints
+        self.faculty_preferred = []  # per faculty: slots without a soft penalty
+        self.faculty_busy = []       # per faculty: slots taken outside this timetable
+        self.sessions = []           # (group index, subject_id, faculty index)
+        self.weights = dict(DEFAULT_SOFT_WEIGHTS)
+        self.hard_constraints = set(DEFAULT_HARD_CONSTRAINTS)
+        self.max_consecutive = getattr(settings, 'SCHEDULING_MAX_CONSECUTIVE_CLASSES', 3)
+
+    @property
+    def all_slots(self):
+        return (1 << len(self.slots)) - 1
+
+    def interval_mask(self, day, start_time, end_time):
+        """
+        Mask of the slots that overlap [start_time, end_time) on day
+        """
+        mask = 0
+        for index, (_, slot_day, slot_start, slot_end) in enumerate(self.slots):
+            if slot_day == day and slot_start < end_time and start_time < slot_end:
+                mask |= 1 << index
+        return mask
+
+    def key_mask(self, day, start_time):
+        """
+        Mask of the slots that would reuse the (day, start_time) part of the
+        ClassSchedule room/day/start_time unique key
+        """
+        mask = 0
+        for index, (_, slot_day, slot_start, _) in enumerate(self.slots):
+            if slot_day == day and slot_start == start_time:
+                mask |= 1 << index
+        return mask
+
+    def day_bits(self, mask, day_index):
+        offset, length = self.day_spans[day_index]
+        return (mask >> offset) & ((1 << length) - 1)
+
+
+class Solution:
+    """
+    Result of a solve: placements plus the sessions that could not be placed
+    """
+
+    def __init__(self, placements, unplaced, penalty):
+        self.placements = placements  # (session index, slot index, room index)
+        self.unplaced = unplaced      # session indexes
+        self.penalty = penalty
+        self.iterations = 0
+        self.elapsed = 0.0
+
+    @property
+    def key(self):
+        return (len(self.unplaced), self.penalty)
+
+    @property
+    def is_complete(self):
+        return not self.unplaced
+
+
+def load_constraints(problem):
+    """
+    Apply active SchedulingConstraint rows to the problem's hard set and weights
+    """
+    hard_types = set()
+    soft_weights = {}
+    for constraint_type, is_hard, weight in SchedulingConstraint.objects.filter(
+        is_active=True
+    ).values_list('constraint_type', 'is_hard_constraint', 'weight'):
+        if is_hard:
+            hard_types.add(constraint_type)
+        else:
+            soft_weights[constraint_type] = soft_weights.get(constraint_type, 0) + weight
+    for constraint_type, weight in soft_weights.items():
+        problem.weights[constraint_type] = weight
+        if constraint_type not in hard_types:
+            problem.hard_constraints.discard(constraint_type)
+    problem.hard_constraints |= hard_types
+
+
+def default_curriculum(department, groups):
+    """
+    Every active subject of the department is taught to every group for
+    `credits` sessions a week, by the least loaded department faculty member.
+    """
+    faculty_ids = list(
+        FacultyProfile.objects.filter(department=department).order_by('id').values_list('id', flat=True)
+    )
+    if not faculty_ids:
+        return []
+    load = {faculty_id: 0 for faculty_id in faculty_ids}
+    curriculum = []
+    subjects = Subject.objects.filter(department=department, is_active=True).values_list('id', 'credits')
+    for group_id, _ in groups:
+        for subject_id, credits in subjects:
+            faculty_id = min(faculty_ids, key=lambda f: (load[f], f))
+            load[faculty_id] += credits
+            curriculum.append((group_id, subject_id, faculty_id, credits))
+    return curriculum
+
+
+def build_problem(department, academic_year, semester, curriculum=None, exclude_timetable=None,
+                  replaced_timetables=()):
+    """
+    Load everything the solver needs for a department into a TimetableProblem.
+
+    curriculum is an optional list of (group_id, subject_id, faculty_id,
+    sessions_per_week); by default it is derived with default_curriculum().
+    ClassSchedule rows of exclude_timetable are ignored, since a regenerated
+    timetable replaces them. The rows of replaced_timetables, other
+    departments' timetables regenerated in the same run, do not block rooms.
+    """
+    problem = TimetableProblem(department.id, academic_year, semester)
+    load_constraints(problem)
+
+    slots = list(TimeSlot.objects.filter(is_active=True).values_list('id', 'day', 'start_time', 'end_time'))
+    slots.sort(key=lambda s: (DAY_ORDER.index(s[1]), s[2], s[3]))
+    problem.slots = slots
+    days = []
+    for index, (_, day, _, _) in enumerate(slots):
+        if not days or days[-1][0] != day:
+            days.append((day, index, 0))
+        name, offset, length = days[-1]
+        days[-1] = (name, offset, length + 1)
+        problem.slot_day.append(len(days) - 1)
+    problem.day_spans = [(offset, length) for _, offset, length in days]
+    problem.slot_conflicts = [
+        problem.interval_mask(day, start, end) for _, day, start, end in slots
+    ]
+
+    groups = list(
+        StudentGroup.objects.filter(department=department, is_active=True)
+        .annotate(size=Count('students'))
+        .order_by('id')
+        .values_list('id', 'size')
+    )
+    problem.groups = groups
+    group_index = {group_id: index for index, (group_id, _) in enumerate(groups)}
+
+    rooms = list(
+        Room.objects.filter(is_active=True)
+        .filter(Q(department=department) | Q(department__isnull=True))
+        .order_by('capacity', 'id')
+        .values_list('id', 'capacity', 'department_id')
+    )
+    problem.rooms = rooms
+    room_index = {room_id: index for index, (room_id, _, _) in enumerate(rooms)}
+    for index, (_, _, room_department) in enumerate(rooms):
+        if room_department == department.id:
+            problem.own_rooms |= 1 << index
+    for _, size in groups:
+        mask = 0
+        for index, (_, capacity, _) in enumerate(rooms):
+            if capacity >= size:
+                mask |= 1 << index
+        if 'department_preference' in problem.hard_constraints:
+            mask &= problem.own_rooms
+        problem.group_rooms.append(mask)
+
+    if curriculum is None:
+        curriculum = default_curriculum(department, groups)
+    faculty_index = {}
+    for group_id, subject_id, faculty_id, count in curriculum:
+        if group_id not in group_index:
+            continue
+        if faculty_id not in faculty_index:
+            faculty_index[faculty_id] = len(problem.faculty)
+            problem.faculty.append(faculty_id)
+        for _ in range(count):
+            problem.sessions.append((group_index[group_id], subject_id, faculty_index[faculty_id]))
+
+    problem.room_blocked = [0] * len(rooms)
+    problem.faculty_busy = [0] * len(problem.faculty)
+    existing = ClassSchedule.objects.filter(
+        Q(room_id__in=list(room_index)) | Q(faculty_id__in=list(faculty_index))
+    )
+    if exclude_timetable is not None:
+        existing = existing.exclude(timetable_entries__timetable=exclude_timetable)
+    replaced = set()
+    if replaced_timetables:
+        replaced = set(ClassSchedule.objects.filter(
+            timetable_entries__timetable__in=replaced_timetables
+        ).values_list('id', flat=True))
+    for schedule_id, room_id, faculty_id, day, start, end, is_active in existing.values_list(
+        'id', 'room_id', 'faculty_id', 'day', 'start_time', 'end_time', 'is_active'
+    ):
+        if schedule_id in replaced:
+            room_id = None
+        if not is_active:
+            # Inactive rows still hold the room/day/start_time unique key
+            if room_id in room_index:
+                problem.room_blocked[room_index[room_id]] |= problem.key_mask(day, start)
+            continue
+        mask = problem.interval_mask(day, start, end)
+        if room_id in room_index:
+            problem.room_blocked[room_index[room_id]] |= mask | problem.key_mask(day, start)
+        if faculty_id in faculty_index:
+            problem.faculty_busy[faculty_index[faculty_id]] |= mask
+
+    slot_masks = [week_mask(day, start, end) for _, day, start, end in slots]
+    availability = get_masks(problem.faculty)
+    hard_availability = 'faculty_availability' in problem.hard_constraints
+    for faculty_id in problem.faculty:
+        mask = availability[faculty_id]
+        preferred = 0
+        for slot, slot_mask in enumerate(slot_masks):
+            if mask.is_available(slot_mask):
+                preferred |= 1 << slot
+        problem.faculty_preferred.append(preferred)
+        problem.faculty_allowed.append(preferred if hard_availability else problem.all_slots)
+    return problem
+
+
+class _Construction:
+    """
+    One greedy pass over the sessions in a given order
+    """
+
+    def __init__(self, problem):
+        self.problem = problem
+        slot_count = len(problem.slots)
+        self.slot_rooms = [0] * slot_count
+        for room, blocked in enumerate(problem.room_blocked):
+            for slot in _bits(blocked):
+                self.slot_rooms[slot] |= 1 << room
+        self.group_taken = [0] * len(problem.groups)
+        self.faculty_taken = list(problem.faculty_busy)
+        self.faculty_classes = list(problem.faculty_busy)
+        self.subject_days = {}
+
+    def run(self, order, rng=None, noise=0.0):
+        problem = self.problem
+        weights = problem.weights
+        w_dept = weights.get('department_preference', 0)
+        w_slack = weights.get('room_capacity', 0)
+        w_avail = weights.get('faculty_availability', 0)
+        w_spread = weights.get('subject_spread', 0)
+        w_gaps = weights.get('faculty_gaps', 0)
+        w_b2b = weights.get('back_to_back', 0)
+        max_consecutive = problem.max_consecutive
+
+        placements = []
+        unplaced = []
+        penalty = 0.0
+        for session in order:
+            group, subject_id, faculty = problem.sessions[session]
+            size = problem.groups[group][1]
+            free = (
+                problem.faculty_allowed[faculty]
+                & ~self.group_taken[group]
+                & ~self.faculty_taken[faculty]
+            )
+            best = None
+            for slot in _bits(free):
+                rooms = problem.group_rooms[group] & ~self.slot_rooms[slot]
+                if not rooms:
+                    continue
+                own = rooms & problem.own_rooms
+                pick = own or rooms
+                room = (pick & -pick).bit_length() - 1
+                capacity = problem.rooms[room][1]
+
+                cost = 0.0
+                if not own:
+                    cost += w_dept
+                if capacity:
+                    cost += w_slack * (capacity - size) / capacity
+                if not (problem.faculty_preferred[faculty] >> slot) & 1:
+                    cost += w_avail
+                day = problem.slot_day[slot]
+                if (self.subject_days.get((group, subject_id), 0) >> day) & 1:
+                    cost += w_spread
+                before = problem.day_bits(self.faculty_classes[faculty], day)
+                after = problem.day_bits(self.faculty_classes[faculty] | (1 << slot), day)
+                gaps_before, excess_before = _day_shape(before, max_consecutive)
+                gaps_after, excess_after = _day_shape(after, max_consecutive)
+                cost += w_gaps * (gaps_after - gaps_before) + w_b2b * (excess_after - excess_before)
+
+                score = cost + rng.random() * noise if noise else cost
+                if best is None or score < best[0]:
+                    best = (score, cost, slot, room)
+
+            if best is None:
+                unplaced.append(session)
+                continue
+            _, cost, slot, room = best
+            conflicts = problem.slot_conflicts[slot]
+            for other in _bits(conflicts):
+                self.slot_rooms[other] |= 1 << room
+            self.group_taken[group] |= conflicts
+            self.faculty_taken[faculty] |= conflicts
+            self.faculty_classes[faculty] |= 1 << slot
+            key = (group, subject_id)
+            self.subject_days[key] = self.subject_days.get(key, 0) | (1 << problem.slot_day[slot])
+            placements.append((session, slot, room))
+            penalty += cost
+        return Solution(placements, unplaced, round(penalty, 4))
+
+
+def session_difficulty(problem):
+    """
+    Static difficulty of each session: fewer usable (slot, room) pairs and a
+    busier faculty member make a session harder, so it is placed earlier.
+    """
+    load = [0] * len(problem.faculty)
+    for _, _, faculty in problem.sessions:
+        load[faculty] += 1
+    difficulty = []
+    for group, _, faculty in problem.sessions:
+        slots = _popcount(problem.faculty_allowed[faculty] & ~problem.faculty_busy[faculty])
+        rooms = _popcount(problem.group_rooms[group])
+        difficulty.append(slots * rooms / (1 + load[faculty]))
+    return difficulty
+
+
+def solve(problem, time_limit=None, max_iterations=None, seed=None, on_progress=None, should_stop=None):
+    """
+    Search for the best timetable within time_limit seconds.
+
+    The first pass is a deterministic most-constrained-first greedy. Later
+    passes perturb the order and the candidate scores, and move sessions that
+    failed to place to the front of the queue. The last
+    SCHEDULING_LOCAL_SEARCH_SHARE of the budget is spent on a vectorised
+    local search from the best pass (see scheduling.scoring).
+    on_progress(solution) is called whenever the best solution improves;
+    should_stop() is polled between passes so callers can end the search
+    early.
+    """
+    if time_limit is None:
+        time_limit = getattr(settings, 'SCHEDULING_SOLVER_TIME_LIMIT', 10)
+    search_share = getattr(settings, 'SCHEDULING_LOCAL_SEARCH_SHARE', 0.3)
+    rng = random.Random(seed)
+    started = time.monotonic()
+    deadline = started + time_limit
+    restart_deadline = deadline - time_limit * search_share
+    difficulty = session_difficulty(problem)
+    priority = [0] * len(problem.sessions)
+    best = None
+    iteration = 0
+
+    def report(solution):
+        solution.iterations = iteration
+        solution.elapsed = time.monotonic() - started
+        if on_progress is not None:
+            on_progress(solution)
+
+    while True:
+        if iteration == 0:
+            order = sorted(range(len(problem.sessions)), key=lambda s: difficulty[s])
+            candidate = _Construction(problem).run(order)
+        else:
+            jitter = {s: difficulty[s] * (1 + rng.random()) for s in range(len(problem.sessions))}
+            order = sorted(range(len(problem.sessions)), key=lambda s: (-priority[s], jitter[s]))
+            candidate = _Construction(problem).run(order, rng=rng, noise=0.5)
+        for session in candidate.unplaced:
+            priority[session] += 1
+        iteration += 1
+
+        if best is None or candidate.key < best.key:
+            best = candidate
+            report(best)
+        if best.is_complete and best.penalty == 0:
+            break
+        if max_iterations is not None and iteration >= max_iterations:
+            break
+        if should_stop is not None and should_stop():
+            break
+        if time.monotonic() >= restart_deadline:
+            improve(problem, best, deadline, rng, on_progress=report, should_stop=should_stop)
+            break
+    best.iterations = iteration
+    best.elapsed = time.monotonic() - started
+    return best
+
+
+def regeneration_blocker(timetable):
+    """
+    Why a timetable cannot be regenerated, or None if it can. Classes
+    referenced by saved versions are kept, so a versioned timetable is
+    changed through its versions instead.
+    """
+    if timetable.status not in REGENERATABLE_STATUSES:
+        return f"Timetable is {timetable.status} and cannot be regenerated"
+    if TimetableVersionChange.objects.filter(class_schedule__timetable_entries__timetable=timetable).exists():
+        return 'Timetable has saved versions and cannot be regenerated'
+    return None
+
+
+@transaction.atomic
+def persist_solution(problem, solution, created_by, name=None):
+    """
+    Write a solution as a draft Timetable, replacing the entries of an
+    existing draft or rejected timetable for the same department and term.
+    """
+    timetable, created = Timetable.objects.select_for_update().get_or_create(
+        department_id=problem.department_id,
+        academic_year=problem.academic_year,
+        semester=problem.semester,
+        defaults={
+            'name': name or f"Timetable {problem.academic_year} Sem {problem.semester}",
+            'created_by': created_by,
+        },
+    )
+    if not created:
+        blocker = regeneration_blocker(timetable)
+        if blocker:
+            raise ValueError(blocker)
+        ClassSchedule.objects.filter(
+            id__in=TimetableEntry.objects.filter(timetable=timetable).values('class_schedule_id')
+        ).delete()
+        timetable.status = 'draft'
+        if name:
+            timetable.name = name
+
+    schedules = []
+    groups = []
+    for session, slot, room in solution.placements:
+        group, subject_id, faculty = problem.sessions[session]
+        time_slot_id, day, start_time, end_time = problem.slots[slot]
+        schedules.append(ClassSchedule(
+            subject_id=subject_id,
+            faculty_id=problem.faculty[faculty],
+            room_id=problem.rooms[room][0],
+            time_slot_id=time_slot_id,
+            day=day,
+            start_time=start_time,
+            end_time=end_time,
+        ))
+        groups.append(problem.groups[group][0])
+    ClassSchedule.objects.bulk_create(schedules)
+    GroupSchedule.objects.bulk_create([
+        GroupSchedule(group_id=group_id, class_schedule=schedule)
+        for group_id, schedule in zip(groups, schedules)
+    ])
+    TimetableEntry.objects.bulk_create([
+        TimetableEntry(timetable=timetable, group_id=group_id, class_schedule=schedule)
+        for group_id, schedule in zip(groups, schedules)
+    ])
+    schedule_ids = [schedule.pk for schedule in schedules]
+    occupancy.schedules_changed(schedule_ids)
+    room_availability.schedules_changed(schedule_ids)
+    occurrences.schedules_changed(schedule_ids)
+
+    timetable.notes = (
+        f"Generated {len(solution.placements)} of {len(problem.sessions)} sessions "
+        f"(penalty {solution.penalty}, {solution.iterations} passes, {solution.elapsed:.1f}s)."
+    )
+    if solution.unplaced:
+        timetable.notes += f" {len(solution.unplaced)} sessions could not be placed."
+    timetable.save()
+    return timetable
+
+
+def generate_timetable(department, academic_year, semester, created_by, name=None,
+                       curriculum=None, time_limit=None, seed=None):
+    """
+    Build, solve and persist a department timetable
+    """
+    existing = Timetable.objects.filter(
+        department=department, academic_year=academic_year, semester=semester
+    ).first()
+    problem = build_problem(department, academic_year, semester, curriculum, exclude_timetable=existing)
+    solution = solve(problem, time_limit=time_limit, seed=seed)
+    timetable = persist_solution(problem, solution, created_by, name)
+    return timetable, solution
@@ -0,0 +1,199 @@
+"""
+Synthetic campus data for load testing and benchmarks.
+
+generate_campus() creates departments with subjects, rooms, faculty (with
+some FacultyAvailability restrictions), students and student groups, all
+through bulk_create. Every generated row is tagged with a prefix so that
+several campuses can coexist in one database and a synthetic campus can be
+told apart from real data.
+"""
+import datetime
+import random
+from collections import namedtuple
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from accounts.models import User, Department, FacultyProfile, StudentProfile
+from .models import Subject, Room, TimeSlot, StudentGroup, FacultyAvailability
+
+
+CampusSize = namedtuple('CampusSize', [
+    'departments', 'groups', 'students_per_group', 'faculty', 'subjects', 'rooms', 'shared_rooms',
+])
+
+# Per-department counts, except shared_rooms which is campus-wide
+SIZES = {
+    'small': CampusSize(2, 4, 30, 12, 6, 8, 4),
+    'medium': CampusSize(5, 10, 40, 30, 8, 15, 10),
+    'large': CampusSize(10, 24, 60, 60, 10, 30, 20),
+}
+
+PERIODS = [(9, 0), (10, 0), (11, 0), (12, 0), (14, 0), (15, 0), (16, 0), (17, 0)]
+PERIOD_MINUTES = 50
+ROOM_CAPACITIES = [30, 40, 60, 80]
+DESIGNATIONS = ['Professor', 'Associate Professor', 'Assistant Professor', 'Lecturer']
+
+
+def ensure_time_slots():
+    """
+    Create the standard weekly period grid, keeping any existing slots
+    """
+    slots = []
+    for day, _ in TimeSlot.DAY_CHOICES:
+        for hour, minute in PERIODS:
+            start = datetime.datetime.combine(datetime.date.min, datetime.time(hour, minute))
+            end = start + datetime.timedelta(minutes=PERIOD_MINUTES)
+            slots.append(TimeSlot(day=day, start_time=start.time(), end_time=end.time()))
+    TimeSlot.objects.bulk_create(slots, ignore_conflicts=True)
+
+
+def _users(prefix, kind, count, role, password, first_name):
+    return [
+        User(
+            username=f'{prefix}-{kind}{i}',
+            email=f'{prefix}-{kind}{i}@example.com',
+            first_name=first_name,
+            last_name=f'{kind.upper()}{i}',
+            role=role,
+            password=password,
+        )
+        for i in range(count)
+    ]
+
+
+def _availability(rng, faculty):
+    """
+    Restrictions for some faculty: about one in four blocks out one or two
+    half days, and one in ten only teaches within declared windows
+    """
+    rows = []
+    days = [day for day, _ in TimeSlot.DAY_CHOICES]
+    for profile in faculty:
+        roll = rng.random()
+        if roll < 0.25:
+            for day in rng.sample(days, rng.randint(1, 2)):
+                morning = rng.random() < 0.5
+                rows.append(FacultyAvailability(
+                    faculty=profile,
+                    day=day,
+                    start_time=datetime.time(9) if morning else datetime.time(14),
+                    end_time=datetime.time(13) if morning else datetime.time(18),
+                    is_available=False,
+                    reason='Synthetic unavailability',
+                ))
+        elif roll < 0.35:
+            for day in rng.sample(days, 5):
+                rows.append(FacultyAvailability(
+                    faculty=profile, day=day, start_time=datetime.time(9), end_time=datetime.time(18),
+                ))
+    return rows
+
+
+@transaction.atomic
+def generate_campus(size, prefix='syn', seed=None):
+    """
+    Create a synthetic campus of the given CampusSize. Returns the created
+    departments and the number of rows created, keyed by model name.
+    """
+    rng = random.Random(seed)
+    password = make_password(None)
+    ensure_time_slots()
+
+    departments = Department.objects.bulk_create([
+        Department(name=f'{prefix.upper()} Department {d}', code=f'{prefix.upper()[:6]}{d}')
+        for d in range(size.departments)
+    ])
+    rooms = [
+        Room(
+            name=f'{prefix.upper()} Shared {r}',
+            room_number=f'{prefix}-S{r}',
+            room_type='auditorium' if r % 5 == 0 else 'classroom',
+            capacity=rng.choice(ROOM_CAPACITIES[1:]),
+        )
+        for r in range(size.shared_rooms)
+    ]
+    subjects, faculty_users, student_users = [], [], []
+    for d, department in enumerate(departments):
+        rooms.extend(
+            Room(
+                name=f'{department.code} Room {r}',
+                room_number=f'{prefix}-{d}-{r}',
+                room_type='lab' if r % 6 == 5 else 'classroom',
+                capacity=rng.choice(ROOM_CAPACITIES),
+                department=department,
+            )
+            for r in range(size.rooms)
+        )
+        subjects.extend(
+            Subject(
+                name=f'{department.code} Subject {s}',
+                code=f'{prefix}-{d}-{s}',
+                department=department,
+                credits=rng.choice([3, 3, 4]),
+            )
+            for s in range(size.subjects)
+        )
+        faculty_users.extend(_users(f'{prefix}-{d}', 'f', size.faculty, 'faculty', password, 'Faculty'))
+        student_users.extend(_users(
+            f'{prefix}-{d}', 's', size.groups * size.students_per_group, 'student', password, 'Student'
+        ))
+    Room.objects.bulk_create(rooms)
+    Subject.objects.bulk_create(subjects)
+    User.objects.bulk_create(faculty_users + student_users, batch_size=1000)
+
+    faculty = FacultyProfile.objects.bulk_create([
+        FacultyProfile(
+            user=user,
+            employee_id=f'{prefix}-{i}',
+            department=departments[i // size.faculty],
+            designation=rng.choice(DESIGNATIONS),
+            qualification='PhD',
+            experience_years=rng.randint(0, 30),
+        )
+        for i, user in enumerate(faculty_users)
+    ], batch_size=1000)
+    FacultyAvailability.objects.bulk_create(_availability(rng, faculty), batch_size=1000)
+
+    per_department = size.groups * size.students_per_group
+    students = StudentProfile.objects.bulk_create([
+        StudentProfile(
+            user=user,
+            student_id=f'{prefix}-{i}',
+            roll_number=f'{prefix}-R{i}',
+            department=departments[i // per_department],
+            year_of_admission=2024 - (i % per_department) // size.students_per_group % 4,
+            current_year=1 + (i % per_department) // size.students_per_group % 4,
+            gender=rng.choice('MF'),
+            date_of_birth=datetime.date(2003, 1, 1) + datetime.timedelta(days=rng.randint(0, 1500)),
+            address='Synthetic address',
+            emergency_contact='0000000000',
+        )
+        for i, user in enumerate(student_users)
+    ], batch_size=1000)
+
+    groups = StudentGroup.objects.bulk_create([
+        StudentGroup(
+            name=f'{department.code}-{g}',
+            department=department,
+            year=1 + g % 4,
+            section=str(g // 4),
+        )
+        for department in departments
+        for g in range(size.groups)
+    ])
+    Membership = StudentGroup.students.through
+    Membership.objects.bulk_create([
+        Membership(studentgroup_id=group.pk, studentprofile_id=student.pk)
+        for g, group in enumerate(groups)
+        for student in students[g * size.students_per_group:(g + 1) * size.students_per_group]
+    ], batch_size=5000)
+
+    return departments, {
+        'departments': len(departments),
+        'rooms': len(rooms),
+        'subjects': len(subjects),
+        'faculty': len(faculty),
+        'students': len(students),
+        'groups': len(groups),
+    }
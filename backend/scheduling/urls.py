@@ -0,0 +1,25 @@
+from django.urls import path
+from . import views
+
+app_name = 'scheduling'
+
+urlpatterns = [
+    # Rooms
+    path('rooms/free/', views.FreeRoomListView.as_view(), name='free_room_list'),
+
+    # Class calendar
+    path('occurrences/', views.ClassOccurrenceListView.as_view(), name='class_occurrence_list'),
+
+    # Timetable generation jobs
+    path('timetable-jobs/', views.TimetableGenerationJobListCreateView.as_view(), name='timetable_job_list_create'),
+    path('timetable-jobs/<int:pk>/', views.TimetableGenerationJobDetailView.as_view(), name='timetable_job_detail'),
+    path('timetable-jobs/<int:pk>/stop/', views.TimetableGenerationJobStopView.as_view(), name='timetable_job_stop'),
+    path('timetable-jobs/<int:pk>/events/', views.TimetableGenerationJobEventsView.as_view(), name='timetable_job_events'),
+
+    # Timetable versions
+    path('timetables/<int:pk>/versions/', views.TimetableVersionListCreateView.as_view(), name='timetable_version_list_create'),
+    path('timetable-versions/<int:pk>/entries/', views.TimetableVersionEntriesView.as_view(), name='timetable_version_entries'),
+    path('timetable-versions/<int:pk>/clone/', views.TimetableVersionCloneView.as_view(), name='timetable_version_clone'),
+    path('timetable-versions/<int:pk>/diff/<int:other_pk>/', views.TimetableVersionDiffView.as_view(), name='timetable_version_diff'),
+    path('timetable-versions/<int:pk>/publish/', views.TimetableVersionPublishView.as_view(), name='timetable_version_publish'),
+]
@@ -0,0 +1,237 @@
+"""
+Copy-on-write timetable versions.
+
+A TimetableVersion holds only the (group, class_schedule) entries added or
+removed relative to its parent, so cloning a version is a single row no
+matter how large the timetable is. Changes are kept normalised - a version
+only adds entries its parent lacks and only removes entries its parent has -
+which lets two versions be compared by looking at the changes between them
+and their closest common ancestor rather than at their full entry sets.
+TimetableEntry (and GroupSchedule) rows are only written when a version is
+published.
+"""
+from collections import namedtuple
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import occupancy, occurrences, room_availability
+from .models import ClassSchedule, TimetableEntry, GroupSchedule, TimetableVersion, TimetableVersionChange
+
+
+VersionDiff = namedtuple('VersionDiff', ['added', 'removed'])
+
+
+def ancestry(version):
+    """
+    Ids of version and its ancestors, nearest first, read with one
+    recursive query
+    """
+    if version.parent_id is None:
+        return [version.pk]
+    quote = connection.ops.quote_name
+    table = quote(TimetableVersion._meta.db_table)
+    parent = quote(TimetableVersion._meta.get_field('parent').column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"WITH RECURSIVE chain (id, parent_id, depth) AS ("
+            f"SELECT id, {parent}, depth FROM {table} WHERE id = %s "
+            f"UNION ALL SELECT v.id, v.{parent}, v.depth FROM {table} v JOIN chain c ON v.id = c.parent_id"
+            f") SELECT id FROM chain ORDER BY depth DESC",
+            [version.pk],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _net_changes(version_ids):
+    """
+    Compose the changes of a chain of versions into {(group_id,
+    class_schedule_id): 'add' | 'remove'} relative to the chain's base
+    """
+    net = {}
+    changes = TimetableVersionChange.objects.filter(version_id__in=version_ids).order_by('version__depth')
+    for group_id, class_schedule_id, action in changes.values_list('group_id', 'class_schedule_id', 'action'):
+        key = (group_id, class_schedule_id)
+        # With normalised changes an opposite action can only undo an
+        # earlier one on the same chain.
+        if net.get(key, action) != action:
+            del net[key]
+        else:
+            net[key] = action
+    return net
+
+
+def version_entries(version):
+    """
+    The (group_id, class_schedule_id) entries of a version
+    """
+    return {key for key, action in _net_changes(ancestry(version)).items() if action == 'add'}
+
+
+def diff_versions(old, new):
+    """
+    Entries added and removed going from old to new. Costs time
+    proportional to the changes since their closest common ancestor.
+    """
+    old_chain, new_chain = ancestry(old), ancestry(new)
+    common = set(old_chain) & set(new_chain)
+    old_net = _net_changes([pk for pk in old_chain if pk not in common])
+    new_net = _net_changes([pk for pk in new_chain if pk not in common])
+    added, removed = set(), set()
+    for key in old_net.keys() | new_net.keys():
+        before = old_net.get(key)
+        after = new_net.get(key)
+        if before == after:
+            continue
+        # Relative to the common ancestor each side either added the entry,
+        # removed it or left it alone.
+        if after == 'add' or before == 'remove':
+            added.add(key)
+        else:
+            removed.add(key)
+    return VersionDiff(added, removed)
+
+
+def _check_editable(version):
+    if version.status != 'draft':
+        raise ValueError(f"Version is {version.status} and cannot be edited")
+    if version.children.exists():
+        raise ValueError('Version has been cloned and cannot be edited')
+
+
+@transaction.atomic
+def create_root_version(timetable, created_by, name=''):
+    """
+    Start versioning a timetable from its current entries. This copies the
+    entries once; every later version is a clone.
+    """
+    if TimetableVersion.objects.filter(timetable=timetable, parent__isnull=True).exists():
+        raise ValueError('The timetable already has a root version')
+    version = TimetableVersion.objects.create(
+        timetable=timetable, created_by=created_by, name=name or 'Initial'
+    )
+    TimetableVersionChange.objects.bulk_create([
+        TimetableVersionChange(version=version, group_id=group_id, class_schedule_id=class_schedule_id, action='add')
+        for group_id, class_schedule_id in TimetableEntry.objects.filter(timetable=timetable).values_list(
+            'group_id', 'class_schedule_id'
+        )
+    ], batch_size=1000)
+    return version
+
+
+def clone_version(version, created_by, timetable=None, name=''):
+    """
+    New draft version with the same entries as version, optionally for
+    another timetable (e.g. the next semester)
+    """
+    return TimetableVersion.objects.create(
+        timetable=timetable or version.timetable,
+        parent=version,
+        depth=version.depth + 1,
+        name=name,
+        created_by=created_by,
+    )
+
+
+@transaction.atomic
+def edit_version(version, add=(), remove=()):
+    """
+    Add and remove (group_id, class_schedule_id) entries of a draft version
+    """
+    _check_editable(version)
+    add, remove = set(add), set(remove)
+    if add & remove:
+        raise ValueError('An entry cannot be both added and removed')
+    keys = add | remove
+    if not keys:
+        return
+
+    # The nearest change on the chain decides whether the parent has a key
+    chain = ancestry(version)
+    position = {pk: index for index, pk in enumerate(chain)}
+    parent_has, own = {}, {}
+    nearest = {}
+    for version_id, group_id, class_schedule_id, action in TimetableVersionChange.objects.filter(
+        version_id__in=chain, class_schedule_id__in={class_schedule_id for _, class_schedule_id in keys}
+    ).values_list('version_id', 'group_id', 'class_schedule_id', 'action'):
+        key = (group_id, class_schedule_id)
+        if key not in keys:
+            continue
+        if version_id == version.pk:
+            own[key] = action
+        elif key not in nearest or position[version_id] < nearest[key]:
+            nearest[key] = position[version_id]
+            parent_has[key] = action == 'add'
+
+    undo, create = [], []
+    for key in keys:
+        wanted = key in add
+        if parent_has.get(key, False) == wanted:
+            # The parent already agrees: drop any change of our own
+            if key in own:
+                undo.append(key)
+        elif key not in own:
+            create.append(TimetableVersionChange(
+                version=version, group_id=key[0], class_schedule_id=key[1], action='add' if wanted else 'remove'
+            ))
+    for group_id, class_schedule_id in undo:
+        TimetableVersionChange.objects.filter(
+            version=version, group_id=group_id, class_schedule_id=class_schedule_id
+        ).delete()
+    TimetableVersionChange.objects.bulk_create(create, batch_size=1000)
+
+
+@transaction.atomic
+def publish_version(version):
+    """
+    Materialize a version into its timetable's TimetableEntry and
+    GroupSchedule rows, writing only the rows that differ, and mark it as
+    the timetable's published version. Classes no entry refers to any more
+    are deactivated; classes the version brings back are reactivated.
+    """
+    timetable = version.timetable
+    wanted = version_entries(version)
+    current = {
+        (group_id, class_schedule_id): pk
+        for pk, group_id, class_schedule_id in TimetableEntry.objects.filter(timetable=timetable).values_list(
+            'id', 'group_id', 'class_schedule_id'
+        )
+    }
+    added, removed = wanted - current.keys(), current.keys() - wanted
+
+    if removed:
+        TimetableEntry.objects.filter(id__in=[current[key] for key in removed]).delete()
+        class_schedule_ids = {class_schedule_id for _, class_schedule_id in removed}
+        still_used = set(TimetableEntry.objects.filter(class_schedule_id__in=class_schedule_ids).values_list(
+            'group_id', 'class_schedule_id'
+        ))
+        GroupSchedule.objects.filter(id__in=[
+            pk for pk, group_id, class_schedule_id in GroupSchedule.objects.filter(
+                class_schedule_id__in=class_schedule_ids
+            ).values_list('id', 'group_id', 'class_schedule_id')
+            if (group_id, class_schedule_id) in removed and (group_id, class_schedule_id) not in still_used
+        ]).delete()
+        ClassSchedule.objects.filter(id__in=class_schedule_ids - {
+            class_schedule_id for _, class_schedule_id in still_used | added
+        }).update(is_active=False)
+    TimetableEntry.objects.bulk_create([
+        TimetableEntry(timetable=timetable, group_id=group_id, class_schedule_id=class_schedule_id)
+        for group_id, class_schedule_id in added
+    ], batch_size=1000)
+    GroupSchedule.objects.bulk_create([
+        GroupSchedule(group_id=group_id, class_schedule_id=class_schedule_id)
+        for group_id, class_schedule_id in added
+    ], batch_size=1000, ignore_conflicts=True)
+    ClassSchedule.objects.filter(
+        id__in={class_schedule_id for _, class_schedule_id in added}, is_active=False
+    ).update(is_active=True)
+    schedule_ids = {class_schedule_id for _, class_schedule_id in added | removed}
+    occupancy.schedules_changed(schedule_ids)
+    room_availability.schedules_changed(schedule_ids)
+    occurrences.schedules_changed(schedule_ids)
+
+    TimetableVersion.objects.filter(timetable=timetable, status='published').update(status='archived')
+    version.status = 'published'
+    version.published_at = timezone.now()
+    version.save(update_fields=['status', 'published_at'])
+    return VersionDiff(added, removed)
@@ -0,0 +1,239 @@
+import json
+
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from rest_framework import status, renderers
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from accounts.views import IsAdminUser
+from .jobs import start_generation_job, stop_job, job_events
+from .models import ClassOccurrence, Timetable, TimetableGenerationJob, TimetableVersion
+from .room_availability import find_free_rooms
+from .versions import clone_version, create_root_version, diff_versions, edit_version, publish_version
+from .serializers import (
+    RoomSerializer, FreeRoomQuerySerializer, TimetableGenerationJobSerializer,
+    TimetableGenerationStartSerializer, TimetableVersionSerializer, TimetableVersionCreateSerializer,
+    TimetableVersionEditSerializer, ClassOccurrenceSerializer,
+    OccurrenceQuerySerializer
+)
+
+
+class EventStreamRenderer(renderers.BaseRenderer):
+    """
+    Lets views accept text/event-stream requests; errors are sent as a
+    single error event
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return f"event: error\ndata: {json.dumps(data)}\n\n".encode(self.charset)
+
+
+class FreeRoomListView(APIView):
+    """
+    Rooms with no active class in a time range
+    """
+    def get(self, request):
+        serializer = FreeRoomQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        query = serializer.validated_data
+        rooms = find_free_rooms(
+            query['day'],
+            query['start_time'],
+            query['end_time'],
+            min_capacity=query['capacity'],
+            room_type=query.get('room_type'),
+            department=query.get('department'),
+        )
+        return Response(RoomSerializer(rooms, many=True).data)
+
+
+class TimetableGenerationJobListCreateView(APIView):
+    """
+    List generation jobs or start a new one in the background
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        jobs = TimetableGenerationJob.objects.all()[:50]
+        return Response(TimetableGenerationJobSerializer(jobs, many=True).data)
+
+    def post(self, request):
+        serializer = TimetableGenerationStartSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        try:
+            job = start_generation_job(
+                data['department'],
+                data['academic_year'],
+                data['semester'],
+                request.user,
+                time_limit=data.get('time_limit'),
+                name=data['name'],
+            )
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response(TimetableGenerationJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class TimetableGenerationJobDetailView(APIView):
+    """
+    Current state of a generation job
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, pk):
+        job = get_object_or_404(TimetableGenerationJob, pk=pk)
+        return Response(TimetableGenerationJobSerializer(job).data)
+
+
+class TimetableGenerationJobStopView(APIView):
+    """
+    Stop a generation job early, keeping its best timetable so far
+    """
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, pk):
+        job = get_object_or_404(TimetableGenerationJob, pk=pk)
+        if not stop_job(job):
+            return Response({'error': 'Job has already finished.'}, status=status.HTTP_409_CONFLICT)
+        job.refresh_from_db()
+        return Response(TimetableGenerationJobSerializer(job).data)
+
+
+class TimetableGenerationJobEventsView(APIView):
+    """
+    Server-Sent Events stream of a generation job's progress
+    """
+    permission_classes = [IsAdminUser]
+    renderer_classes = [renderers.JSONRenderer, EventStreamRenderer]
+
+    def get(self, request, pk):
+        job = get_object_or_404(TimetableGenerationJob, pk=pk)
+        response = StreamingHttpResponse(job_events(job.pk), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+def _diff_data(diff):
+    return {
+        'added': [{'group': group_id, 'class_schedule': class_schedule_id} for group_id, class_schedule_id in sorted(diff.added)],
+        'removed': [{'group': group_id, 'class_schedule': class_schedule_id} for group_id, class_schedule_id in sorted(diff.removed)],
+    }
+
+
+class TimetableVersionListCreateView(APIView):
+    """
+    List the versions of a timetable, or start versioning it from its
+    current entries
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, pk):
+        timetable = get_object_or_404(Timetable, pk=pk)
+        return Response(TimetableVersionSerializer(timetable.versions.all(), many=True).data)
+
+    def post(self, request, pk):
+        timetable = get_object_or_404(Timetable, pk=pk)
+        serializer = TimetableVersionCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            version = create_root_version(timetable, request.user, name=serializer.validated_data['name'])
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response(TimetableVersionSerializer(version).data, status=status.HTTP_201_CREATED)
+
+
+class TimetableVersionEntriesView(APIView):
+    """
+    Add and remove (group, class_schedule) entries of a draft version
+    """
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, pk):
+        version = get_object_or_404(TimetableVersion, pk=pk)
+        serializer = TimetableVersionEditSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        try:
+            edit_version(
+                version,
+                add=[(entry['group'], entry['class_schedule']) for entry in data['add']],
+                remove=[(entry['group'], entry['class_schedule']) for entry in data['remove']],
+            )
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(TimetableVersionSerializer(version).data)
+
+
+class TimetableVersionCloneView(APIView):
+    """
+    Clone a timetable version into a new draft
+    """
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, pk):
+        version = get_object_or_404(TimetableVersion, pk=pk)
+        clone = clone_version(version, request.user, name=request.data.get('name', ''))
+        return Response(TimetableVersionSerializer(clone).data, status=status.HTTP_201_CREATED)
+
+
+class TimetableVersionDiffView(APIView):
+    """
+    Entries added and removed going from one version to another
+    """
+    def get(self, request, pk, other_pk):
+        version = get_object_or_404(TimetableVersion, pk=pk)
+        other = get_object_or_404(TimetableVersion, pk=other_pk)
+        return Response(_diff_data(diff_versions(version, other)))
+
+
+class TimetableVersionPublishView(APIView):
+    """
+    Publish a version, materializing its entries into the timetable
+    """
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, pk):
+        version = get_object_or_404(TimetableVersion, pk=pk)
+        if version.status == 'published':
+            return Response({'error': 'Version is already published.'}, status=status.HTTP_409_CONFLICT)
+        diff = publish_version(version)
+        data = TimetableVersionSerializer(version).data
+        data['changes'] = _diff_data(diff)
+        return Response(data)
+
+
+class ClassOccurrenceListView(APIView):
+    """
+    Dated class occurrences in a range, for calendar feeds; filter with
+    ?group=, ?faculty= or ?room=
+    """
+    def get(self, request):
+        serializer = OccurrenceQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        occurrences = ClassOccurrence.objects.filter(
+            date__range=(data['start_date'], data['end_date'])
+        ).select_related('class_schedule__subject', 'class_schedule__room')
+        if 'group' in data:
+            occurrences = occurrences.filter(
+                class_schedule__group_schedules__group=data['group'],
+                class_schedule__group_schedules__is_active=True,
+            )
+        if 'faculty' in data:
+            occurrences = occurrences.filter(class_schedule__faculty_id=data['faculty'])
+        if 'room' in data:
+            occurrences = occurrences.filter(class_schedule__room=data['room'])
+        return Response(ClassOccurrenceSerializer(occurrences, many=True).data)